@@ -0,0 +1,414 @@
+"""End-to-end load test of the real FastAPI app with a stub LLM.
+
+Synthetic users sign up, log in, optionally create a custom persona, then
+chat with the default personas from ``app/personas`` (and their own) and
+read history.  The backend runs as a subprocess against a disposable
+Postgres, the stub LLM from ``bench.stub_llm`` and the hash embedder, so a
+run needs neither a Groq key nor the real embedding model:
+
+    uv run python -m bench.loadtest --users 50 --turns 10
+    uv run python -m bench.loadtest --database-url postgresql://u:p@localhost/yf_load
+
+Without ``--database-url`` a throwaway ``postgres`` container is started with
+docker.  ``--server gunicorn`` runs the production launcher
+(``gunicorn.conf.py``, preloaded and forked) instead of ``uvicorn --workers``.
+With ``--workers`` above 1 the backend runs as deployed: a vector service
+behind ``VECTOR_SERVICE_URL``, the Postgres session-lock and rate-limit
+backends, and a temporary ``PROMETHEUS_MULTIPROC_DIR`` so the SQL statement
+counts add up every worker.
+The report (p50/p95/p99, throughput and SQL statements per request for each
+endpoint, plus RSS/PSS/USS of every worker after the run) is printed and
+saved under ``bench/results/``.
+"""
+
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+import argparse
+import asyncio
+import glob
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+import httpx
+from prometheus_client.parser import text_string_to_metric_families
+
+from bench.common import (
+    APP_DIR,
+    RESULTS_DIR,
+    disposable_postgres,
+    existing_database,
+    free_port,
+    git_commit,
+)
+from bench.stub_llm import StubConfig, start_stub_server
+
+
+PHRASES = [
+    "how was your day",
+    "i just got back from work and i'm exhausted",
+    "what should i cook tonight",
+    "tell me something that will cheer me up",
+    "i watched a great movie yesterday",
+    "do you remember what i told you about my sister",
+    "i can't sleep again",
+    "what music are you into lately",
+    "i have an exam tomorrow and i'm nervous",
+    "guess what happened at the gym",
+]
+
+
+@contextmanager
+def app_server(database_url: str, llm_url: str, args):
+    port = free_port()
+    with tempfile.TemporaryDirectory(prefix="yf-vectors-") as vector_dir:
+        env = dict(os.environ)
+        env.update(
+            DATABASE_URL=database_url,
+            LLM_BASE_URL=llm_url,
+            LLM_FALLBACK_MODELS="",
+            EMBEDDING_BACKEND=args.embedding_backend,
+            VECTOR_STORE_DIR=vector_dir,
+            RATE_LIMIT_ENABLED="false",
+        )
+        for key, value in {
+            "POSTGRES_DB": "yf_load",
+            "POSTGRES_USER": "postgres",
+            "POSTGRES_PASSWORD": "loadtest",
+            "SECRET_KEY": uuid.uuid4().hex,
+            "ALGORITHM": "HS256",
+            "ACCESS_TOKEN_EXPIRE_MINUTES": "120",
+            "REFRESH_TOKEN_EXPIRE_DAYS": "1",
+            "GROQ_API_KEY": "stub",
+        }.items():
+            env.setdefault(key, value)
+
+        vector_service = None
+        if args.workers > 1:
+            # What gunicorn.conf.py requires of a multi-worker deployment.
+            socket_path = os.path.join(vector_dir, "vector.sock")
+            vector_service = subprocess.Popen(
+                [
+                    sys.executable, "-m", "uvicorn", "core.vector_service:app",
+                    "--uds", socket_path, "--log-level", "warning",
+                ],
+                cwd=APP_DIR,
+                env=env,
+            )
+            # Without it /metrics answers from whichever worker gets the
+            # scrape, and the SQL-per-request stats cover only that worker.
+            metrics_dir = os.path.join(vector_dir, "metrics")
+            os.mkdir(metrics_dir)
+            env.update(
+                VECTOR_SERVICE_URL=f"unix://{socket_path}",
+                SESSION_LOCK_BACKEND="postgres",
+                RATE_LIMIT_BACKEND="postgres",
+                PROMETHEUS_MULTIPROC_DIR=metrics_dir,
+            )
+
+        if args.server == "gunicorn":
+            env["WEB_CONCURRENCY"] = str(args.workers)
+            command = [
+                sys.executable, "-m", "gunicorn", "main:app",
+                "--bind", f"127.0.0.1:{port}", "--log-level", "warning",
+            ]
+        else:
+            command = [
+                sys.executable, "-m", "uvicorn", "main:app",
+                "--host", "127.0.0.1", "--port", str(port),
+                "--workers", str(args.workers), "--log-level", "warning",
+            ]
+        process = subprocess.Popen(
+            command,
+            cwd=APP_DIR,
+            env=env,
+        )
+        base_url = f"http://127.0.0.1:{port}"
+        try:
+            deadline = time.monotonic() + 180
+            while True:
+                if process.poll() is not None:
+                    raise RuntimeError("Backend exited during startup")
+                try:
+                    if httpx.get(base_url + "/", timeout=1).status_code == 200:
+                        break
+                except httpx.HTTPError:
+                    pass
+                if time.monotonic() > deadline:
+                    raise RuntimeError("Backend did not start in time")
+                time.sleep(0.5)
+            yield base_url, process.pid
+        finally:
+            for server in (process, vector_service):
+                if server is None:
+                    continue
+                server.terminate()
+                try:
+                    server.wait(timeout=15)
+                except subprocess.TimeoutExpired:
+                    server.kill()
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+
+    async def request(self, client, label, method, url, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self.errors[label] = self.errors.get(label, 0) + 1
+            return None
+        self.latencies.setdefault(label, []).append(time.perf_counter() - started)
+        if response.status_code >= 400:
+            self.errors[label] = self.errors.get(label, 0) + 1
+        return response
+
+
+async def synthetic_user(client, index, run_id, personas, args, recorder):
+    rng = random.Random(f"{args.seed}-{index}")
+    await asyncio.sleep(rng.uniform(0, args.ramp_seconds))
+
+    email = f"load_{run_id}_{index}@example.com"
+    await recorder.request(
+        client, "POST /sign-up", "POST", "/sign-up",
+        json={"email": email, "username": f"load_{run_id}_{index}",
+              "password": "loadtest-password", "country": "LT"},
+    )
+    response = await recorder.request(
+        client, "POST /log-in", "POST", "/log-in",
+        data={"username": email, "password": "loadtest-password"},
+    )
+    if response is None or response.status_code != 200:
+        return
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    targets = [{"persona": name} for name in personas]
+    if rng.random() < args.custom_persona_ratio:
+        response = await recorder.request(
+            client, "POST /personas/", "POST", "/personas/", headers=headers,
+            json={
+                "name": f"Buddy {index}",
+                "system_prompt": "You are a relaxed, curious friend who asks follow-up questions.",
+                "example_messages": [
+                    {"input": "hey", "output": "heyy, what's up?"},
+                    {"input": "i'm bored", "output": "same lol, wanna plan something?"},
+                ],
+            },
+        )
+        if response is not None and response.status_code == 201:
+            targets.append({"persona": f"Buddy {index}", "custom_persona_id": response.json()["id"]})
+
+    for turn in range(args.turns):
+        target = rng.choice(targets)
+        params = {}
+        if "custom_persona_id" in target:
+            params["custom_persona_id"] = target["custom_persona_id"]
+        await recorder.request(
+            client, "POST /ai/chat", "POST", "/ai/chat", headers=headers, params=params,
+            json={"message": f"{rng.choice(PHRASES)} ({turn})", "persona": target["persona"]},
+        )
+        if args.history_every and (turn + 1) % args.history_every == 0:
+            params = dict(params) or {"persona": target["persona"]}
+            await recorder.request(
+                client, "GET /ai/history", "GET", "/ai/history", headers=headers, params=params
+            )
+        if args.think_seconds:
+            await asyncio.sleep(rng.expovariate(1 / args.think_seconds))
+
+
+def _db_query_totals(base_url: str) -> dict:
+    """Sum and count of ``db_queries_per_request`` per route from /metrics."""
+    totals = {}
+    text = httpx.get(base_url + "/metrics", timeout=10).text
+    for family in text_string_to_metric_families(text):
+        if family.name != "db_queries_per_request":
+            continue
+        for sample in family.samples:
+            if sample.name.endswith(("_sum", "_count")):
+                label = f"{sample.labels['method']} {sample.labels['route']}"
+                kind = "sum" if sample.name.endswith("_sum") else "count"
+                totals.setdefault(label, {"sum": 0.0, "count": 0.0})[kind] += sample.value
+    return totals
+
+
+def _children(pid: int):
+    children = []
+    for stat in glob.glob("/proc/[0-9]*/stat"):
+        try:
+            with open(stat) as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        if int(fields[1]) == pid:
+            children.append(int(stat.split("/")[2]))
+    return children
+
+
+def worker_memory(server_pid: int) -> list:
+    """RSS, PSS and USS (private) in MiB of each worker process (Linux only).
+
+    RSS counts pages shared copy-on-write in every worker; PSS splits them
+    between the processes sharing them, so PSS summed over workers is what
+    they really cost.
+    """
+    workers = []
+    for pid in _children(server_pid) or [server_pid]:  # one uvicorn worker has no children
+        try:
+            with open(f"/proc/{pid}/cmdline", "rb") as f:
+                if b"resource_tracker" in f.read():
+                    continue
+            with open(f"/proc/{pid}/smaps_rollup") as f:
+                kb = {
+                    line.split(":")[0]: int(line.split()[1])
+                    for line in f
+                    if line.split(":")[0] in ("Rss", "Pss", "Private_Clean", "Private_Dirty")
+                }
+        except (OSError, ValueError):
+            continue
+        workers.append(
+            {
+                "pid": pid,
+                "rss_mib": round(kb["Rss"] / 1024, 1),
+                "pss_mib": round(kb["Pss"] / 1024, 1),
+                "uss_mib": round((kb["Private_Clean"] + kb["Private_Dirty"]) / 1024, 1),
+            }
+        )
+    return workers
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def summarize(recorder, wall_seconds, before, after):
+    endpoints = {}
+    for label in sorted(set(recorder.latencies) | set(recorder.errors)):
+        values = sorted(recorder.latencies.get(label, []))
+        queries = after.get(label, {"sum": 0, "count": 0})
+        previous = before.get(label, {"sum": 0, "count": 0})
+        count = queries["count"] - previous["count"]
+        endpoints[label] = {
+            "requests": len(values),
+            "errors": recorder.errors.get(label, 0),
+            "throughput_rps": round(len(values) / wall_seconds, 2),
+            "p50_ms": round(1000 * _percentile(values, 0.50), 1) if values else None,
+            "p95_ms": round(1000 * _percentile(values, 0.95), 1) if values else None,
+            "p99_ms": round(1000 * _percentile(values, 0.99), 1) if values else None,
+            "db_queries_per_request": (
+                round((queries["sum"] - previous["sum"]) / count, 2) if count else None
+            ),
+        }
+    return endpoints
+
+
+def print_report(endpoints, wall_seconds):
+    header = f"{'endpoint':<20}{'reqs':>7}{'errs':>6}{'rps':>8}{'p50':>9}{'p95':>9}{'p99':>9}{'sql/req':>9}"
+    print(header)
+    print("-" * len(header))
+    for label, row in endpoints.items():
+        print(
+            f"{label:<20}{row['requests']:>7}{row['errors']:>6}{row['throughput_rps']:>8}"
+            f"{row['p50_ms'] or '-':>9}{row['p95_ms'] or '-':>9}{row['p99_ms'] or '-':>9}"
+            f"{row['db_queries_per_request'] or '-':>9}"
+        )
+    print(f"\nwall time: {wall_seconds:.1f}s (latencies in ms)")
+
+
+def print_memory(workers):
+    for row in workers:
+        print(
+            f"worker {row['pid']}: rss {row['rss_mib']} MiB, "
+            f"pss {row['pss_mib']} MiB, uss {row['uss_mib']} MiB"
+        )
+    if workers:
+        print(f"total pss: {sum(row['pss_mib'] for row in workers):.1f} MiB")
+
+
+async def drive(base_url, personas, args):
+    run_id = uuid.uuid4().hex[:6]
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=args.users, max_keepalive_connections=args.users)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+        started = time.perf_counter()
+        await asyncio.gather(
+            *(synthetic_user(client, i, run_id, personas, args, recorder) for i in range(args.users))
+        )
+        return recorder, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=10, help="chat turns per user")
+    parser.add_argument("--history-every", type=int, default=3, help="GET history every N turns")
+    parser.add_argument("--custom-persona-ratio", type=float, default=0.3)
+    parser.add_argument("--think-seconds", type=float, default=0.0)
+    parser.add_argument("--ramp-seconds", type=float, default=2.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--server", choices=["uvicorn", "gunicorn"], default="uvicorn")
+    parser.add_argument("--database-url", help="disposable database (it will be written to)")
+    parser.add_argument("--postgres-image", default="postgres:17.0-alpine")
+    parser.add_argument("--embedding-backend", default="hash")
+    parser.add_argument("--llm-latency-ms", type=float, default=400.0)
+    parser.add_argument("--llm-jitter-ms", type=float, default=100.0)
+    parser.add_argument("--llm-tokens-per-second", type=float, default=0.0)
+    parser.add_argument("--llm-reply-tokens", type=int, default=40)
+    parser.add_argument("--output", type=Path, help="JSON report path")
+    args = parser.parse_args()
+
+    personas = sorted(
+        json.load(open(path, encoding="utf-8"))["persona"]
+        for path in glob.glob(str(APP_DIR / "personas" / "*.json"))
+    )
+    stub, llm_url = start_stub_server(
+        config=StubConfig(
+            latency_ms=args.llm_latency_ms,
+            jitter_ms=args.llm_jitter_ms,
+            tokens_per_second=args.llm_tokens_per_second,
+            reply_tokens=args.llm_reply_tokens,
+        )
+    )
+
+    database = (
+        existing_database(args.database_url) if args.database_url else disposable_postgres(args.postgres_image)
+    )
+    with database as database_url, app_server(database_url, llm_url, args) as (base_url, pid):
+        before = _db_query_totals(base_url)
+        recorder, wall_seconds = asyncio.run(drive(base_url, personas, args))
+        after = _db_query_totals(base_url)
+        workers = worker_memory(pid)
+    stub.shutdown()
+
+    endpoints = summarize(recorder, wall_seconds, before, after)
+    print_report(endpoints, wall_seconds)
+    print_memory(workers)
+
+    report = {
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "git_commit": git_commit(),
+        "config": {k: str(v) if isinstance(v, Path) else v for k, v in vars(args).items()
+                   if k != "database_url"},
+        "wall_seconds": round(wall_seconds, 2),
+        "endpoints": endpoints,
+        "workers": workers,
+    }
+    output = args.output or RESULTS_DIR / f"loadtest-{datetime.now():%Y%m%d-%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"report written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+"""Micro-benchmarks for the chat paths whose cost grows with data size.
+
+Covers ``DBChatMessageHistory.messages`` and ``clear()``,
+``AIChatSession._search_relevant_messages``, ``_embed_and_store`` and
+``get_history`` at increasing numbers of stored messages, using synthetic
+data, the hash embedder and a temporary vector store (no Groq, no network):
+
+    uv run python -m bench.microbench --database-url postgresql://u:p@localhost/yf_bench
+    uv run python -m bench.microbench --sizes 100,10000 --baseline bench/results/microbench-X.json
+
+Without ``--database-url`` a throwaway postgres container is started with
+docker.  Results are saved under ``bench/results/`` and compared against the
+previous run (or ``--baseline``) so regressions in O(all messages) paths show
+up as a slowdown of the larger sizes.
+"""
+
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+import argparse
+import glob
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from bench.common import (
+    APP_DIR,
+    RESULTS_DIR,
+    disposable_postgres,
+    existing_database,
+    git_commit,
+)
+
+WORDS = (
+    "morning coffee work gym movie sister music exam tired happy weekend trip "
+    "dinner rain friend call game book sleep walk city beach birthday dog"
+).split()
+
+
+def synthetic_messages(user_id, ai_user_id, session_id, count, start, seed=0):
+    """Alternating user/AI rows, one second apart, as dicts for a bulk insert."""
+    rows = []
+    for i in range(count):
+        is_ai = i % 2 == 1
+        words = [WORDS[(seed + i * 7 + k * 13) % len(WORDS)] for k in range(6 + i % 9)]
+        rows.append(
+            {
+                "sender_id": ai_user_id if is_ai else user_id,
+                "receiver_id": user_id if is_ai else ai_user_id,
+                "content": " ".join(words),
+                "is_ai": is_ai,
+                "timestamp": start + timedelta(seconds=i),
+                "meta_data": {"session_id": session_id},
+            }
+        )
+    return rows
+
+
+def measure(fn, repeat, setup=None):
+    samples = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    samples.sort()
+    return {
+        "repeat": repeat,
+        "min_ms": round(1000 * samples[0], 3),
+        "median_ms": round(1000 * statistics.median(samples), 3),
+        "p95_ms": round(1000 * samples[min(len(samples) - 1, int(0.95 * len(samples)))], 3),
+    }
+
+
+def run_benchmarks(args):
+    # Settings are read at import time, so configure the environment first.
+    os.environ.setdefault("EMBEDDING_BACKEND", args.embedding_backend)
+    os.environ["VECTOR_STORE_DIR"] = args.vector_store_dir
+    os.environ["DATABASE_URL"] = args.database_url
+    for key, value in {
+        "POSTGRES_DB": "yf_bench",
+        "POSTGRES_USER": "postgres",
+        "POSTGRES_PASSWORD": "bench",
+        "SECRET_KEY": "bench",
+        "ALGORITHM": "HS256",
+        "ACCESS_TOKEN_EXPIRE_MINUTES": "60",
+        "REFRESH_TOKEN_EXPIRE_DAYS": "1",
+        "GROQ_API_KEY": "stub",
+    }.items():
+        os.environ.setdefault(key, value)
+    os.chdir(APP_DIR)
+    sys.path.insert(0, str(APP_DIR))
+
+    from sqlalchemy import insert
+    from core.database import SessionLocal, init_db
+    from core.history import get_session_history
+    from core import ai_chat
+    from models import models
+
+    init_db()
+    db = SessionLocal()
+    results = {}
+
+    def new_user(label):
+        user = models.User(
+            username=f"bench_{label}_{time.time_ns()}",
+            email=f"bench_{label}_{time.time_ns()}@example.com",
+            password="",
+        )
+        db.add(user)
+        db.commit()
+        return user.id
+
+    def bulk_insert(rows):
+        for i in range(0, len(rows), 10_000):
+            db.execute(insert(models.Message), rows[i : i + 10_000])
+        db.commit()
+
+    session = ai_chat.AIChatSession(db=db, session_id="bench_probe", user_id=new_user("probe"))
+    ai_user_id = session.ai_user.id
+    start = datetime(2024, 1, 1)
+
+    for size in args.sizes:
+        repeat = max(3, min(args.repeat, int(args.repeat * 1000 / size) or 3))
+        user_id = new_user(size)
+        session_id = f"{user_id}_Alice"
+        # 10% of the user's rows belong to another persona, as in real accounts.
+        bulk_insert(synthetic_messages(user_id, ai_user_id, session_id, size, start))
+        bulk_insert(
+            synthetic_messages(user_id, ai_user_id, f"{user_id}_Ethan", size // 10, start, seed=3)
+        )
+
+        history = get_session_history(session_id, db, user_id, ai_user_id)
+        results[f"history.messages[n={size}]"] = measure(lambda: history.messages, repeat)
+
+        chat = ai_chat.AIChatSession(db=db, session_id=session_id, user_id=user_id)
+        results[f"get_history[n={size}]"] = measure(lambda: chat.get_history(), repeat)
+
+        clear_user = new_user(f"clear{size}")
+        clear_session = f"{clear_user}_Alice"
+        clear_history = get_session_history(clear_session, db, clear_user, ai_user_id)
+        results[f"history.clear[n={size}]"] = measure(
+            clear_history.clear,
+            max(1, repeat // 3),
+            setup=lambda: bulk_insert(
+                synthetic_messages(clear_user, ai_user_id, clear_session, size, start)
+            ),
+        )
+
+    # Vector memory: grow one collection and query a fixed-size session in it.
+    probe_user = new_user("vectors")
+    probe = ai_chat.AIChatSession(db=db, session_id=f"{probe_user}_Alice", user_id=probe_user)
+    stored = 0
+    for size in args.sizes:
+        batch_ids, batch_docs, batch_metas = [], [], []
+        for i in range(stored, size):
+            session_id = probe.session_id if i % 10 == 0 else f"{probe_user}_other_{i % 50}"
+            batch_ids.append(f"bench-{i}")
+            batch_docs.append(" ".join(WORDS[(i * k) % len(WORDS)] for k in range(1, 9)))
+            batch_metas.append(
+                {"role": "user", "session_id": session_id, "persona": "Alice", "user_id": probe_user}
+            )
+        for i in range(0, len(batch_ids), 1000):
+            ai_chat.get_collection().add(
+                ids=batch_ids[i : i + 1000],
+                documents=batch_docs[i : i + 1000],
+                embeddings=ai_chat.encode(batch_docs[i : i + 1000]),
+                metadatas=batch_metas[i : i + 1000],
+            )
+        stored = size
+
+        results[f"search_relevant_messages[collection={size}]"] = measure(
+            lambda: probe._search_relevant_messages("how was the gym this morning"), args.repeat
+        )
+        counter = iter(range(10**9))
+        results[f"embed_and_store[collection={size}]"] = measure(
+            lambda: probe._embed_and_store(
+                f"bench-extra-{size}-{next(counter)}",
+                "had coffee with my sister before work",
+                {"role": "user", "session_id": probe.session_id, "persona": "Alice"},
+            ),
+            args.repeat,
+        )
+
+    db.close()
+    return results
+
+
+def latest_result(exclude: Path):
+    candidates = sorted(
+        p for p in glob.glob(str(RESULTS_DIR / "microbench-*.json")) if Path(p) != exclude
+    )
+    return Path(candidates[-1]) if candidates else None
+
+
+def compare(results, baseline_path, threshold):
+    baseline = json.loads(baseline_path.read_text())["results"]
+    regressions = []
+    print(f"\ncompared with {baseline_path.name} (median, regression threshold {threshold:.0%})")
+    for name, row in results.items():
+        before = baseline.get(name)
+        if not before:
+            continue
+        change = row["median_ms"] / before["median_ms"] - 1 if before["median_ms"] else 0
+        flag = "REGRESSION" if change > threshold else ""
+        if flag:
+            regressions.append(name)
+        print(f"{name:<48}{before['median_ms']:>12}{row['median_ms']:>12}{change:>+9.0%}  {flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="100,10000,100000")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--database-url", help="disposable database (it will be written to)")
+    parser.add_argument("--postgres-image", default="postgres:17.0-alpine")
+    parser.add_argument("--embedding-backend", default="hash")
+    parser.add_argument("--baseline", type=Path, help="result file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    parser.add_argument("--fail-on-regression", action="store_true")
+    parser.add_argument("--output", type=Path)
+    args = parser.parse_args()
+    args.sizes = sorted(int(s) for s in args.sizes.split(","))
+
+    database = (
+        existing_database(args.database_url)
+        if args.database_url
+        else disposable_postgres(args.postgres_image)
+    )
+    with database as database_url, tempfile.TemporaryDirectory() as vector_dir:
+        args.database_url = database_url
+        args.vector_store_dir = vector_dir
+        results = run_benchmarks(args)
+
+    print(f"{'benchmark':<48}{'min ms':>12}{'median ms':>12}{'p95 ms':>12}")
+    for name, row in results.items():
+        print(f"{name:<48}{row['min_ms']:>12}{row['median_ms']:>12}{row['p95_ms']:>12}")
+
+    output = args.output or RESULTS_DIR / f"microbench-{datetime.now():%Y%m%d-%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(
+        json.dumps(
+            {
+                "started_at": datetime.now(timezone.utc).isoformat(),
+                "git_commit": git_commit(),
+                "config": {
+                    "sizes": args.sizes,
+                    "repeat": args.repeat,
+                    "embedding_backend": args.embedding_backend,
+                },
+                "results": results,
+            },
+            indent=2,
+        )
+    )
+    print(f"results written to {output}")
+
+    baseline = args.baseline or latest_result(exclude=output)
+    if baseline:
+        regressions = compare(results, baseline, args.threshold)
+        if regressions and args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""CPU time and bytes on the wire of the read-heavy JSON responses.
+
+Compares, for ``/ai/history`` pages and custom persona payloads of growing
+size, the stock FastAPI path (``response_model`` validation of the returned
+object, then ``json.dumps``) with ``core.responses.FastJSONResponse``, and
+reports the body size before and after the gzip applied by
+``core.compression`` (``COMPRESS_LEVEL``).  No database or network needed:
+
+    uv run python -m bench.serialization
+    uv run python -m bench.serialization --sizes 20,1000 --repeat 200
+
+Times include building the response model from what the endpoint has
+(history dicts, ORM-like persona rows).  Results are saved under
+``bench/results/``.
+"""
+
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from types import SimpleNamespace
+from typing import List
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import sys
+import time
+
+from bench.common import APP_DIR, RESULTS_DIR, git_commit
+from bench.microbench import WORDS, measure, synthetic_messages
+
+
+def history_rows(count: int) -> List[dict]:
+    """What ``AIChatSession.get_history`` returns for a session of ``count`` messages."""
+    start = datetime(2025, 1, 1)
+    return [
+        {
+            "id": str(i + 1),
+            "from": "AI" if row["is_ai"] else "bench_user",
+            "content": row["content"],
+            "timestamp": row["timestamp"].isoformat(),
+        }
+        for i, row in enumerate(synthetic_messages(1, 2, "1_Alice", count, start))
+    ]
+
+
+def persona_row(examples: int) -> SimpleNamespace:
+    """A custom persona as loaded from the database, with ``examples`` example pairs."""
+    with open(APP_DIR / "personas" / "alice.json", encoding="utf-8") as f:
+        alice = json.load(f)
+    pool = alice.get("example_message") or [{"input": "hi", "output": "hello"}]
+    now = datetime(2025, 1, 1)
+    return SimpleNamespace(
+        id=1,
+        user_id=1,
+        name="Bench Alice",
+        system_prompt=alice["system"],
+        example_messages=[
+            {
+                "input": f"{pool[i % len(pool)]['input']} {WORDS[i % len(WORDS)]}",
+                "output": pool[i % len(pool)]["output"],
+            }
+            for i in range(examples)
+        ],
+        avatar_url=None,
+        description="A persona for the serialization benchmark",
+        is_active=True,
+        created_at=now,
+        updated_at=now + timedelta(minutes=examples),
+    )
+
+
+def run_benchmarks(args):
+    os.chdir(APP_DIR)
+    sys.path.insert(0, str(APP_DIR))
+
+    from fastapi.responses import JSONResponse
+    from fastapi.routing import serialize_response
+    from fastapi.utils import create_model_field
+    from pydantic import BaseModel
+
+    from core.responses import FastJSONResponse
+    from schemas.persona_schemas import PersonaListResponse, PersonaResponse
+    from schemas.query_schemas import HistoryQuery
+
+    class UntypedHistoryQuery(BaseModel):  # HistoryQuery before its items were typed
+        persona: str
+        session_id: str
+        history: List[dict]
+
+    loop = asyncio.new_event_loop()
+
+    def fastapi_body(model, content) -> bytes:
+        """What FastAPI does with an endpoint's return value and ``response_model``."""
+        field = fields.setdefault(model, create_model_field("Response", model, mode="serialization"))
+        data = loop.run_until_complete(serialize_response(field=field, response_content=content))
+        return JSONResponse(data).body
+
+    fields = {}
+    cases = {}
+    for size in args.sizes:
+        rows = history_rows(size)
+        cases[f"history[n={size}]"] = (
+            lambda rows=rows: fastapi_body(
+                UntypedHistoryQuery,
+                UntypedHistoryQuery(persona="Alice", session_id="1_Alice", history=rows),
+            ),
+            lambda rows=rows: FastJSONResponse(
+                HistoryQuery(persona="Alice", session_id="1_Alice", history=rows)
+            ).body,
+        )
+    for examples in args.persona_examples:
+        persona = persona_row(examples)
+        cases[f"persona[examples={examples}]"] = (
+            lambda persona=persona: fastapi_body(PersonaResponse, persona),
+            lambda persona=persona: FastJSONResponse(PersonaResponse.model_validate(persona)).body,
+        )
+    for size in args.sizes:
+        personas = [
+            SimpleNamespace(**{**vars(persona_row(0)), "id": i, "name": f"Persona {i}"})
+            for i in range(size)
+        ]
+        cases[f"persona_list[n={size}]"] = (
+            lambda personas=personas: fastapi_body(
+                PersonaListResponse, {"personas": personas, "total": len(personas)}
+            ),
+            lambda personas=personas: FastJSONResponse(
+                PersonaListResponse(personas=personas, total=len(personas))
+            ).body,
+        )
+
+    results = {}
+    for name, (before, after) in cases.items():
+        body = after()
+        compressed = gzip.compress(body, compresslevel=args.compress_level, mtime=0)
+        results[name] = {
+            "fastapi": measure(before, args.repeat),
+            "fast_json": measure(after, args.repeat),
+            "gzip": measure(
+                lambda body=body: gzip.compress(body, compresslevel=args.compress_level, mtime=0),
+                args.repeat,
+            ),
+            "bytes": len(body),
+            "gzip_bytes": len(compressed),
+        }
+    loop.close()
+    return results
+
+
+def print_results(results):
+    print(
+        f"{'payload':<28}{'fastapi ms':>12}{'fast ms':>10}{'speedup':>9}"
+        f"{'gzip ms':>10}{'bytes':>10}{'gzipped':>10}{'ratio':>8}"
+    )
+    for name, row in results.items():
+        before, after = row["fastapi"]["median_ms"], row["fast_json"]["median_ms"]
+        print(
+            f"{name:<28}{before:>12}{after:>10}{before / max(after, 1e-9):>8.1f}x"
+            f"{row['gzip']['median_ms']:>10}{row['bytes']:>10}{row['gzip_bytes']:>10}"
+            f"{row['bytes'] / row['gzip_bytes']:>7.1f}x"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="20,200,1000", help="history and persona list lengths")
+    parser.add_argument("--persona-examples", default="5,20")
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--compress-level", type=int, default=6)
+    parser.add_argument("--output", type=Path)
+    args = parser.parse_args()
+    args.sizes = [int(s) for s in args.sizes.split(",")]
+    args.persona_examples = [int(s) for s in args.persona_examples.split(",")]
+
+    started = time.perf_counter()
+    results = run_benchmarks(args)
+    print_results(results)
+
+    output = args.output or RESULTS_DIR / f"serialization-{datetime.now():%Y%m%d-%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(
+        json.dumps(
+            {
+                "started_at": datetime.now(timezone.utc).isoformat(),
+                "git_commit": git_commit(),
+                "config": {
+                    "sizes": args.sizes,
+                    "persona_examples": args.persona_examples,
+                    "repeat": args.repeat,
+                    "compress_level": args.compress_level,
+                },
+                "wall_seconds": round(time.perf_counter() - started, 1),
+                "results": results,
+            },
+            indent=2,
+        )
+    )
+    print(f"results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""Local stand-in for the Groq/OpenAI chat completions API.
+
+Point the backend at it with ``LLM_BASE_URL=http://127.0.0.1:9100/v1`` to
+exercise timeouts, retries, hedging and fallbacks without a real API key:
+
+    python -m bench.stub_llm --port 9100 --latency-ms 400 --tokens-per-second 250
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+
+
+class StubConfig:
+    def __init__(
+        self,
+        latency_ms: float = 300.0,
+        jitter_ms: float = 100.0,
+        tokens_per_second: float = 0.0,
+        reply_tokens: int = 40,
+        failure_rate: float = 0.0,
+        failure_status: int = 503,
+        failing_models: tuple = (),
+    ):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.tokens_per_second = tokens_per_second
+        self.reply_tokens = reply_tokens
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+        self.failing_models = set(failing_models)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    config: StubConfig = StubConfig()
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            return self._send(404, {"error": {"message": "not found"}})
+
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        model = body.get("model", "stub")
+        config = self.config
+
+        delay = config.latency_ms + random.uniform(-config.jitter_ms, config.jitter_ms)
+        if config.tokens_per_second > 0:
+            delay += 1000 * config.reply_tokens / config.tokens_per_second
+        time.sleep(max(0.0, delay) / 1000)
+
+        if model in config.failing_models or random.random() < config.failure_rate:
+            return self._send(
+                config.failure_status,
+                {"error": {"message": "stub failure"}},
+                {"Retry-After": "1"},
+            )
+
+        messages = body.get("messages", [])
+        prompt_tokens = sum(len(str(m.get("content", "")).split()) for m in messages)
+        last_user = next(
+            (m["content"] for m in reversed(messages) if m.get("role") == "user"), ""
+        )
+        words = ["stub"] * config.reply_tokens
+        words[: min(8, len(words))] = f"you said: {last_user}".split()[:8]
+        self._send(
+            200,
+            {
+                "id": f"chatcmpl-{uuid.uuid4().hex}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": " ".join(words)},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": config.reply_tokens,
+                    "total_tokens": prompt_tokens + config.reply_tokens,
+                },
+            },
+        )
+
+    def _send(self, status: int, payload: dict, headers: dict = None):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def start_stub_server(host: str = "127.0.0.1", port: int = 0, config: StubConfig = None):
+    """Start the stub in a daemon thread; returns (server, base_url)."""
+    handler = type("StubHandler", (_Handler,), {"config": config or StubConfig()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency-ms", type=float, default=300.0)
+    parser.add_argument("--jitter-ms", type=float, default=100.0)
+    parser.add_argument("--tokens-per-second", type=float, default=0.0)
+    parser.add_argument("--reply-tokens", type=int, default=40)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--failure-status", type=int, default=503)
+    parser.add_argument("--failing-model", action="append", default=[])
+    args = parser.parse_args()
+
+    config = StubConfig(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        tokens_per_second=args.tokens_per_second,
+        reply_tokens=args.reply_tokens,
+        failure_rate=args.failure_rate,
+        failure_status=args.failure_status,
+        failing_models=tuple(args.failing_model),
+    )
+    server, base_url = start_stub_server(args.host, args.port, config)
+    print(f"Stub LLM listening on {base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
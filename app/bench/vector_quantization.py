@@ -0,0 +1,222 @@
+"""Size and recall of float16 / int8 chat memory against float32 Chroma.
+
+Reads up to ``--limit`` messages from the configured database (read only),
+embeds them with the configured embedder and stores the same vectors in a
+temporary Chroma collection and in ``QuantizedCollection`` files.  For up to
+``--queries`` user messages it searches the message's own session, as
+``_search_relevant_messages`` does, and compares each store's top ``--k``
+with the exact float32 result:
+
+    uv run python -m bench.vector_quantization --limit 50000 --k 3
+    uv run python -m bench.vector_quantization --rerank-factors 1,2,4,8
+
+Results are saved under ``bench/results/``.
+"""
+
+from datetime import datetime, timezone
+from pathlib import Path
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from bench.common import APP_DIR, RESULTS_DIR, git_commit
+
+
+def _dir_size(path: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(path)
+        for name in names
+    )
+
+
+def load_messages(limit: int):
+    from sqlalchemy import select
+    from core.database import SessionLocal
+    from core.vector_store import message_metadata
+    from models import models
+
+    with SessionLocal() as db:
+        rows = db.execute(
+            select(
+                models.Message.id,
+                models.Message.sender_id,
+                models.Message.receiver_id,
+                models.Message.is_ai,
+                models.Message.content,
+                models.Message.timestamp,
+                models.Message.meta_data["session_id"].as_string(),
+            )
+            .where(models.Message.meta_data["session_id"].as_string().is_not(None))
+            .order_by(models.Message.id.desc())
+            .limit(limit)
+        ).all()
+    return [
+        (
+            str(message_id),
+            content,
+            message_metadata(session_id, is_ai, receiver_id if is_ai else sender_id, timestamp),
+        )
+        for message_id, sender_id, receiver_id, is_ai, content, timestamp, session_id in rows
+        if content
+    ]
+
+
+def run(args):
+    os.chdir(APP_DIR)
+    sys.path.insert(0, str(APP_DIR))
+    from core.config import settings
+    from core.embeddings import encode
+    from core.quantized_store import QuantizedCollection
+    import chromadb
+
+    messages = load_messages(args.limit)
+    if not messages:
+        sys.exit("no messages with a session_id in the database")
+    ids = [m[0] for m in messages]
+    documents = [m[1] for m in messages]
+    metadatas = [m[2] for m in messages]
+    print(f"embedding {len(messages)} messages", file=sys.stderr)
+    vectors = np.concatenate(
+        [
+            np.asarray(encode(documents[i : i + 512]), dtype=np.float32)
+            for i in range(0, len(documents), 512)
+        ]
+    )
+    dimension = vectors.shape[1]
+
+    sessions = {}
+    for row, meta in enumerate(metadatas):
+        sessions.setdefault(meta["session_id"], []).append(row)
+    candidates = [
+        row for row, meta in enumerate(metadatas)
+        if meta["role"] == "user" and len(sessions[meta["session_id"]]) > args.k
+    ]
+    random.Random(0).shuffle(candidates)
+    queries = candidates[: args.queries]
+
+    # A result counts as a hit when it is as close as the exact k-th neighbour,
+    # so ties between identical messages don't count as misses.
+    position = {message_id: row for row, message_id in enumerate(ids)}
+
+    def distance(a, b):
+        return float(((vectors[a] - vectors[b]) ** 2).sum())
+
+    kth = {}
+    for row in queries:
+        others = [r for r in sessions[metadatas[row]["session_id"]] if r != row]
+        kth[row] = sorted(distance(row, r) for r in others)[args.k - 1]
+
+    def recall(collection):
+        hits, started = 0, time.perf_counter()
+        for row in queries:
+            result = collection.query(
+                query_embeddings=[vectors[row]],
+                n_results=args.k + 1,
+                where={"session_id": metadatas[row]["session_id"]},
+                include=["documents", "metadatas"],
+            )
+            found = [i for i in result["ids"][0] if i != ids[row]][: args.k]
+            hits += sum(distance(row, position[i]) <= kth[row] + 1e-6 for i in found)
+        elapsed = time.perf_counter() - started
+        return hits / max(1, len(queries) * args.k), 1000 * elapsed / max(1, len(queries))
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        if not args.skip_chroma:
+            chroma_dir = os.path.join(directory, "chroma")
+            collection = chromadb.PersistentClient(path=chroma_dir).get_or_create_collection("bench")
+            for i in range(0, len(ids), 5000):
+                collection.add(
+                    ids=ids[i : i + 5000],
+                    documents=documents[i : i + 5000],
+                    embeddings=vectors[i : i + 5000],
+                    metadatas=metadatas[i : i + 5000],
+                )
+            value, latency = recall(collection)
+            results["chroma float32"] = {
+                "vector_bytes": 4 * dimension,
+                "disk_bytes_per_message": _dir_size(chroma_dir) / len(ids),
+                "recall": value,
+                "query_ms": latency,
+            }
+
+        for dtype in ("float16", "int8"):
+            path = os.path.join(directory, f"bench.{dtype}.sqlite3")
+            collection = QuantizedCollection(path, "bench", dtype)
+            for i in range(0, len(ids), 5000):
+                collection.add(
+                    ids=ids[i : i + 5000],
+                    documents=documents[i : i + 5000],
+                    embeddings=vectors[i : i + 5000],
+                    metadatas=metadatas[i : i + 5000],
+                )
+            with sqlite3.connect(path) as conn:
+                conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            disk = sum(
+                os.path.getsize(path + suffix)
+                for suffix in ("", "-wal")
+                if os.path.exists(path + suffix)
+            )
+            factors = args.rerank_factors if dtype == "int8" else [1]
+            for factor in factors:
+                settings.vector_rerank_factor = factor
+                value, latency = recall(collection)
+                name = f"{dtype}" + (f" asymmetric x{factor}" if dtype == "int8" else "")
+                results[name] = {
+                    "vector_bytes": (2 * dimension + 4) if dtype == "float16" else (dimension + 8),
+                    "disk_bytes_per_message": disk / len(ids),
+                    "recall": value,
+                    "query_ms": latency,
+                }
+    return results, {"messages": len(ids), "queries": len(queries), "dimension": dimension}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--limit", type=int, default=50000, help="most recent messages to use")
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--rerank-factors", default="1,4")
+    parser.add_argument("--skip-chroma", action="store_true")
+    parser.add_argument("--output", type=Path)
+    args = parser.parse_args()
+    args.rerank_factors = [int(f) for f in args.rerank_factors.split(",")]
+
+    results, data = run(args)
+    print(
+        f"{data['messages']} messages, {data['queries']} queries, "
+        f"dimension {data['dimension']}, k={args.k}"
+    )
+    print(f"{'store':<22}{'vector B':>10}{'disk B/msg':>12}{'recall':>9}{'query ms':>10}")
+    for name, row in results.items():
+        print(
+            f"{name:<22}{row['vector_bytes']:>10}{row['disk_bytes_per_message']:>12.0f}"
+            f"{row['recall']:>9.3f}{row['query_ms']:>10.2f}"
+        )
+
+    output = args.output or RESULTS_DIR / f"quantization-{datetime.now():%Y%m%d-%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(
+        json.dumps(
+            {
+                "started_at": datetime.now(timezone.utc).isoformat(),
+                "git_commit": git_commit(),
+                "config": {"k": args.k, "limit": args.limit, **data},
+                "results": results,
+            },
+            indent=2,
+        )
+    )
+    print(f"results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,49 @@
 from datetime import datetime
 from pydantic import BaseModel
-from sentence_transformers import SentenceTransformer
 from langchain_core.prompts import ChatPromptTemplate, FewShotChatMessagePromptTemplate
 from langchain_core.output_parsers import StrOutputParser
+from langchain_core.runnables import RunnableLambda
 from langchain_core.runnables.history import RunnableWithMessageHistory
-from langchain_groq import ChatGroq
 from sqlalchemy.orm import Session
 from sqlalchemy import and_
 from models import models
+from .archive import read_archived_messages
 from .config import settings
-from .history import get_session_history
-import json, os
-import chromadb
+from .embeddings import encode
+from .few_shot import SimilarExampleSelector, custom_example_set, default_example_set
+from .history import get_session_history, persona_key_for
+from .log import message_fields
+from .personas import get_default_persona
+from .llm import from_langchain_messages, get_llm_provider
+from .metrics import CHAT_STAGE_ERRORS, VECTOR_STORE_SECONDS, stage, timed
+from .ratelimit import llm_admission
+from .user_facts import facts_for_prompt, format_facts, schedule as schedule_fact_extraction
+from .vector_store import get_collection
+import logging
 from langchain_core.messages import AIMessage, HumanMessage
 
-GROQ_API_KEY = settings.groq_api_key
-embedding_model = SentenceTransformer("intfloat/e5-small-v2")
+logger = logging.getLogger(__name__)
 
-VECTOR_STORE_DIR = os.path.abspath("./vector_store")
-os.makedirs(VECTOR_STORE_DIR, exist_ok=True)
 
-chroma_client = chromadb.PersistentClient(path=VECTOR_STORE_DIR)
-chat_collection = chroma_client.get_or_create_collection(name="chat_memory")
+def get_or_create_ai_user(db: Session):
+    """The shared user every AI message is sent from."""
+    ai_user = (
+        db.query(models.User)
+        .filter(models.User.username == "AI_System")
+        .first()
+    )
+    if not ai_user:
+        ai_user = models.User(
+            username="AI_System",
+            email="ai_system@yourapp.com",
+            country="AI",
+            password="",
+            is_active=True,
+        )
+        db.add(ai_user)
+        db.commit()
+        db.refresh(ai_user)
+    return ai_user
 
 
 class AIChatSession:
@@ -32,6 +54,7 @@ class AIChatSession:
         user_id: int,
         persona_name: str = "Alice",
         custom_persona_id: int = None,
+        group_members: list = None,
     ):
         self.db = db
         self.session_id = session_id
@@ -39,20 +62,41 @@ class AIChatSession:
         self.persona_name = persona_name
         self.custom_persona_id = custom_persona_id
 
-        self.user = db.query(models.User).filter(models.User.id == user_id).first()
-        if not self.user:
-            raise ValueError(f"User ID {user_id} not found in DB")
+        with stage("user_lookup"):
+            self.user = db.query(models.User).filter(models.User.id == user_id).first()
+            if not self.user:
+                raise ValueError(f"User ID {user_id} not found in DB")
 
-        self.ai_user = self._get_or_create_ai_user()
-        self.persona = self._load_persona(persona_name, custom_persona_id)
+            self.ai_user = get_or_create_ai_user(db)
+        with stage("persona_load"):
+            self.persona = self._load_persona(persona_name, custom_persona_id)
 
         examples = self.persona.get("example_message", [])
         example_prompt = ChatPromptTemplate.from_messages(
             [("human", "{input}"), ("ai", "{output}")]
         )
-        few_shot_prompt = FewShotChatMessagePromptTemplate(
-            example_prompt=example_prompt, examples=examples
-        )
+        k = settings.few_shot_examples
+        example_set = None
+        if 0 < k < len(examples):
+            with stage("persona_load"):
+                try:
+                    if custom_persona_id:
+                        example_set = custom_example_set(db, custom_persona_id, examples)
+                    else:
+                        example_set = default_example_set(persona_name, examples)
+                except Exception:
+                    logger.exception("Error embedding persona examples")
+                    examples = examples[:k]  # the turn goes on with the first k
+        if example_set is not None:
+            few_shot_prompt = FewShotChatMessagePromptTemplate(
+                example_prompt=example_prompt,
+                example_selector=SimilarExampleSelector(example_set, k),
+                input_variables=["query_vector"],
+            )
+        else:
+            few_shot_prompt = FewShotChatMessagePromptTemplate(
+                example_prompt=example_prompt, examples=examples
+            )
 
         self.prompt = ChatPromptTemplate.from_messages(
             [
@@ -61,11 +105,12 @@ class AIChatSession:
                     f"""
             {self.persona.get("system", "").replace("#USERNAME", self.user.username)}
 
-            You are {persona_name} talking to {self.user.username}.
+            You are {persona_name} talking to {self.user.username}.{self._group_note(group_members)}
             Current time: {datetime.now()}
 
             IMPORTANT: Respond naturally in conversation. Do NOT use JSON format.
             Use your personality and remember previous conversations.
+            {{facts}}
             """,
                 ),
                 few_shot_prompt,
@@ -73,39 +118,40 @@ class AIChatSession:
             ]
         )
 
-        self.chat_model = ChatGroq(
-            model="llama-3.3-70b-versatile", temperature=0.8, api_key=GROQ_API_KEY
-        )
-
-        base_chain = self.prompt | self.chat_model | StrOutputParser()
+        base_chain = self.prompt | RunnableLambda(self._generate) | StrOutputParser()
 
+        # One history instance per turn so the ids it writes can be read back
+        # without re-querying (and without picking up a concurrent turn's rows).
+        self.history = get_session_history(
+            self.session_id, self.db, self.user_id, self.ai_user.id
+        )
         self.chain = RunnableWithMessageHistory(
             base_chain,
-            lambda session_id: get_session_history(
-                session_id, self.db, self.user_id, self.ai_user.id
-            ),
+            lambda session_id: self.history,
             input_messages_key="input",
             history_messages_key="history",
         )
 
-    def _get_or_create_ai_user(self):
-        ai_user = (
-            self.db.query(models.User)
-            .filter(models.User.username == "AI_System")
-            .first()
+    def _group_note(self, members) -> str:
+        others = [name for name in members or [] if name != self.persona_name]
+        if not others:
+            return ""
+        return (
+            f" This is a group chat with {', '.join(others)}; "
+            f"answer only as {self.persona_name}, in one message."
         )
-        if not ai_user:
-            ai_user = models.User(
-                username="AI_System",
-                email="ai_system@yourapp.com",
-                country="AI",
-                password="",
-                is_active=True,
+
+    def _generate(self, prompt_value, timeout: float = None) -> str:
+        """Call the shared LLM provider; raises LLMError once all models fail."""
+        with llm_admission.slot(), stage("llm"):
+            completion = get_llm_provider().complete(
+                from_langchain_messages(prompt_value.to_messages()), timeout=timeout
             )
-            self.db.add(ai_user)
-            self.db.commit()
-            self.db.refresh(ai_user)
-        return ai_user
+        return completion.text
+
+    def reply(self, turn: dict, timeout: float = None) -> str:
+        """Generate a reply to a ``recall()``-ed turn without touching history."""
+        return self._generate(self.prompt.invoke(turn), timeout=timeout)
 
     def _load_persona(self, name: str, custom_persona_id: int = None):
         """Load persona from custom database or default JSON files."""
@@ -136,42 +182,42 @@ class AIChatSession:
             }
             return persona_data
         else:
-            # Load default persona from JSON file
-            path = os.path.join("personas", f"{name.lower()}.json")
-            if not os.path.exists(path):
-                raise FileNotFoundError(f"Persona JSON not found at: {path}")
-            with open(path, "r", encoding="utf-8") as f:
-                return json.load(f)
+            # Default personas are read from app/personas once per process
+            return get_default_persona(name)
                 
     def _embed_and_store(self, message_id: str, text: str, metadata: dict):
         """Create vector embedding and store persistently in ChromaDB"""
         try:
-            vector = embedding_model.encode(text).tolist()
-            chat_collection.add(
-                documents=[text],
-                embeddings=[vector],
-                metadatas=[
-                    {
-                        **metadata,
-                        "timestamp": datetime.utcnow().isoformat(),
-                        "user_id": self.user_id,
-                    }
-                ],
-                ids=[message_id],
-            )
-        except Exception as e:
-            print(f"Error storing in vector DB: {e}")
+            vector = encode([text])[0]
+            with timed(VECTOR_STORE_SECONDS.labels("add")):
+                get_collection().add(
+                    documents=[text],
+                    embeddings=[vector],
+                    metadatas=[
+                        {
+                            **metadata,
+                            "timestamp": datetime.utcnow().isoformat(),
+                            "user_id": self.user_id,
+                        }
+                    ],
+                    ids=[message_id],
+                )
+        except Exception:
+            CHAT_STAGE_ERRORS.labels("embed_store").inc()
+            logger.exception("Error storing in vector DB")
 
-    def _search_relevant_messages(self, query_text: str, top_k=3):
+    def _search_relevant_messages(self, query_text: str, top_k=3, query_vector=None):
         """Find similar messages using ChromaDB"""
         try:
-            query_vector = embedding_model.encode(query_text).tolist()
-            results = chat_collection.query(
-                query_embeddings=[query_vector],
-                n_results=top_k,
-                where={"session_id": self.session_id},
-                include=["documents", "metadatas"],
-            )
+            if query_vector is None:
+                query_vector = encode([query_text])[0]
+            with timed(VECTOR_STORE_SECONDS.labels("query")):
+                results = get_collection().query(
+                    query_embeddings=[query_vector],
+                    n_results=top_k,
+                    where={"session_id": self.session_id},
+                    include=["documents", "metadatas"],
+                )
 
             if results and "documents" in results and results["documents"][0]:
                 relevant_docs = []
@@ -179,16 +225,32 @@ class AIChatSession:
                     results["documents"][0], results["metadatas"][0]
                 ):
                     role = metadata.get("role", "user")
-                    relevant_docs.append(f"{role}: {doc}")
+                    relevant_docs.append(f"{role}: {doc[:settings.memory_snippet_chars]}")
                 return relevant_docs
             return []
-        except Exception as e:
-            print(f"Error searching relevant messages: {e}")
+        except Exception:
+            CHAT_STAGE_ERRORS.labels("vector_search").inc()
+            logger.exception("Error searching relevant messages")
             return []
 
-    def send_message(self, user_input: str):
-        """Send message, get AI response, and automatically store history."""
-        context_messages = self._search_relevant_messages(user_input)
+    def recall(self, user_input: str) -> dict:
+        """Prompt variables for a turn: recalled context, facts and the embedded message."""
+        with stage("user_facts"):
+            facts = facts_for_prompt(self.db, self.user_id, persona_key_for(self.session_id))
+
+        with stage("vector_search"):
+            try:
+                # Shared by the memory search and the few-shot example selector.
+                query_vector = encode([user_input])[0]
+            except Exception:
+                query_vector = None  # the search retries and logs it
+            context_messages = []
+            # Greetings and one-word replies recall nothing useful; facts cover who
+            # the user is.
+            if len(user_input.split()) >= settings.memory_search_min_words:
+                context_messages = self._search_relevant_messages(
+                    user_input, query_vector=query_vector
+                )
 
         enhanced_input = user_input
         if context_messages:
@@ -196,48 +258,61 @@ class AIChatSession:
             enhanced_input = (
                 f"Previous context:\n{context_text}\n\nCurrent message: {user_input}"
             )
+        return {
+            "input": enhanced_input,
+            "query_vector": query_vector,
+            "facts": (
+                f"What you know about {self.user.username}:\n{format_facts(facts)}"
+                if facts
+                else ""
+            ),
+        }
 
-        try:
-            config = {"configurable": {"session_id": self.session_id}}
-            ai_response_text = self.chain.invoke(
-                {"input": enhanced_input}, config=config
-            )
-            print(f"✅ AI Response: {ai_response_text}")
-
-        except Exception as e:
-            print(f"Error in AI chain: {e}")
-            ai_response_text = f"Oh, that's an interesting question! I'm not sure how to answer that yet. Let's talk about something else!"
+    def send_message(self, user_input: str):
+        """Send message, get AI response, and automatically store history."""
+        turn = self.recall(user_input)
 
-        history = get_session_history(
-            self.session_id, self.db, self.user_id, self.ai_user.id
+        # LLMError propagates: nothing has been written to history at this point,
+        # so the router can answer 503 and the client can safely retry.
+        config = {"configurable": {"session_id": self.session_id}}
+        ai_response_text = self.chain.invoke(turn, config=config)
+        logger.info(
+            "AI response generated",
+            extra={
+                "sampled": True,
+                "session_id": self.session_id,
+                **message_fields(ai_response_text),
+            },
         )
-        user_msg_db = history.messages[-2]
-        ai_msg_db = history.messages[-1]
-        
+
+        user_msg_id, ai_msg_id = self.history.added_message_ids[-2:]
+
         persona_identifier = (
             f"custom_{self.custom_persona_id}"
             if self.custom_persona_id
             else self.persona_name
         )
 
-        self._embed_and_store(
-            str(user_msg_db.id),
-            user_input,
-            {
-                "role": "user",
-                "session_id": self.session_id,
-                "persona": persona_identifier,
-            },
-        )
-        self._embed_and_store(
-            str(ai_msg_db.id),
-            ai_response_text,
-            {
-                "role": "ai",
-                "session_id": self.session_id,
-                "persona": persona_identifier,
-            },
-        )
+        with stage("embed_store"):
+            self._embed_and_store(
+                str(user_msg_id),
+                user_input,
+                {
+                    "role": "user",
+                    "session_id": self.session_id,
+                    "persona": persona_identifier,
+                },
+            )
+            self._embed_and_store(
+                str(ai_msg_id),
+                ai_response_text,
+                {
+                    "role": "ai",
+                    "session_id": self.session_id,
+                    "persona": persona_identifier,
+                },
+            )
+        schedule_fact_extraction(self.user_id, self.ai_user.id, self.session_id)
 
         return {
             "user_message": user_input,
@@ -245,8 +320,8 @@ class AIChatSession:
             "timestamp": datetime.utcnow().isoformat(),
         }
 
-    def get_history(self, limit=20):
-        """Retrieves chat history from the database."""
+    def get_history(self, limit=20, include_archived=False):
+        """Retrieves chat history from the database (and the archive if asked)."""
         history = get_session_history(
             self.session_id, self.db, self.user_id, self.ai_user.id
         )
@@ -264,4 +339,19 @@ class AIChatSession:
                     "timestamp": datetime.utcnow().isoformat(),  # Timestamps from DB would be better
                 }
             )
+
+        if include_archived and len(formatted_messages) < limit:
+            archived = read_archived_messages(
+                self.user_id, self.session_id, limit - len(formatted_messages)
+            )
+            formatted_messages = [
+                {
+                    "id": str(record["id"]),
+                    "from": "AI" if record["is_ai"] else self.user.username,
+                    "content": record["content"],
+                    "timestamp": record["timestamp"],
+                    "archived": True,
+                }
+                for record in archived
+            ] + formatted_messages
         return formatted_messages
\ No newline at end of file
@@ -0,0 +1,98 @@
+"""Archived chat history: gzip-compressed NDJSON, one file per user per month.
+
+Layout is ``MESSAGES_ARCHIVE_DIR/<user_id>/<YYYY-MM>.ndjson.gz`` with one
+message object per line in timestamp order.  Files are written by
+``core.partitions`` when a month falls out of the retention window and read
+back when a history request asks for archived messages and by exports.
+"""
+
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional
+import gzip
+import json
+import os
+
+from .config import settings
+
+ARCHIVE_DIR = Path(os.path.abspath(settings.messages_archive_dir))
+
+
+def archive_path(user_id: int, month: str) -> Path:
+    return ARCHIVE_DIR / str(user_id) / f"{month}.ndjson.gz"
+
+
+class MonthArchiveWriter:
+    """Writes one month of rows sorted by owner, one file per owner.
+
+    Each file is written to a temporary name and renamed into place, so a
+    crash mid-archive never leaves a truncated file behind.
+    """
+
+    def __init__(self, month: str):
+        self.month = month
+        self._owner = None
+        self._file = None
+        self._tmp_path = None
+        self.files = 0
+        self.rows = 0
+
+    def write(self, owner_id: int, record: dict) -> None:
+        if owner_id != self._owner:
+            self._close()
+            path = archive_path(owner_id, self.month)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self._tmp_path = path.with_suffix(".tmp")
+            self._file = gzip.open(self._tmp_path, "wt", encoding="utf-8")
+            self._owner = owner_id
+        self._file.write(json.dumps(record, default=str, ensure_ascii=False) + "\n")
+        self.rows += 1
+
+    def _close(self) -> None:
+        if self._file is None:
+            return
+        self._file.close()
+        os.replace(self._tmp_path, archive_path(self._owner, self.month))
+        self._file = None
+        self.files += 1
+
+    def close(self) -> None:
+        self._close()
+
+
+def _read(path: Path) -> Iterable[dict]:
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            yield json.loads(line)
+
+
+def read_archived_messages(user_id: int, session_id: str, limit: int) -> List[dict]:
+    """Most recent ``limit`` archived messages of a session, oldest first."""
+    user_dir = ARCHIVE_DIR / str(user_id)
+    if limit <= 0 or not user_dir.is_dir():
+        return []
+
+    collected: List[dict] = []
+    # Newest month first; stop as soon as enough messages were found.
+    for path in sorted(user_dir.glob("*.ndjson.gz"), reverse=True):
+        month = [
+            record
+            for record in _read(path)
+            if (record.get("meta_data") or {}).get("session_id") == session_id
+        ]
+        collected = month + collected
+        if len(collected) >= limit:
+            break
+    collected.sort(key=lambda record: (record["timestamp"], record["id"]))
+    return collected[-limit:]
+
+
+def iter_archived_messages(user_id: int, session_id: Optional[str] = None) -> Iterator[dict]:
+    """Every archived message of a user (or one session), oldest first, a file at a time."""
+    user_dir = ARCHIVE_DIR / str(user_id)
+    if not user_dir.is_dir():
+        return
+    for path in sorted(user_dir.glob("*.ndjson.gz")):
+        for record in _read(path):
+            if session_id and (record.get("meta_data") or {}).get("session_id") != session_id:
+                continue
+            yield record
@@ -0,0 +1,58 @@
+"""gzip for large JSON responses.
+
+A long ``/ai/history`` page or a persona with many examples is tens of
+kilobytes of very repetitive JSON.  ``CompressionMiddleware`` gzips complete
+responses of at least ``COMPRESS_MIN_BYTES`` for clients that send
+``Accept-Encoding: gzip``.  Streamed responses are passed through untouched:
+compressing them would hold back the NDJSON events of a group chat until the
+compressor's buffer fills, and ``/ai/export`` has its own ``?gzip=true``.
+"""
+
+import gzip
+
+from starlette.datastructures import Headers, MutableHeaders
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = 1024, level: int = 6):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.level = level
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.minimum_size <= 0:
+            return await self.app(scope, receive, send)
+        accepts_gzip = "gzip" in Headers(scope=scope).get("accept-encoding", "")
+        start = None
+
+        async def send_wrapper(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                start = message  # held until we know whether the body is compressed
+                return
+            if start is None:
+                return await send(message)
+
+            response_start, start = start, None
+            headers = MutableHeaders(raw=response_start["headers"])
+            body = message.get("body", b"")
+            if (
+                message["type"] == "http.response.body"
+                and not message.get("more_body", False)
+                and len(body) >= self.minimum_size
+                and "content-encoding" not in headers
+            ):
+                headers.add_vary_header("Accept-Encoding")
+                if accepts_gzip:
+                    body = gzip.compress(body, compresslevel=self.level, mtime=0)
+                    headers["Content-Encoding"] = "gzip"
+                    headers["Content-Length"] = str(len(body))
+                    etag = headers.get("etag")
+                    if etag and not etag.startswith("W/"):
+                        # Not byte-identical to the uncompressed representation
+                        headers["ETag"] = f"W/{etag}"
+                    message = {**message, "body": body}
+            await send(response_start)
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,145 @@
+"""Per-session ordering and coalescing of concurrent chat turns.
+
+Chat endpoints are sync and run on the threadpool, so the primitives here are
+thread-based.  ``session_lock`` serializes turns of one conversation, either
+in-process or across workers through a Postgres advisory lock, and
+``SingleFlight`` lets identical in-flight requests share a single result.
+"""
+
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Hashable
+import threading
+import time
+
+from sqlalchemy import exc, text
+
+from .config import settings
+from .database import lock_engine
+
+
+class SessionBusyError(Exception):
+    """Raised when a session lock could not be acquired before the timeout."""
+
+
+class KeyedLocks:
+    """A map of locks that only holds entries for keys currently in use."""
+
+    def __init__(self):
+        self._locks: Dict[Hashable, list] = {}
+        self._guard = threading.Lock()
+
+    @contextmanager
+    def hold(self, key: Hashable, timeout: float):
+        with self._guard:
+            entry = self._locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            if not entry[0].acquire(timeout=timeout):
+                raise SessionBusyError(f"Session {key} is busy")
+            try:
+                yield
+            finally:
+                entry[0].release()
+        finally:
+            with self._guard:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._locks[key]
+
+
+class SingleFlight:
+    """Run ``fn`` once per key; concurrent callers with the same key get its result."""
+
+    class _Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.result: Any = None
+            self.error: BaseException = None
+
+    def __init__(self):
+        self._calls: Dict[Hashable, "SingleFlight._Call"] = {}
+        self._guard = threading.Lock()
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._guard:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = self._Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._guard:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+
+_local_session_locks = KeyedLocks()
+
+
+def _try_advisory_lock(key: str):
+    """A ``lock_engine`` connection holding the lock, or None if it is taken."""
+    try:
+        conn = lock_engine.connect()
+    except exc.TimeoutError:
+        raise SessionBusyError(f"Session {key} is busy (no lock connection free)")
+    try:
+        if conn.execute(
+            text("SELECT pg_try_advisory_lock(hashtextextended(:key, 0))"), {"key": key}
+        ).scalar():
+            conn.commit()  # the lock outlives the transaction; don't sit idle in one
+            return conn
+    except BaseException:
+        conn.close()
+        raise
+    conn.close()
+    return None
+
+
+@contextmanager
+def _advisory_lock(key: str, timeout: float):
+    # A dedicated connection: the request's Session hands its connection back to
+    # the pool on every commit, and advisory locks belong to the connection.
+    # Waiters return theirs between tries, so only running turns hold one.
+    deadline = time.monotonic() + timeout
+    delay = 0.01
+    conn = _try_advisory_lock(key)
+    while conn is None:
+        if time.monotonic() + delay > deadline:
+            raise SessionBusyError(f"Session {key} is busy")
+        time.sleep(delay)
+        delay = min(delay * 2, 0.5)
+        conn = _try_advisory_lock(key)
+    try:
+        yield
+    finally:
+        try:
+            conn.execute(
+                text("SELECT pg_advisory_unlock(hashtextextended(:key, 0))"), {"key": key}
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+
+@contextmanager
+def session_lock(session_id: str):
+    """Serialize chat turns for one session (``SESSION_LOCK_BACKEND=local|postgres``)."""
+    timeout = settings.session_lock_timeout_seconds
+    if settings.session_lock_backend == "postgres":
+        with _advisory_lock(f"chat_session:{session_id}", timeout):
+            yield
+    else:
+        with _local_session_locks.hold(session_id, timeout):
+            yield
@@ -15,6 +15,110 @@ class Settings(BaseSettings):
     refresh_token_expire_days: int
     groq_api_key: str
 
+    # LLM provider (any OpenAI-compatible chat completions API)
+    llm_base_url: str = "https://api.groq.com/openai/v1"
+    llm_model: str = "llama-3.3-70b-versatile"
+    llm_fallback_models: str = "llama-3.1-8b-instant"
+    llm_temperature: float = 0.8
+    llm_timeout_seconds: float = 20.0
+    llm_connect_timeout_seconds: float = 3.0
+    llm_max_retries: int = 2
+    llm_backoff_base_seconds: float = 0.25
+    llm_backoff_max_seconds: float = 4.0
+    llm_hedge_enabled: bool = False
+    llm_hedge_after_ms: int = 0  # 0 hedges after the observed p95 latency
+    llm_breaker_failure_threshold: int = 5
+    llm_breaker_reset_seconds: float = 30.0
+    llm_max_connections: int = 50
+
+    # Chat memory
+    embedding_backend: str = "sentence-transformers"  # or "hash" for offline runs
+    embedding_model: str = "intfloat/e5-small-v2"
+    embedding_batch_window_ms: float = 3.0  # 0 encodes every call on its own
+    embedding_max_batch: int = 64
+    memory_search_min_words: int = 3  # shorter messages ("ok lol") skip the vector search
+    memory_snippet_chars: int = 200  # per recalled message in the prompt
+    vector_store_dir: str = "./vector_store"
+    vector_store_backend: str = "chroma"  # or "float16" / "int8" (core/quantized_store.py)
+    vector_rerank_factor: int = 4  # int8: candidates re-scored with the unquantized query, per result
+    vector_service_url: str = ""  # "unix:///run/vector/vector.sock" or "http://host:port"
+    vector_service_timeout_seconds: float = 5.0
+    vector_service_max_connections: int = 20
+
+    # Group chats: every member persona answers each message in parallel
+    group_reply_timeout_seconds: float = 20.0  # per group turn, queueing and retries included
+    group_max_parallel_replies: int = 32  # across all group chats of the worker
+
+    # Few-shot examples sent per turn, the ones closest to the user's message
+    few_shot_examples: int = 3  # 0 sends every example of the persona
+    few_shot_cache_size: int = 1000  # personas whose embedded examples stay in memory
+
+    # Long-term user facts, extracted in the background every N user messages
+    user_facts_every: int = 6  # 0 disables extraction
+    user_facts_in_prompt: int = 12
+    user_facts_max: int = 100  # per user; the least recently updated are dropped
+
+    # Hot window of recent messages per active session (0 sessions disables it)
+    history_window: int = 50  # messages kept per session and returned as its history
+    history_cache_sessions: int = 10000
+    history_cache_ttl_seconds: float = 300.0
+    history_cache_invalidation: str = "postgres"  # LISTEN/NOTIFY, or "local" (one worker)
+
+    # Monthly partitions of messages; months past retention are archived to files
+    messages_partition_months_ahead: int = 3
+    messages_retention_months: int = 0  # 0 keeps every month in the database
+    messages_archive_dir: str = "./archive"
+    partition_maintenance_interval_seconds: float = 3600.0  # 0 disables the job
+
+    # Bulk NDJSON imports (uploads are kept here until the job finishes)
+    import_dir: str = "./imports"
+    import_batch_size: int = 1000
+    import_max_bytes: int = 512 * 1024 * 1024
+
+    # Per-session ordering of chat turns: "local" (one worker) or "postgres"
+    session_lock_backend: str = "local"
+    session_lock_timeout_seconds: float = 30.0
+    session_lock_pool_size: int = 20  # postgres: connections holding turn locks, per worker
+
+    # Idempotency-Key handling for POST /ai/chat
+    idempotency_ttl_hours: int = 24
+    idempotency_cache_size: int = 10000
+    idempotency_wait_seconds: float = 30.0
+    idempotency_stale_seconds: float = 120.0
+
+    # Per-user token buckets ("METHOD /path=requests/seconds", comma-separated)
+    rate_limit_enabled: bool = True
+    rate_limit_backend: str = "memory"  # "memory" or "postgres"
+    rate_limit_rules: str = (
+        "POST /ai/chat=30/60, GET /ai/history=120/60, GET /ai/export=10/3600, "
+        "POST /log-in=10/60, POST /sign-up=5/3600, POST /personas/=10/60, "
+        "POST /imports=5/3600, POST /groups/*=20/60"
+    )
+
+    # gzip for complete (not streamed) responses of at least this many bytes; 0 disables
+    compress_min_bytes: int = 1024
+    compress_level: int = 6
+
+    # Admission control in front of the LLM, per worker
+    llm_max_concurrency: int = 16
+    llm_max_queue: int = 32
+    llm_queue_timeout_seconds: float = 5.0
+    threadpool_headroom: int = 40  # threads for other sync routes, on top of admitted turns
+
+    # Logging: JSON lines on stdout; sample rate applies to verbose events
+    log_level: str = "INFO"
+    log_format: str = "json"  # or "text"
+    log_sample_rate: float = 0.1
+    log_message_content: bool = False
+
+    # Request profiler, served on /admin/profiles (comma-separated admin emails)
+    admin_emails: str = ""
+    profiling_enabled: bool = False
+    profiling_sample_rate: float = 0.01
+    profiling_slow_ms: float = 2000.0
+    profiling_interval_ms: float = 10.0
+    profiling_max_profiles: int = 50
+
     class Config:
         env_file = ENV_PATH
 
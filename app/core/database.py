@@ -27,11 +27,21 @@ def get_database_url():
         raise ValueError('Database configuration error:', e)
 
 engine = create_engine(get_database_url())
+# Advisory locks of running chat turns are held on connections of their own
+# (core.concurrency), kept apart so they never starve the request sessions.
+lock_engine = create_engine(
+    engine.url,
+    pool_size=settings.session_lock_pool_size,
+    max_overflow=0,
+    pool_timeout=settings.session_lock_timeout_seconds,
+)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
 def init_db():
-    Base.metadata.create_all(bind=engine)
+    from .migrations import run_migrations
+
+    run_migrations(engine)
 
 def get_db():
     db = SessionLocal()
@@ -0,0 +1,168 @@
+"""Text embeddings for chat memory.
+
+``EMBEDDING_BACKEND=sentence-transformers`` (the default) loads
+``EMBEDDING_MODEL`` on first use.  ``EMBEDDING_BACKEND=hash`` is a
+dependency-free feature-hashing embedder for load tests and offline
+benchmarks; its vectors are deterministic but carry no real semantics.
+
+Small ``encode`` calls from concurrent chat turns are coalesced by
+``EmbeddingBatcher`` into one forward pass, so peak load runs a few large
+batches instead of many batches of one.
+"""
+
+from concurrent.futures import Future
+from typing import List, Optional, Sequence
+import hashlib
+import os
+import queue
+import re
+import threading
+import time
+
+import numpy as np
+
+from .config import settings
+from .metrics import (
+    EMBEDDING_BATCH_REQUESTS,
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_QUEUE_SECONDS,
+    EMBEDDING_SECONDS,
+    timed,
+)
+
+TOKEN_RE = re.compile(r"\w+")
+
+
+class HashEmbedder:
+    def __init__(self, dimension: int = 384):
+        self.dimension = dimension
+
+    def encode(self, texts: Sequence[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in TOKEN_RE.findall(text.lower()):
+                digest = hashlib.blake2b(token.encode(), digest_size=8).digest()
+                bucket = int.from_bytes(digest[:4], "little") % self.dimension
+                vectors[row, bucket] += 1.0 if digest[4] & 1 else -1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+
+class SentenceTransformerEmbedder:
+    def __init__(self, model_name: str):
+        from sentence_transformers import SentenceTransformer
+
+        self.model = SentenceTransformer(model_name)
+        self.dimension = self.model.get_sentence_embedding_dimension()
+
+    def encode(self, texts: Sequence[str]) -> np.ndarray:
+        return self.model.encode(list(texts))
+
+
+_embedder = None
+_embedder_lock = threading.Lock()
+
+
+def get_embedder():
+    global _embedder
+    if _embedder is None:
+        with _embedder_lock:
+            if _embedder is None:
+                if settings.embedding_backend == "hash":
+                    _embedder = HashEmbedder()
+                else:
+                    _embedder = SentenceTransformerEmbedder(settings.embedding_model)
+    return _embedder
+
+
+def _forward(texts: Sequence[str]) -> List[List[float]]:
+    """Embed a batch of texts in one forward pass."""
+    EMBEDDING_BATCH_SIZE.observe(len(texts))
+    with timed(EMBEDDING_SECONDS):
+        return get_embedder().encode(texts).tolist()
+
+
+class EmbeddingBatcher:
+    """Coalesce concurrent ``encode`` calls into shared forward passes.
+
+    A dispatcher thread takes the first waiting request, keeps collecting for
+    at most ``window`` seconds or until ``max_batch`` texts are queued, runs
+    one forward pass and hands every caller its own slice of the result.  A
+    caller therefore waits at most one window plus one forward pass.
+    """
+
+    def __init__(self, window: float, max_batch: int):
+        self.window = window
+        self.max_batch = max_batch
+        self._queue = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self) -> None:
+        # Threads don't survive fork: a worker forked from a preloaded parent
+        # starts its own dispatcher on first use.
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._queue = queue.SimpleQueue()
+                    self._thread = threading.Thread(
+                        target=self._run, name="embedding-batcher", daemon=True
+                    )
+                    self._thread.start()
+                    self._pid = os.getpid()
+
+    def encode(self, texts: Sequence[str]) -> List[List[float]]:
+        self._ensure_started()
+        future = Future()
+        self._queue.put((list(texts), future, time.perf_counter()))
+        return future.result()
+
+    def _run(self) -> None:
+        carry = None
+        while True:
+            first = carry or self._queue.get()
+            carry = None
+            batch = [first]
+            size = len(first[0])
+            deadline = first[2] + self.window
+            while size < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if size + len(item[0]) > self.max_batch:
+                    carry = item  # starts the next batch
+                    break
+                batch.append(item)
+                size += len(item[0])
+            self._dispatch(batch)
+
+    def _dispatch(self, batch) -> None:
+        started = time.perf_counter()
+        for _, _, queued_at in batch:
+            EMBEDDING_QUEUE_SECONDS.observe(started - queued_at)
+        EMBEDDING_BATCH_REQUESTS.observe(len(batch))
+        try:
+            vectors = _forward([text for texts, _, _ in batch for text in texts])
+        except BaseException as e:
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+        offset = 0
+        for texts, future, _ in batch:
+            future.set_result(vectors[offset : offset + len(texts)])
+            offset += len(texts)
+
+
+_batcher = EmbeddingBatcher(settings.embedding_batch_window_ms / 1000, settings.embedding_max_batch)
+
+
+def encode(texts: Sequence[str]) -> List[List[float]]:
+    """Embed texts; small calls share a forward pass with concurrent ones."""
+    if settings.embedding_batch_window_ms <= 0 or len(texts) >= settings.embedding_max_batch:
+        return _forward(texts)
+    return _batcher.encode(texts)
@@ -0,0 +1,165 @@
+"""Streaming export of a user's chat history as NDJSON or CSV.
+
+Months already moved out of the database by ``core.partitions`` come first,
+read a file at a time from ``core.archive``; the rest is read with a
+server-side cursor (``yield_per``).  Rows are encoded in chunks, optionally
+through a streaming gzip compressor, so memory use does not depend on how
+many messages the user has.  Used by ``GET /ai/export``
+and by the CLI::
+
+    uv run python -m core.export --user-id 12 --format csv --gzip -o chats.csv.gz
+"""
+
+from typing import Iterator, Optional
+import argparse
+import csv
+import io
+import json
+import sys
+import zlib
+
+from sqlalchemy import and_, or_, select
+
+from models import models
+from .archive import iter_archived_messages
+from .database import SessionLocal
+from .history import persona_key_for
+
+BATCH_SIZE = 1000
+FIELDS = ["id", "session_id", "persona", "role", "content", "timestamp"]
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+def _row(message_id, session_id: Optional[str], is_ai: bool, content, timestamp) -> dict:
+    session_id = session_id or ""
+    return {
+        "id": message_id,
+        "session_id": session_id,
+        "persona": persona_key_for(session_id) if session_id else None,
+        "role": "ai" if is_ai else "user",
+        "content": content,
+        "timestamp": timestamp,
+    }
+
+
+def _rows(user_id: int, session_id: Optional[str]) -> Iterator[dict]:
+    """The user's messages in time order, archived months first.
+
+    The request's session from ``get_db`` is closed before a streaming body
+    is sent, so the database rows are read on a session of the export's own.
+    """
+    for record in iter_archived_messages(user_id, session_id):
+        yield _row(
+            record["id"],
+            (record.get("meta_data") or {}).get("session_id"),
+            record["is_ai"],
+            record["content"],
+            record["timestamp"],
+        )
+
+    db = SessionLocal()
+    try:
+        filters = [
+            or_(
+                and_(models.Message.sender_id == user_id, models.Message.is_ai == False),
+                and_(models.Message.receiver_id == user_id, models.Message.is_ai == True),
+            )
+        ]
+        if session_id:
+            filters.append(models.Message.meta_data["session_id"].as_string() == session_id)
+        result = db.execute(
+            select(
+                models.Message.id,
+                models.Message.meta_data["session_id"].as_string(),
+                models.Message.is_ai,
+                models.Message.content,
+                models.Message.timestamp,
+            )
+            .where(and_(*filters))
+            .order_by(models.Message.timestamp, models.Message.id)
+            .execution_options(yield_per=BATCH_SIZE)
+        )
+        for message_id, message_session, is_ai, content, timestamp in result:
+            yield _row(
+                message_id,
+                message_session,
+                is_ai,
+                content,
+                timestamp.isoformat() if timestamp else None,
+            )
+    finally:
+        db.close()
+
+
+def _encode(rows: Iterator[dict], fmt: str) -> Iterator[bytes]:
+    if fmt == "csv":
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=FIELDS)
+        writer.writeheader()
+        count = 0
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+            if count % BATCH_SIZE == 0:
+                yield buffer.getvalue().encode("utf-8")
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue().encode("utf-8")
+        return
+
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(row, ensure_ascii=False))
+        if len(lines) == BATCH_SIZE:
+            yield ("\n".join(lines) + "\n").encode("utf-8")
+            lines = []
+    if lines:
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def _gzip(chunks: Iterator[bytes]) -> Iterator[bytes]:
+    compressor = zlib.compressobj(wbits=31)  # gzip container
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def export_messages(
+    user_id: int, fmt: str = "ndjson", gzip: bool = False, session_id: Optional[str] = None
+) -> Iterator[bytes]:
+    """Encoded export body, produced lazily chunk by chunk."""
+    chunks = _encode(_rows(user_id, session_id), fmt)
+    return _gzip(chunks) if gzip else chunks
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a user's chat history")
+    user = parser.add_mutually_exclusive_group(required=True)
+    user.add_argument("--user-id", type=int)
+    user.add_argument("--email")
+    parser.add_argument("--format", choices=list(MEDIA_TYPES), default="ndjson")
+    parser.add_argument("--gzip", action="store_true")
+    parser.add_argument("--session-id", help="only this session, e.g. 12_Alice")
+    parser.add_argument("-o", "--output", help="file to write (default: stdout)")
+    args = parser.parse_args()
+
+    user_id = args.user_id
+    if args.email:
+        with SessionLocal() as db:
+            user_id = db.scalar(select(models.User.id).where(models.User.email == args.email))
+        if user_id is None:
+            parser.error(f"no user with email {args.email}")
+
+    out = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        for chunk in export_messages(user_id, args.format, args.gzip, args.session_id):
+            out.write(chunk)
+    finally:
+        if args.output:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
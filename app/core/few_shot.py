@@ -0,0 +1,154 @@
+"""Few-shot examples chosen per turn by similarity to the user's message.
+
+A persona's examples (every pair in a default persona's JSON, up to 20 for a
+custom one) used to be sent on every call, so prompt tokens grew with the
+persona instead of the conversation.  Each example's input is now embedded
+once and every turn sends the ``FEW_SHOT_EXAMPLES`` closest to the message.
+
+Default personas are embedded on first use in each process.  Custom personas
+are embedded when they are created or updated and stored in
+``persona_example_embeddings``; a persona whose stored vectors are missing or
+stale (older persona, new ``EMBEDDING_MODEL``) is re-embedded on its next
+chat turn.  Embedded personas are kept in a per-process LRU.
+"""
+
+from collections import OrderedDict
+from datetime import datetime
+from typing import List, Optional, Sequence
+import hashlib
+import json
+import threading
+
+import numpy as np
+from langchain_core.example_selectors import BaseExampleSelector
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from models import models
+from .config import settings
+from .embeddings import encode
+
+
+def examples_hash(examples: Sequence[dict]) -> str:
+    return hashlib.sha256(
+        json.dumps([[e["input"], e["output"]] for e in examples]).encode()
+    ).hexdigest()
+
+
+def embedding_model_id() -> str:
+    return "hash" if settings.embedding_backend == "hash" else settings.embedding_model
+
+
+class ExampleSet:
+    """A persona's examples with their (normalized) input embeddings."""
+
+    def __init__(self, examples: Sequence[dict], vectors: np.ndarray):
+        self.examples = list(examples)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        self.vectors = vectors / np.maximum(norms, 1e-12)
+
+    def select(self, query_vector, k: int) -> List[dict]:
+        """The ``k`` examples closest to the query, most similar last."""
+        if len(self.examples) <= k:
+            return self.examples
+        query = np.asarray(query_vector, dtype=np.float32)
+        scores = self.vectors @ (query / max(float(np.linalg.norm(query)), 1e-12))
+        top = np.argpartition(-scores, k)[:k]
+        # Closest one ends up right before the user's message.
+        return [self.examples[i] for i in top[np.argsort(scores[top])]]
+
+
+def _embed(examples: Sequence[dict]) -> np.ndarray:
+    return np.asarray(encode([e["input"] for e in examples]), dtype=np.float32)
+
+
+_sets: "OrderedDict[tuple, ExampleSet]" = OrderedDict()
+_sets_lock = threading.Lock()
+
+
+def _cached(key: tuple) -> Optional[ExampleSet]:
+    with _sets_lock:
+        example_set = _sets.get(key)
+        if example_set is not None:
+            _sets.move_to_end(key)
+        return example_set
+
+
+def _remember(key: tuple, example_set: ExampleSet) -> ExampleSet:
+    with _sets_lock:
+        _sets[key] = example_set
+        _sets.move_to_end(key)
+        while len(_sets) > settings.few_shot_cache_size:
+            _sets.popitem(last=False)
+    return example_set
+
+
+def default_example_set(name: str, examples: Sequence[dict]) -> ExampleSet:
+    key = ("default", name.lower(), examples_hash(examples), embedding_model_id())
+    return _cached(key) or _remember(key, ExampleSet(examples, _embed(examples)))
+
+
+def store_custom_embeddings(
+    db: Session, custom_persona_id: int, examples: Sequence[dict]
+) -> Optional[np.ndarray]:
+    """Embed a custom persona's examples in the caller's transaction (no commit).
+
+    Returns the vectors stored, or None when the persona has no examples.
+    """
+    if not examples:
+        db.query(models.PersonaExampleEmbedding).filter(
+            models.PersonaExampleEmbedding.custom_persona_id == custom_persona_id
+        ).delete(synchronize_session=False)
+        return None
+    vectors = _embed(examples)
+    values = {
+        "examples_hash": examples_hash(examples),
+        "model": embedding_model_id(),
+        "vectors": vectors.tobytes(),
+        "updated_at": datetime.utcnow(),
+    }
+    db.execute(
+        insert(models.PersonaExampleEmbedding)
+        .values(custom_persona_id=custom_persona_id, **values)
+        .on_conflict_do_update(index_elements=["custom_persona_id"], set_=values)
+    )
+    return vectors
+
+
+def custom_example_set(db: Session, custom_persona_id: int, examples: Sequence[dict]) -> ExampleSet:
+    digest, model = examples_hash(examples), embedding_model_id()
+    key = ("custom", custom_persona_id, digest, model)
+    example_set = _cached(key)
+    if example_set is not None:
+        return example_set
+    row = db.get(models.PersonaExampleEmbedding, custom_persona_id)
+    if row is not None and row.examples_hash == digest and row.model == model:
+        vectors = np.frombuffer(row.vectors, dtype=np.float32).reshape(len(examples), -1)
+    else:
+        # Committed with the chat turn; until then other workers embed it too.
+        vectors = store_custom_embeddings(db, custom_persona_id, examples)
+    return _remember(key, ExampleSet(examples, vectors))
+
+
+class SimilarExampleSelector(BaseExampleSelector):
+    """Picks examples for ``FewShotChatMessagePromptTemplate`` from the
+    ``query_vector`` prompt variable (the embedded user message)."""
+
+    def __init__(self, example_set: ExampleSet, k: int):
+        self.example_set = example_set
+        self.k = k
+
+    def add_example(self, example: dict) -> None:
+        # Sets are shared through the per-process cache, so this selector gets
+        # a copy with the example instead of changing the persona's set.
+        vector = _embed([example])
+        self.example_set = ExampleSet(
+            self.example_set.examples + [example],
+            np.vstack([self.example_set.vectors, vector]),
+        )
+
+    def select_examples(self, input_variables: dict) -> List[dict]:
+        query_vector = input_variables.get("query_vector")
+        if query_vector is None:  # the message could not be embedded
+            return self.example_set.examples[: self.k]
+        return self.example_set.select(query_vector, self.k)
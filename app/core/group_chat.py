@@ -0,0 +1,158 @@
+"""Group chats: one user message, answered by several personas at once.
+
+A group turn does the per-message work once (embedding, memory search and
+facts through the first member's ``AIChatSession.recall``), stores the
+user's message, then asks every member persona for its reply in parallel.
+``GROUP_REPLY_TIMEOUT_SECONDS`` is a deadline for the whole turn: a reply
+that waited for a free ``group-reply`` thread gets only the time left.
+Replies are stored and streamed back (``group_turn`` yields NDJSON events) in
+the order they finish, so a turn takes about as long as its slowest persona.
+
+The conversation is one session, ``{user_id}_group_{group_id}``; every reply
+records the persona that sent it in ``meta_data["persona"]``.
+"""
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Iterator, List
+import json
+import logging
+import time
+
+from langchain_core.messages import AIMessage, HumanMessage
+from sqlalchemy.orm import Session
+
+from models import models
+from .ai_chat import AIChatSession
+from .concurrency import session_lock
+from .config import settings
+from .database import SessionLocal
+from .history import get_session_history
+from .llm import LLMError, LLMTimeoutError
+from .log import message_fields
+from .ratelimit import AdmissionRejected
+from .user_facts import schedule as schedule_fact_extraction
+
+logger = logging.getLogger(__name__)
+
+class GroupNotFoundError(LookupError):
+    """The group was deleted after the request was accepted."""
+
+
+_executor = ThreadPoolExecutor(
+    max_workers=settings.group_max_parallel_replies, thread_name_prefix="group-reply"
+)
+
+
+def group_session_id(user_id: int, group_id: int) -> str:
+    return f"{user_id}_group_{group_id}"
+
+
+def member_names(group: models.GroupChat) -> List[str]:
+    return [member["persona"] for member in group.members]
+
+
+def _event(**fields) -> bytes:
+    return (json.dumps(fields, default=str, ensure_ascii=False) + "\n").encode()
+
+
+def _sessions(db: Session, group: models.GroupChat, session_id: str) -> List[AIChatSession]:
+    names = member_names(group)
+    return [
+        AIChatSession(
+            db=db,
+            session_id=session_id,
+            user_id=group.user_id,
+            persona_name=member["persona"],
+            custom_persona_id=member.get("custom_persona_id"),
+            group_members=names,
+        )
+        for member in group.members
+    ]
+
+
+def _reply(chat: AIChatSession, turn: dict, deadline: float) -> str:
+    """A persona's reply in what is left of the turn's deadline."""
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise LLMTimeoutError("Group turn deadline passed before the reply started")
+    return chat.reply(turn, remaining)
+
+
+def group_turn(user_id: int, group_id: int, message: str) -> Iterator[bytes]:
+    """NDJSON events of one group turn: ``user_message``, one ``reply`` or
+    ``error`` per persona as it finishes, then ``done``."""
+    started = time.perf_counter()
+    session_id = group_session_id(user_id, group_id)
+    with session_lock(session_id), SessionLocal() as db:
+        group = db.get(models.GroupChat, group_id)
+        if group is None or group.user_id != user_id:
+            raise GroupNotFoundError(group_id)
+        chats = _sessions(db, group, session_id)
+        lead = chats[0]
+        turn = lead.recall(message)
+
+        history = get_session_history(session_id, db, user_id, lead.ai_user.id)
+        history.add_message(HumanMessage(content=message))
+        user_msg_id = history.added_message_ids[-1]
+        yield _event(type="user_message", id=user_msg_id, content=message)
+        lead._embed_and_store(
+            str(user_msg_id),
+            message,
+            {"role": "user", "session_id": session_id, "persona": f"group_{group_id}"},
+        )
+
+        deadline = time.monotonic() + settings.group_reply_timeout_seconds
+        futures = {_executor.submit(_reply, chat, turn, deadline): chat for chat in chats}
+        for future in as_completed(futures):
+            chat = futures[future]
+            try:
+                text = future.result()
+            except (LLMError, AdmissionRejected) as e:
+                logger.warning(
+                    "Group reply failed",
+                    extra={"session_id": session_id, "persona": chat.persona_name, "error": str(e)},
+                )
+                yield _event(
+                    type="error",
+                    persona=chat.persona_name,
+                    detail="The AI is temporarily unavailable, please try again shortly",
+                )
+                continue
+            except Exception:
+                # Any other failure still ends in ``done`` for the other personas.
+                logger.exception(
+                    "Group reply failed",
+                    extra={"session_id": session_id, "persona": chat.persona_name},
+                )
+                yield _event(
+                    type="error",
+                    persona=chat.persona_name,
+                    detail="This persona could not reply, please try again",
+                )
+                continue
+            history.add_message(AIMessage(content=text, name=chat.persona_name))
+            ai_msg_id = history.added_message_ids[-1]
+            logger.info(
+                "Group reply generated",
+                extra={
+                    "sampled": True,
+                    "session_id": session_id,
+                    "persona": chat.persona_name,
+                    **message_fields(text),
+                },
+            )
+            yield _event(
+                type="reply",
+                persona=chat.persona_name,
+                id=ai_msg_id,
+                content=text,
+                elapsed_ms=round(1000 * (time.perf_counter() - started)),
+            )
+            chat._embed_and_store(
+                str(ai_msg_id),
+                text,
+                {"role": "ai", "session_id": session_id, "persona": chat.persona_name},
+            )
+
+        schedule_fact_extraction(user_id, lead.ai_user.id, session_id)
+    yield _event(type="done", elapsed_ms=round(1000 * (time.perf_counter() - started)))
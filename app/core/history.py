@@ -1,8 +1,28 @@
-from typing import List
+from datetime import datetime
+from typing import List, Optional, Sequence
 from langchain_core.chat_history import BaseChatMessageHistory
 from langchain_core.messages import BaseMessage, AIMessage, HumanMessage
 from models import models
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import Session
+from .config import settings
+from .history_cache import CachedMessage, history_cache, notify_changed
+from .metrics import stage
+from .partitions import recent_month_ranges
+
+PREVIEW_LENGTH = 200
+
+
+def session_id_for(user_id: int, persona: str = None, custom_persona_id: int = None) -> str:
+    """Session id of a user's chat with a default or custom persona."""
+    if custom_persona_id:
+        return f"{user_id}_custom_{custom_persona_id}"
+    return f"{user_id}_{persona}"
+
+
+def persona_key_for(session_id: str) -> str:
+    """``"12_Alice"`` -> ``"Alice"``, ``"12_custom_3"`` -> ``"custom_3"``."""
+    return session_id.split("_", 1)[-1]
 
 
 def get_session_history(
@@ -18,43 +38,83 @@ class DBChatMessageHistory(BaseChatMessageHistory):
         self.db = db
         self.user_id = user_id
         self.ai_user_id = ai_user_id
+        # Ids of the rows written through this instance, in insertion order.
+        self.added_message_ids: List[int] = []
 
     @property
     def messages(self) -> List[BaseMessage]:
-        """Retrieve messages from the database."""
-        db_messages = (
-            self.db.query(models.Message)
-            .filter(
-                (
-                    (models.Message.sender_id == self.user_id)
-                    & (models.Message.receiver_id == self.ai_user_id)
-                )
-                | (
-                    (models.Message.sender_id == self.ai_user_id)
-                    & (models.Message.receiver_id == self.user_id)
-                )
-            )
-            .order_by(models.Message.timestamp.asc())
-            .all()
-        )
+        """The session's last ``HISTORY_WINDOW`` messages, from the hot cache if it has them."""
+        records = history_cache.get(self.session_id)
+        if records is None:
+            token = history_cache.token(self.session_id)
+            records = self._load_recent()
+            history_cache.put(self.session_id, records, token)
 
-        filtered_messages = []
-        for msg in db_messages:
-            # If message has session_id metadata, only include if it matches
-            if msg.meta_data and isinstance(msg.meta_data, dict):
-                if msg.meta_data.get("session_id") == self.session_id:
-                    filtered_messages.append(msg)
-                    
         result = []
-        for msg in filtered_messages:
-            if msg.is_ai:
-                result.append(AIMessage(content=msg.content, id=str(msg.id)))
+        for record in records:
+            if record.is_ai:
+                result.append(AIMessage(content=record.content, id=str(record.id)))
             else:
-                result.append(HumanMessage(content=msg.content, id=str(msg.id)))
+                result.append(HumanMessage(content=record.content, id=str(record.id)))
         return result
 
+    def _between_us(self):
+        return (
+            (models.Message.sender_id == self.user_id)
+            & (models.Message.receiver_id == self.ai_user_id)
+        ) | (
+            (models.Message.sender_id == self.ai_user_id)
+            & (models.Message.receiver_id == self.user_id)
+        )
+
+    def _load_recent(self) -> List[CachedMessage]:
+        """Newest month first, widening until the window is full."""
+        window = settings.history_window
+        rows = []
+        with stage("history_load"):
+            for lower, upper in recent_month_ranges(self.db):
+                query = (
+                    self.db.query(
+                        models.Message.id,
+                        models.Message.is_ai,
+                        models.Message.content,
+                        models.Message.timestamp,
+                    )
+                    .filter(self._between_us())
+                    .filter(models.Message.meta_data["session_id"].as_string() == self.session_id)
+                )
+                if lower is not None:
+                    query = query.filter(models.Message.timestamp >= lower)
+                if upper is not None:
+                    query = query.filter(models.Message.timestamp < upper)
+                query = query.order_by(models.Message.timestamp.desc(), models.Message.id.desc())
+                if window > 0:
+                    query = query.limit(window - len(rows))
+                rows.extend(query.all())
+                if window > 0 and len(rows) >= window:
+                    break
+        return [CachedMessage(*row) for row in reversed(rows)]
+
     def add_message(self, message: BaseMessage) -> None:
         """Add a message to the database."""
+        self.add_messages([message])
+
+    def add_messages(self, messages: Sequence[BaseMessage]) -> None:
+        """Add a turn's messages in one transaction."""
+        records = []
+        with stage("persist"):
+            for message in messages:
+                record = self._add(message)
+                if record is not None:
+                    records.append(record)
+            if not records:
+                return
+            notify_changed(self.db, [self.session_id])
+            self.db.commit()
+        for record in records:
+            history_cache.append(self.session_id, record)
+
+    def _add(self, message: BaseMessage) -> Optional[CachedMessage]:
         if isinstance(message, HumanMessage):
             sender_id = self.user_id
             receiver_id = self.ai_user_id
@@ -64,37 +124,67 @@ class DBChatMessageHistory(BaseChatMessageHistory):
             receiver_id = self.user_id
             is_ai = True
         else:
-            return
+            return None
 
         db_message = models.Message(
             sender_id=sender_id,
             receiver_id=receiver_id,
             content=message.content,
             is_ai=is_ai,
-            meta_data={"session_id": self.session_id}
+            timestamp=datetime.utcnow(),
+            meta_data=(
+                # Group chats name the persona that sent each reply.
+                {"session_id": self.session_id, "persona": message.name}
+                if message.name
+                else {"session_id": self.session_id}
+            ),
         )
         self.db.add(db_message)
-        self.db.commit()
+        self.db.flush()
+        self.added_message_ids.append(db_message.id)
+        self._touch_conversation(db_message)
+        # Built before commit, which expires db_message.
+        return CachedMessage(db_message.id, is_ai, db_message.content, db_message.timestamp)
 
-    def clear(self) -> None:
-        """Clear all messages from the database for this session."""
-        messages_to_delete = (
-            self.db.query(models.Message)
-            .filter(
-                (
-                    (models.Message.sender_id == self.user_id)
-                    & (models.Message.receiver_id == self.ai_user_id)
-                )
-                | (
-                    (models.Message.sender_id == self.ai_user_id)
-                    & (models.Message.receiver_id == self.user_id)
-                )
+    def _touch_conversation(self, db_message: models.Message) -> None:
+        """Upsert the inbox row in the message's transaction."""
+        latest = {
+            "last_message_id": db_message.id,
+            "last_message_at": db_message.timestamp,
+            "last_message_preview": (db_message.content or "")[:PREVIEW_LENGTH],
+            "last_message_is_ai": db_message.is_ai,
+        }
+        unread = 1 if db_message.is_ai else 0
+        stmt = insert(models.Conversation).values(
+            user_id=self.user_id,
+            session_id=self.session_id,
+            persona_key=persona_key_for(self.session_id),
+            unread_count=unread,
+            **latest,
+        )
+        self.db.execute(
+            stmt.on_conflict_do_update(
+                index_elements=["user_id", "session_id"],
+                set_={
+                    **latest,
+                    "unread_count": models.Conversation.unread_count + unread,
+                },
             )
-            .all()
         )
-        for msg in messages_to_delete:
-            if msg.meta_data and isinstance(msg.meta_data, dict):
-                if msg.meta_data.get("session_id") == self.session_id:
-                    self.db.delete(msg)
-                    
+
+    def clear(self) -> None:
+        """Clear all messages from the database for this session."""
+        # Any month can hold the session's messages; the sender/receiver
+        # indexes keep this an index scan per partition.
+        self.db.query(models.Message).filter(
+            self._between_us(),
+            models.Message.meta_data["session_id"].as_string() == self.session_id,
+        ).delete(synchronize_session=False)
+
+        self.db.query(models.Conversation).filter(
+            (models.Conversation.user_id == self.user_id)
+            & (models.Conversation.session_id == self.session_id)
+        ).delete(synchronize_session=False)
+        notify_changed(self.db, [self.session_id])
         self.db.commit()
+        history_cache.invalidate(self.session_id)
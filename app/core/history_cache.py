@@ -0,0 +1,207 @@
+"""Hot window of recent messages per active chat session.
+
+Active conversations are bursty, so every turn would otherwise re-read the
+same history.  ``HistoryCache`` keeps the last ``HISTORY_WINDOW`` messages of
+up to ``HISTORY_CACHE_SESSIONS`` sessions as small tuples, evicting the least
+recently used session and any session idle for ``HISTORY_CACHE_TTL_SECONDS``.
+``DBChatMessageHistory`` fills it on a miss, appends to it after each commit
+(write-through) and drops it on ``clear()``.
+
+Other processes learn about writes through Postgres: every transaction that
+changes a session's messages sends ``NOTIFY history_changed`` and each worker
+runs a ``HistoryInvalidationListener`` that drops the sessions it is told
+about.  A load that overlaps an invalidation, or a write to the same session
+in this worker, is not cached (see ``token()``), and if the listener loses
+its connection the whole cache is dropped, so a missed notification costs at
+most one TTL of staleness.
+"""
+
+from collections import OrderedDict
+from datetime import datetime
+from typing import Iterable, List, NamedTuple, Optional, Tuple
+import logging
+import os
+import select
+import threading
+import time
+
+from sqlalchemy import text
+
+from .config import settings
+from .metrics import HISTORY_CACHE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "history_changed"
+ALL_SESSIONS = "*"
+
+
+class CachedMessage(NamedTuple):
+    id: int
+    is_ai: bool
+    content: str
+    timestamp: datetime
+
+
+class HistoryCache:
+    def __init__(self, max_sessions: int, window: int, ttl: float):
+        self.max_sessions = max_sessions
+        self.window = window
+        self.ttl = ttl
+        self._sessions: "OrderedDict[str, Tuple[float, List[CachedMessage]]]" = OrderedDict()
+        self._generation = 0
+        # Last write per session (a global counter value), whether cached or not.
+        # Forgotten versions fold into the floor, which only makes put() stricter.
+        self._versions: "OrderedDict[str, int]" = OrderedDict()
+        self._version_floor = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_sessions > 0 and self.window > 0
+
+    def get(self, session_id: str) -> Optional[List[CachedMessage]]:
+        """The session's window, oldest first, or None on a miss."""
+        if not self.enabled:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is not None and now - entry[0] > self.ttl:
+                del self._sessions[session_id]
+                entry = None
+            if entry is None:
+                HISTORY_CACHE_REQUESTS.labels("miss").inc()
+                return None
+            self._sessions[session_id] = (now, entry[1])
+            self._sessions.move_to_end(session_id)
+            HISTORY_CACHE_REQUESTS.labels("hit").inc()
+            return list(entry[1])
+
+    def _version(self, session_id: str) -> int:
+        return self._versions.get(session_id, self._version_floor)
+
+    def _record_write(self, session_id: str) -> None:
+        self._writes += 1
+        self._versions[session_id] = self._writes
+        self._versions.move_to_end(session_id)
+        while len(self._versions) > max(self.max_sessions, 1):
+            _, version = self._versions.popitem(last=False)
+            self._version_floor = max(self._version_floor, version)
+
+    def token(self, session_id: str) -> Tuple[int, int]:
+        """Take before loading from the database and hand to ``put``."""
+        with self._lock:
+            return self._generation, self._version(session_id)
+
+    def put(self, session_id: str, messages: List[CachedMessage], token: Tuple[int, int]) -> None:
+        """Cache a freshly loaded window unless an invalidation or a write raced the load."""
+        if not self.enabled:
+            return
+        with self._lock:
+            if token != (self._generation, self._version(session_id)):
+                return
+            self._sessions[session_id] = (time.monotonic(), list(messages[-self.window :]))
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def append(self, session_id: str, message: CachedMessage) -> None:
+        """Write-through of a committed message; only extends a cached window."""
+        with self._lock:
+            # Even on a miss: a load of this session already under way may not
+            # have seen the message.
+            self._record_write(session_id)
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return
+            messages = entry[1]
+            messages.append(message)
+            if len(messages) > self.window:
+                del messages[0]
+            self._sessions[session_id] = (time.monotonic(), messages)
+            self._sessions.move_to_end(session_id)
+
+    def invalidate(self, session_id: str) -> None:
+        with self._lock:
+            self._generation += 1
+            self._sessions.pop(session_id, None)
+
+    def invalidate_all(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._sessions.clear()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+
+history_cache = HistoryCache(
+    max_sessions=settings.history_cache_sessions,
+    window=settings.history_window,
+    ttl=settings.history_cache_ttl_seconds,
+)
+
+
+def notify_changed(db, session_ids: Iterable[str]) -> None:
+    """Tell other workers, on commit of ``db``'s transaction, to drop these sessions."""
+    if not history_cache.enabled or settings.history_cache_invalidation != "postgres":
+        return
+    for session_id in set(session_ids):
+        db.execute(
+            text("SELECT pg_notify(:channel, :payload)"),
+            {"channel": CHANNEL, "payload": f"{os.getpid()}:{session_id}"},
+        )
+
+
+class HistoryInvalidationListener(threading.Thread):
+    """LISTENs on ``history_changed`` and invalidates this worker's cache."""
+
+    def __init__(self, engine, cache: HistoryCache = history_cache, poll_seconds: float = 5.0):
+        super().__init__(name="history-invalidation", daemon=True)
+        self.engine = engine
+        self.cache = cache
+        self.poll_seconds = poll_seconds
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.is_set():
+            try:
+                self._listen()
+            except Exception:
+                logger.exception("History invalidation listener failed; dropping the cache")
+            # Notifications may have been missed while disconnected.
+            self.cache.invalidate_all()
+            self._stopped.wait(self.poll_seconds)
+
+    def _listen(self) -> None:
+        # A dedicated connection, detached so it never goes back to the pool.
+        connection = self.engine.raw_connection()
+        conn = connection.driver_connection
+        connection.detach()
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cursor:
+                cursor.execute(f"LISTEN {CHANNEL}")
+            # Anything written before LISTEN took effect was not announced to us.
+            self.cache.invalidate_all()
+            own = f"{os.getpid()}:"
+            while not self._stopped.is_set():
+                if select.select([conn], [], [], self.poll_seconds) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    payload = conn.notifies.pop(0).payload
+                    if payload.startswith(own):
+                        continue  # our own write, already applied
+                    session_id = payload.split(":", 1)[-1]
+                    if session_id == ALL_SESSIONS:
+                        self.cache.invalidate_all()
+                    else:
+                        self.cache.invalidate(session_id)
+        finally:
+            conn.close()
+
+    def stop(self):
+        self._stopped.set()
@@ -0,0 +1,227 @@
+"""Idempotency-Key support for endpoints that are expensive to repeat.
+
+Completed responses live in Postgres (``idempotency_keys``) with a small LRU
+in front of it.  The first request for a key inserts an ``in_progress`` row
+and owns the key; retries either get the stored response or wait for the
+owner to finish instead of generating a second answer.
+"""
+
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+import hashlib
+import json
+import random
+import threading
+import time
+
+from sqlalchemy import and_, delete, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from models import models
+from .config import settings
+
+IN_PROGRESS = "in_progress"
+COMPLETED = "completed"
+
+
+class IdempotencyKeyMismatch(Exception):
+    """The key was already used for a different request payload."""
+
+
+class IdempotencyKeyBusy(Exception):
+    """The original request is still running after the wait timeout."""
+
+
+def request_fingerprint(payload: dict) -> str:
+    return hashlib.sha256(
+        json.dumps(payload, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+class IdempotencyStore:
+    def __init__(
+        self,
+        cache_size: int,
+        ttl: timedelta,
+        wait_seconds: float,
+        stale_seconds: float,
+    ):
+        self.cache_size = cache_size
+        self.ttl = ttl
+        self.wait_seconds = wait_seconds
+        self.stale_seconds = stale_seconds
+        self._cache: "OrderedDict[Tuple[int, str], Tuple[str, dict, datetime]]" = OrderedDict()
+        self._inflight: Dict[Tuple[int, str], threading.Event] = {}
+        self._lock = threading.Lock()
+
+    def begin(
+        self, db: Session, user_id: int, key: str, request_hash: str
+    ) -> Optional[dict]:
+        """Return the stored response, or None if the caller now owns the key."""
+        cache_key = (user_id, key)
+        deadline = time.monotonic() + self.wait_seconds
+        delay = 0.05
+
+        while True:
+            cached = self._cached(cache_key)
+            if cached is not None:
+                return self._checked(cached[0], request_hash, cached[1])
+
+            with self._lock:
+                event = self._inflight.get(cache_key)
+            if event is not None:
+                # Another request in this worker owns the key.
+                if not event.wait(max(0.0, deadline - time.monotonic())):
+                    raise IdempotencyKeyBusy(key)
+                continue
+
+            if self._try_claim(db, user_id, key, request_hash):
+                with self._lock:
+                    self._inflight[cache_key] = threading.Event()
+                if random.random() < 0.01:
+                    self.purge_expired(db)
+                return None
+
+            row = db.execute(
+                select(
+                    models.IdempotencyKey.request_hash,
+                    models.IdempotencyKey.status,
+                    models.IdempotencyKey.response,
+                    models.IdempotencyKey.created_at,
+                ).where(
+                    and_(
+                        models.IdempotencyKey.user_id == user_id,
+                        models.IdempotencyKey.key == key,
+                    )
+                )
+            ).first()
+            db.commit()
+
+            if row is not None and datetime.utcnow() - row.created_at > self.ttl:
+                self._release_row(db, user_id, key, row.created_at)
+                continue
+            if row is not None and row.status == COMPLETED:
+                self._remember(cache_key, row.request_hash, row.response, row.created_at)
+                return self._checked(row.request_hash, request_hash, row.response)
+            if row is not None and row.request_hash != request_hash:
+                raise IdempotencyKeyMismatch(key)
+            if row is not None and self._is_stale(row.created_at):
+                # The owner died mid-request; the next claim attempt takes over.
+                self._release_row(db, user_id, key, row.created_at)
+                continue
+
+            # Owned by another worker: poll until it completes or gives up.
+            if time.monotonic() + delay > deadline:
+                raise IdempotencyKeyBusy(key)
+            time.sleep(delay)
+            delay = min(delay * 2, 0.5)
+
+    def complete(self, db: Session, user_id: int, key: str, response: dict) -> None:
+        row = db.execute(
+            update(models.IdempotencyKey)
+            .where(
+                and_(
+                    models.IdempotencyKey.user_id == user_id,
+                    models.IdempotencyKey.key == key,
+                )
+            )
+            .values(status=COMPLETED, response=response)
+            .returning(models.IdempotencyKey.request_hash, models.IdempotencyKey.created_at)
+        ).first()
+        db.commit()
+        if row is not None:
+            self._remember((user_id, key), row.request_hash, response, row.created_at)
+        self._finish((user_id, key))
+
+    def abandon(self, db: Session, user_id: int, key: str) -> None:
+        """Forget an in-progress key after a failure so the client can retry."""
+        db.rollback()
+        db.execute(
+            delete(models.IdempotencyKey).where(
+                and_(
+                    models.IdempotencyKey.user_id == user_id,
+                    models.IdempotencyKey.key == key,
+                    models.IdempotencyKey.status == IN_PROGRESS,
+                )
+            )
+        )
+        db.commit()
+        self._finish((user_id, key))
+
+    def purge_expired(self, db: Session) -> None:
+        db.execute(
+            delete(models.IdempotencyKey).where(
+                models.IdempotencyKey.created_at < datetime.utcnow() - self.ttl
+            )
+        )
+        db.commit()
+
+    def _try_claim(self, db: Session, user_id: int, key: str, request_hash: str) -> bool:
+        claimed = db.execute(
+            insert(models.IdempotencyKey)
+            .values(
+                user_id=user_id,
+                key=key,
+                request_hash=request_hash,
+                status=IN_PROGRESS,
+                created_at=datetime.utcnow(),
+            )
+            .on_conflict_do_nothing()
+            .returning(models.IdempotencyKey.key)
+        ).first()
+        db.commit()
+        return claimed is not None
+
+    def _release_row(self, db: Session, user_id: int, key: str, created_at: datetime) -> None:
+        db.execute(
+            delete(models.IdempotencyKey).where(
+                and_(
+                    models.IdempotencyKey.user_id == user_id,
+                    models.IdempotencyKey.key == key,
+                    models.IdempotencyKey.created_at == created_at,
+                )
+            )
+        )
+        db.commit()
+
+    def _is_stale(self, created_at: datetime) -> bool:
+        return datetime.utcnow() - created_at > timedelta(seconds=self.stale_seconds)
+
+    def _checked(self, stored_hash: str, request_hash: str, response: dict) -> dict:
+        if stored_hash != request_hash:
+            raise IdempotencyKeyMismatch()
+        return response
+
+    def _cached(self, cache_key):
+        with self._lock:
+            entry = self._cache.get(cache_key)
+            if entry is None:
+                return None
+            if datetime.utcnow() - entry[2] > self.ttl:
+                del self._cache[cache_key]
+                return None
+            self._cache.move_to_end(cache_key)
+            return entry
+
+    def _remember(self, cache_key, request_hash: str, response: dict, created_at: datetime):
+        with self._lock:
+            self._cache[cache_key] = (request_hash, response, created_at)
+            self._cache.move_to_end(cache_key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _finish(self, cache_key) -> None:
+        with self._lock:
+            event = self._inflight.pop(cache_key, None)
+        if event is not None:
+            event.set()
+
+
+idempotency_store = IdempotencyStore(
+    cache_size=settings.idempotency_cache_size,
+    ttl=timedelta(hours=settings.idempotency_ttl_hours),
+    wait_seconds=settings.idempotency_wait_seconds,
+    stale_seconds=settings.idempotency_stale_seconds,
+)
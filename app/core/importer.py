@@ -0,0 +1,355 @@
+"""Bulk import of conversations and custom personas from NDJSON.
+
+One JSON object per line; personas must come before the messages using them::
+
+    {"type": "persona", "name": "Buddy", "system_prompt": "...", "example_messages": []}
+    {"type": "message", "persona": "Alice", "role": "user", "content": "hi", "timestamp": "2024-05-01T10:00:00"}
+    {"type": "message", "custom_persona": "Buddy", "role": "ai", "content": "hey!"}
+
+Messages land in the same sessions a live chat would use (``session_id_for``).
+Lines are processed in chunks of ``IMPORT_BATCH_SIZE``: the chunk's personas,
+one multi-row ``INSERT ... RETURNING`` for its messages, the inbox rows and the
+job checkpoint are committed together, then the chunk is embedded with one
+``encode`` call and written to Chroma with one ``add``.  An interrupted job is
+resumed from ``lines_done``; a crash between the commit and the Chroma write
+only loses that chunk's vectors, which feed retrieval and nothing else.
+
+CLI::
+
+    uv run python -m core.importer --email someone@example.com chats.ndjson
+    uv run python -m core.importer --resume <job id>
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import uuid
+
+from pydantic import ValidationError
+from sqlalchemy import and_, func, insert, select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from models import models
+from schemas.import_schemas import ImportedMessage
+from schemas.persona_schemas import PersonaCreate
+from .ai_chat import get_or_create_ai_user
+from .config import settings
+from .database import SessionLocal, engine, init_db
+from .embeddings import encode
+from .history import PREVIEW_LENGTH, persona_key_for, session_id_for
+from .history_cache import history_cache, notify_changed
+from .partitions import create_partition, is_partitioned, month_start
+from .personas import MAX_CUSTOM_PERSONAS, default_personas
+from .vector_store import get_collection, message_metadata
+
+logger = logging.getLogger(__name__)
+
+IMPORT_DIR = Path(os.path.abspath(settings.import_dir))
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="import")
+_running = set()
+_running_lock = threading.Lock()
+
+
+class _Importer:
+    def __init__(self, db, job: models.ImportJob, progress: Callable[[models.ImportJob], None]):
+        self.db = db
+        self.job = job
+        self.progress = progress
+        self.ai_user_id = get_or_create_ai_user(db).id
+        self.custom_ids: Dict[str, int] = {}
+        self.active_personas = db.scalar(
+            select(func.count())
+            .select_from(models.CustomPersona)
+            .where(
+                and_(
+                    models.CustomPersona.user_id == job.user_id,
+                    models.CustomPersona.is_active == True,
+                )
+            )
+        )
+        self.partitioned = is_partitioned(db.connection())
+        self.months = set()
+        self.pending: List[dict] = []
+
+    def run(self) -> None:
+        line_no = self.job.lines_done
+        with open(self.job.source, "r", encoding="utf-8") as f:
+            for line_no, line in enumerate(f, 1):
+                if line_no <= self.job.lines_done or not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                    if record.get("type") == "persona":
+                        self._persona(record)
+                    elif record.get("type") == "message":
+                        self._message(record)
+                    else:
+                        raise ValueError("type must be 'persona' or 'message'")
+                except (ValueError, ValidationError) as e:
+                    self.job.lines_skipped += 1
+                    self.job.last_error = f"line {line_no}: {e}"[:1000]
+                if len(self.pending) >= settings.import_batch_size:
+                    self._flush(line_no)
+        self._flush(line_no)
+
+    def _persona(self, record: dict) -> None:
+        persona = PersonaCreate(**{k: v for k, v in record.items() if k != "type"})
+        key = persona.name.lower()
+        if self._custom_persona_id(key, required=False):
+            return  # already there (imported before, or re-run of this file)
+        if self.active_personas >= MAX_CUSTOM_PERSONAS:
+            raise ValueError(f"persona limit ({MAX_CUSTOM_PERSONAS}) reached")
+
+        self.custom_ids[key] = self.db.scalar(
+            insert(models.CustomPersona)
+            .values(
+                user_id=self.job.user_id,
+                name=persona.name,
+                system_prompt=persona.system_prompt,
+                example_messages=[m.model_dump() for m in persona.example_messages or []],
+                avatar_url=persona.avatar_url,
+                description=persona.description,
+            )
+            .returning(models.CustomPersona.id)
+        )
+        self.active_personas += 1
+        self.job.personas_imported += 1
+
+    def _custom_persona_id(self, key: str, required: bool = True) -> Optional[int]:
+        if key not in self.custom_ids:
+            persona_id = self.db.scalar(
+                select(models.CustomPersona.id).where(
+                    and_(
+                        models.CustomPersona.user_id == self.job.user_id,
+                        func.lower(models.CustomPersona.name) == key,
+                        models.CustomPersona.is_active == True,
+                    )
+                )
+            )
+            if persona_id is None:
+                if required:
+                    raise ValueError(f"unknown custom persona '{key}'")
+                return None
+            self.custom_ids[key] = persona_id
+        return self.custom_ids[key]
+
+    def _message(self, record: dict) -> None:
+        message = ImportedMessage(**{k: v for k, v in record.items() if k != "type"})
+        if message.custom_persona:
+            persona_id = self._custom_persona_id(message.custom_persona.lower())
+            session_id = session_id_for(self.job.user_id, custom_persona_id=persona_id)
+        else:
+            default = default_personas().get(message.persona.lower())
+            if default is None:
+                raise ValueError(f"unknown persona '{message.persona}'")
+            session_id = session_id_for(self.job.user_id, default["persona"])
+
+        timestamp = message.timestamp or datetime.utcnow()
+        if timestamp.tzinfo:
+            timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+        is_ai = message.role == "ai"
+        self.pending.append(
+            {
+                "sender_id": self.ai_user_id if is_ai else self.job.user_id,
+                "receiver_id": self.job.user_id if is_ai else self.ai_user_id,
+                "content": message.content,
+                "is_ai": is_ai,
+                "is_read": True,
+                "timestamp": timestamp,
+                "meta_data": {"session_id": session_id},
+            }
+        )
+
+    def _flush(self, line_no: int) -> None:
+        rows, self.pending = self.pending, []
+        ids = []
+        if rows:
+            if self.partitioned:
+                for month in {month_start(row["timestamp"]) for row in rows} - self.months:
+                    create_partition(self.db.connection(), month)
+                    self.months.add(month)
+            ids = self.db.scalars(
+                insert(models.Message).returning(
+                    models.Message.id, sort_by_parameter_order=True
+                ),
+                rows,
+            ).all()
+            self._touch_conversations(rows, ids)
+        sessions = {row["meta_data"]["session_id"] for row in rows}
+        notify_changed(self.db, sessions)
+
+        self.job.lines_done = line_no
+        self.job.messages_imported += len(rows)
+        self.db.commit()
+        for session_id in sessions:
+            history_cache.invalidate(session_id)
+
+        if rows:
+            self._embed(rows, ids)
+        self.progress(self.job)
+
+    def _touch_conversations(self, rows: List[dict], ids: List[int]) -> None:
+        latest = {}
+        for row, message_id in zip(rows, ids):
+            session_id = row["meta_data"]["session_id"]
+            if session_id not in latest or (row["timestamp"], message_id) > latest[session_id][:2]:
+                latest[session_id] = (row["timestamp"], message_id, row)
+
+        stmt = pg_insert(models.Conversation).values(
+            [
+                {
+                    "user_id": self.job.user_id,
+                    "session_id": session_id,
+                    "persona_key": persona_key_for(session_id),
+                    "last_message_id": message_id,
+                    "last_message_at": timestamp,
+                    "last_message_preview": row["content"][:PREVIEW_LENGTH],
+                    "last_message_is_ai": row["is_ai"],
+                    "unread_count": 0,
+                }
+                for session_id, (timestamp, message_id, row) in latest.items()
+            ]
+        )
+        columns = ["last_message_id", "last_message_at", "last_message_preview", "last_message_is_ai"]
+        self.db.execute(
+            stmt.on_conflict_do_update(
+                index_elements=["user_id", "session_id"],
+                set_={column: stmt.excluded[column] for column in columns},
+                # Imported history never replaces a newer live message.
+                where=stmt.excluded.last_message_at >= models.Conversation.last_message_at,
+            )
+        )
+
+    def _embed(self, rows: List[dict], ids: List[int]) -> None:
+        documents = [row["content"] for row in rows]
+        get_collection().add(
+            ids=[str(message_id) for message_id in ids],
+            documents=documents,
+            embeddings=encode(documents),
+            metadatas=[
+                message_metadata(
+                    row["meta_data"]["session_id"], row["is_ai"], self.job.user_id, row["timestamp"]
+                )
+                for row in rows
+            ],
+        )
+
+
+def _log_progress(job: models.ImportJob) -> None:
+    logger.info(
+        "Import %s: %d lines, %d messages, %d personas, %d skipped",
+        job.id, job.lines_done, job.messages_imported, job.personas_imported, job.lines_skipped,
+    )
+
+
+def create_job(db, user_id: int, source: Path) -> models.ImportJob:
+    job = models.ImportJob(id=uuid.uuid4().hex, user_id=user_id, source=str(source))
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def run_job(job_id: str, progress: Callable[[models.ImportJob], None] = _log_progress) -> None:
+    """Run or resume a job; a job already running in another worker is left alone."""
+    with engine.connect() as lock_conn:
+        if not lock_conn.execute(
+            text("SELECT pg_try_advisory_lock(hashtext(:key))"), {"key": f"import:{job_id}"}
+        ).scalar():
+            return
+        db = SessionLocal()
+        try:
+            job = db.get(models.ImportJob, job_id)
+            if job is None or job.status == "done":
+                return
+            job.status = "running"
+            db.commit()
+            try:
+                _Importer(db, job, progress).run()
+            except Exception as e:
+                db.rollback()
+                job.status = "failed"
+                job.last_error = str(e)[:1000]
+                db.commit()
+                logger.exception("Import %s failed", job_id)
+                return
+            job.status = "done"
+            db.commit()
+            source = Path(job.source)
+            if source.parent == IMPORT_DIR:
+                source.unlink(missing_ok=True)  # uploaded copy, no longer needed
+        finally:
+            db.close()
+            lock_conn.execute(
+                text("SELECT pg_advisory_unlock(hashtext(:key))"), {"key": f"import:{job_id}"}
+            )
+
+
+def is_running(job_id: str) -> bool:
+    with _running_lock:
+        return job_id in _running
+
+
+def submit(job_id: str) -> None:
+    """Run a job on this worker's background import thread."""
+
+    def task():
+        try:
+            run_job(job_id)
+        finally:
+            with _running_lock:
+                _running.discard(job_id)
+
+    with _running_lock:
+        if job_id in _running:
+            return
+        _running.add(job_id)
+    _executor.submit(task)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import conversations and personas from NDJSON")
+    parser.add_argument("source", nargs="?", help="NDJSON file")
+    user = parser.add_mutually_exclusive_group()
+    user.add_argument("--user-id", type=int)
+    user.add_argument("--email")
+    parser.add_argument("--resume", metavar="JOB_ID", help="continue an interrupted import")
+    args = parser.parse_args()
+    init_db()
+
+    def report(job):
+        print(
+            f"{job.lines_done} lines  {job.messages_imported} messages  "
+            f"{job.personas_imported} personas  {job.lines_skipped} skipped",
+            file=sys.stderr,
+        )
+
+    job_id = args.resume
+    if not job_id:
+        if not args.source or not (args.user_id or args.email):
+            parser.error("source and --user-id/--email are required unless --resume is given")
+        with SessionLocal() as db:
+            user_id = args.user_id or db.scalar(
+                select(models.User.id).where(models.User.email == args.email)
+            )
+            if user_id is None:
+                parser.error(f"no user with email {args.email}")
+            job_id = create_job(db, user_id, Path(os.path.abspath(args.source))).id
+        print(f"import job {job_id}", file=sys.stderr)
+
+    run_job(job_id, progress=report)
+    with SessionLocal() as db:
+        job = db.get(models.ImportJob, job_id)
+        print(f"{job.status}: {job.last_error or 'no errors'}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,438 @@
+"""Pooled client for OpenAI-compatible chat completion APIs (Groq by default).
+
+One ``LLMProvider`` is shared by the whole process so every chat turn reuses
+the same keep-alive connections.  Each call gets a deadline, retries transient
+failures with jittered exponential backoff, can hedge slow requests, trips a
+per-model circuit breaker and walks the configured fallback models before
+giving up with an ``LLMError``.
+"""
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from collections import deque
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence
+import logging
+import random
+import threading
+import time
+
+import httpx
+
+from .config import settings
+from .metrics import (
+    LLM_FALLBACKS,
+    LLM_HEDGES,
+    LLM_REQUEST_SECONDS,
+    LLM_REQUESTS,
+    LLM_TOKENS,
+)
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+ROLE_BY_MESSAGE_TYPE = {"system": "system", "human": "user", "ai": "assistant"}
+
+
+class LLMError(Exception):
+    """Raised when no configured model could produce a completion."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class LLMTimeoutError(LLMError):
+    pass
+
+
+class CircuitOpenError(LLMError):
+    pass
+
+
+class _RetryableError(LLMError):
+    pass
+
+
+@dataclass
+class Completion:
+    text: str
+    model: str
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+
+class CircuitBreaker:
+    """Closed -> open after N consecutive failures -> half-open after a cool-down."""
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+        self._probe_owner: Optional[int] = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self.reset_seconds:
+                return "half_open"
+            return "open"
+
+    def retry_after(self) -> float:
+        with self._lock:
+            if self._opened_at is None:
+                return 0.0
+            return max(0.0, self.reset_seconds - (time.monotonic() - self._opened_at))
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_seconds:
+                return False
+            # Half-open: let exactly one probe through.
+            if self._probing:
+                return False
+            self._probing = True
+            self._probe_owner = threading.get_ident()
+            return True
+
+    def release_probe(self) -> None:
+        """Give back a probe this thread took but never recorded an outcome for."""
+        with self._lock:
+            if self._probing and self._probe_owner == threading.get_ident():
+                self._probing = False
+                self._probe_owner = None
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+            self._probe_owner = None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._probing = False
+            self._probe_owner = None
+
+
+class _LatencyWindow:
+    """Rolling window of successful call latencies, used to pick the hedge delay."""
+
+    def __init__(self, size: int = 256, min_samples: int = 50):
+        self._samples = deque(maxlen=size)
+        self._min_samples = min_samples
+
+    def add(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        samples = list(self._samples)
+        if len(samples) < self._min_samples:
+            return None
+        samples.sort()
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+def from_langchain_messages(messages) -> List[Dict[str, str]]:
+    """Convert LangChain messages into the OpenAI ``messages`` payload."""
+    return [
+        {"role": ROLE_BY_MESSAGE_TYPE.get(msg.type, "user"), "content": msg.content}
+        for msg in messages
+    ]
+
+
+class LLMProvider:
+    def __init__(
+        self,
+        base_url: str,
+        api_key: str,
+        models: Sequence[str],
+        temperature: float = 0.8,
+        timeout: float = 20.0,
+        connect_timeout: float = 3.0,
+        max_retries: int = 2,
+        backoff_base: float = 0.25,
+        backoff_max: float = 4.0,
+        hedge_after: Optional[float] = None,
+        breaker_failure_threshold: int = 5,
+        breaker_reset_seconds: float = 30.0,
+        max_connections: int = 50,
+        transport: Optional[httpx.BaseTransport] = None,
+    ):
+        if not models:
+            raise ValueError("At least one model must be configured")
+        self.models = list(models)
+        self.temperature = temperature
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        # None disables hedging, 0 hedges after the observed p95 latency.
+        self.hedge_after = hedge_after
+
+        self._client = httpx.Client(
+            base_url=base_url.rstrip("/"),
+            headers={"Authorization": f"Bearer {api_key}"},
+            timeout=httpx.Timeout(timeout, connect=connect_timeout),
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+            ),
+            transport=transport,
+        )
+        self._breakers = {
+            model: CircuitBreaker(breaker_failure_threshold, breaker_reset_seconds)
+            for model in self.models
+        }
+        self._latency = _LatencyWindow()
+        self._hedge_pool = (
+            ThreadPoolExecutor(max_workers=max_connections, thread_name_prefix="llm-hedge")
+            if hedge_after is not None
+            else None
+        )
+
+    def close(self) -> None:
+        self._client.close()
+        if self._hedge_pool:
+            self._hedge_pool.shutdown(wait=False)
+
+    def complete(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: Optional[float] = None,
+        timeout: Optional[float] = None,
+        models: Optional[Sequence[str]] = None,
+    ) -> Completion:
+        """Return a completion from the first healthy model within the deadline."""
+        deadline = time.monotonic() + (timeout or self.timeout)
+        temperature = self.temperature if temperature is None else temperature
+        last_error: Optional[LLMError] = None
+
+        for position, model in enumerate(models or self.models):
+            # Before allow(): a half-open breaker hands out a single probe.
+            if time.monotonic() >= deadline:
+                last_error = LLMTimeoutError("LLM deadline exceeded")
+                break
+            breaker = self._breaker(model)
+            if not breaker.allow():
+                last_error = CircuitOpenError(
+                    f"Circuit open for {model}", retry_after=breaker.retry_after()
+                )
+                LLM_REQUESTS.labels(model, "circuit_open").inc()
+                continue
+
+            body = {"model": model, "messages": messages, "temperature": temperature}
+            try:
+                completion = self._complete_with_retries(model, body, breaker, deadline)
+            except LLMError as e:
+                logger.warning("LLM model %s failed: %s", model, e)
+                last_error = e
+                continue
+            finally:
+                # A probe that ran out of deadline (or hit an unexpected error)
+                # must not keep the circuit open forever.
+                breaker.release_probe()
+
+            if position > 0:
+                logger.warning("LLM served by fallback model %s", model)
+                LLM_FALLBACKS.labels(model).inc()
+            return completion
+
+        raise last_error or LLMError("No LLM model available")
+
+    def _breaker(self, model: str) -> CircuitBreaker:
+        breaker = self._breakers.get(model)
+        if breaker is None:
+            first = next(iter(self._breakers.values()))
+            breaker = self._breakers.setdefault(
+                model, CircuitBreaker(first.failure_threshold, first.reset_seconds)
+            )
+        return breaker
+
+    def _complete_with_retries(
+        self, model: str, body: dict, breaker: CircuitBreaker, deadline: float
+    ) -> Completion:
+        last_error: Optional[LLMError] = None
+        for attempt in range(self.max_retries + 1):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            started = time.monotonic()
+            try:
+                completion = self._hedged_post(body, remaining)
+            except _RetryableError as e:
+                breaker.record_failure()
+                last_error = e
+            except LLMError:
+                # Client errors (bad request, auth) are not the model's fault.
+                breaker.record_success()
+                raise
+            else:
+                breaker.record_success()
+                self._latency.add(time.monotonic() - started)
+                return completion
+
+            if attempt == self.max_retries or not breaker.allow():
+                break
+            # Full jitter keeps synchronized clients from retrying in lockstep.
+            delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2**attempt))
+            if last_error.retry_after:
+                delay = max(delay, last_error.retry_after)
+            if time.monotonic() + delay >= deadline:
+                break
+            time.sleep(delay)
+
+        if last_error is None:
+            raise LLMTimeoutError(f"Deadline exceeded before calling {model}")
+        raise LLMError(str(last_error), retry_after=last_error.retry_after)
+
+    def _hedged_post(self, body: dict, timeout: float) -> Completion:
+        hedge_after = self._hedge_delay()
+        if hedge_after is None or hedge_after >= timeout:
+            return self._post(body, timeout)
+
+        started = time.monotonic()
+        pending = {self._hedge_pool.submit(self._post, body, timeout)}
+        done, pending = wait(pending, timeout=hedge_after)
+        if not done:
+            LLM_HEDGES.inc()
+            pending.add(self._hedge_pool.submit(self._post, body, timeout - hedge_after))
+
+        errors = []
+        while True:
+            for future in done:
+                try:
+                    # The slower twin keeps running; its result is discarded.
+                    return future.result()
+                except LLMError as e:
+                    errors.append(e)
+            if not pending:
+                raise errors[0]
+            remaining = timeout - (time.monotonic() - started)
+            if remaining <= 0:
+                raise _RetryableError("LLM request timed out")
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+
+    def _hedge_delay(self) -> Optional[float]:
+        if self.hedge_after is None:
+            return None
+        if self.hedge_after > 0:
+            return self.hedge_after
+        return self._latency.percentile(0.95)
+
+    def _post(self, body: dict, timeout: float) -> Completion:
+        model = body["model"]
+        started = time.perf_counter()
+        try:
+            completion = self._send(body, timeout)
+        except _RetryableError:
+            LLM_REQUESTS.labels(model, "retryable_error").inc()
+            raise
+        except LLMError:
+            LLM_REQUESTS.labels(model, "client_error").inc()
+            raise
+        LLM_REQUESTS.labels(model, "success").inc()
+        LLM_REQUEST_SECONDS.labels(model).observe(time.perf_counter() - started)
+        LLM_TOKENS.labels(model, "prompt").inc(completion.prompt_tokens)
+        LLM_TOKENS.labels(model, "completion").inc(completion.completion_tokens)
+        return completion
+
+    def _send(self, body: dict, timeout: float) -> Completion:
+        try:
+            response = self._client.post(
+                "/chat/completions",
+                json=body,
+                timeout=httpx.Timeout(timeout, connect=min(self.connect_timeout, timeout)),
+            )
+        except httpx.TimeoutException as e:
+            raise _RetryableError(f"LLM request timed out: {e}") from e
+        except httpx.TransportError as e:
+            raise _RetryableError(f"LLM transport error: {e}") from e
+
+        if response.status_code in RETRYABLE_STATUS_CODES:
+            raise _RetryableError(
+                f"LLM returned {response.status_code}",
+                retry_after=_parse_retry_after(response.headers.get("retry-after")),
+            )
+        if response.status_code >= 400:
+            raise LLMError(f"LLM returned {response.status_code}: {response.text[:200]}")
+
+        try:
+            data = response.json()
+            text = data["choices"][0]["message"]["content"]
+        except (ValueError, KeyError, IndexError, TypeError) as e:
+            raise _RetryableError(f"Malformed LLM response: {e}") from e
+
+        usage = data.get("usage") or {}
+        return Completion(
+            text=text,
+            model=data.get("model", body["model"]),
+            prompt_tokens=usage.get("prompt_tokens", 0),
+            completion_tokens=usage.get("completion_tokens", 0),
+        )
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
+
+
+_provider: Optional[LLMProvider] = None
+_provider_lock = threading.Lock()
+
+
+def get_llm_provider() -> LLMProvider:
+    """Return the process-wide provider, creating it on first use.
+
+    Creation is lazy so a pre-forking server never shares sockets between workers.
+    """
+    global _provider
+    if _provider is None:
+        with _provider_lock:
+            if _provider is None:
+                fallbacks = [
+                    m.strip() for m in settings.llm_fallback_models.split(",") if m.strip()
+                ]
+                _provider = LLMProvider(
+                    base_url=settings.llm_base_url,
+                    api_key=settings.groq_api_key,
+                    models=[settings.llm_model, *fallbacks],
+                    temperature=settings.llm_temperature,
+                    timeout=settings.llm_timeout_seconds,
+                    connect_timeout=settings.llm_connect_timeout_seconds,
+                    max_retries=settings.llm_max_retries,
+                    backoff_base=settings.llm_backoff_base_seconds,
+                    backoff_max=settings.llm_backoff_max_seconds,
+                    hedge_after=(
+                        settings.llm_hedge_after_ms / 1000
+                        if settings.llm_hedge_enabled
+                        else None
+                    ),
+                    breaker_failure_threshold=settings.llm_breaker_failure_threshold,
+                    breaker_reset_seconds=settings.llm_breaker_reset_seconds,
+                    max_connections=settings.llm_max_connections,
+                )
+    return _provider
+
+
+def close_llm_provider() -> None:
+    global _provider
+    with _provider_lock:
+        if _provider is not None:
+            _provider.close()
+            _provider = None
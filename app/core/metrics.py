@@ -0,0 +1,214 @@
+"""Prometheus metrics for the chat pipeline, exposed on ``/metrics``.
+
+Stages of a chat turn are timed with ``stage("name")``; the remaining
+counters are updated where the work happens (LLM provider, embeddings,
+vector store, rate limiter).  Set ``PROMETHEUS_MULTIPROC_DIR`` when running
+several workers so the endpoint aggregates all of them.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+import os
+import time
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client.core import GaugeMetricFamily
+from sqlalchemy import event
+
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30,
+)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+DB_QUERIES_PER_REQUEST = Histogram(
+    "db_queries_per_request",
+    "SQL statements issued per HTTP request",
+    ["method", "route"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144),
+)
+CHAT_STAGE_SECONDS = Histogram(
+    "chat_stage_seconds",
+    "Time spent in each stage of a chat turn",
+    ["stage"],
+    buckets=LATENCY_BUCKETS,
+)
+CHAT_STAGE_ERRORS = Counter(
+    "chat_stage_errors_total", "Exceptions raised per chat stage", ["stage"]
+)
+
+LLM_REQUESTS = Counter(
+    "llm_requests_total", "LLM HTTP attempts by outcome", ["model", "outcome"]
+)
+LLM_REQUEST_SECONDS = Histogram(
+    "llm_request_seconds", "Latency of successful LLM calls", ["model"], buckets=LATENCY_BUCKETS
+)
+LLM_TOKENS = Counter(
+    "llm_tokens_total", "Tokens sent to and received from the LLM", ["model", "direction"]
+)
+LLM_FALLBACKS = Counter(
+    "llm_fallbacks_total", "Completions served by a fallback model", ["model"]
+)
+LLM_HEDGES = Counter("llm_hedged_requests_total", "Hedge requests issued")
+LLM_ADMISSION_REJECTED = Counter(
+    "llm_admission_rejected_total", "Chat turns shed by LLM admission control"
+)
+
+EMBEDDING_BATCH_SIZE = Histogram(
+    "embedding_batch_size",
+    "Texts per embedding forward pass",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512),
+)
+EMBEDDING_SECONDS = Histogram(
+    "embedding_seconds", "Embedding forward pass latency", buckets=LATENCY_BUCKETS
+)
+EMBEDDING_BATCH_REQUESTS = Histogram(
+    "embedding_batch_requests",
+    "Callers served by one coalesced embedding forward pass",
+    buckets=(1, 2, 4, 8, 16, 32, 64),
+)
+EMBEDDING_QUEUE_SECONDS = Histogram(
+    "embedding_queue_seconds",
+    "Time an embedding request waited for its batch to start",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25),
+)
+HISTORY_CACHE_REQUESTS = Counter(
+    "history_cache_requests_total", "Session history lookups by result", ["result"]
+)
+VECTOR_STORE_SECONDS = Histogram(
+    "vector_store_seconds", "Vector store latency", ["operation"], buckets=LATENCY_BUCKETS
+)
+
+RATE_LIMITED = Counter(
+    "rate_limited_requests_total", "Requests rejected by the rate limiter", ["rule"]
+)
+
+
+# Per-request counters shared with threadpool workers through the copied context.
+_request_stats: ContextVar[Optional[dict]] = ContextVar("request_stats", default=None)
+
+
+def instrument_engine(engine) -> None:
+    """Count SQL statements against the HTTP request that issued them."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _count_query(conn, cursor, statement, parameters, context, executemany):
+        stats = _request_stats.get()
+        if stats is not None:
+            stats["queries"] += 1
+
+
+@contextmanager
+def stage(name: str):
+    """Time a block as one chat stage; exceptions are counted and re-raised."""
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        CHAT_STAGE_ERRORS.labels(name).inc()
+        raise
+    finally:
+        CHAT_STAGE_SECONDS.labels(name).observe(time.perf_counter() - started)
+
+
+@contextmanager
+def timed(histogram):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.observe(time.perf_counter() - started)
+
+
+class _RuntimeCollector:
+    """Point-in-time gauges read on scrape: DB pool and LLM admission state.
+
+    With several workers they are those of the worker answering the scrape.
+    """
+
+    def describe(self):
+        # Without it registering calls collect(), which imports modules that
+        # import this one.
+        return []
+
+    def collect(self):
+        from .database import engine
+        from .ratelimit import llm_admission
+
+        pool = GaugeMetricFamily(
+            "db_pool_connections", "SQLAlchemy pool connections by state", labels=["state"]
+        )
+        status = engine.pool
+        if hasattr(status, "checkedout"):
+            pool.add_metric(["checked_out"], status.checkedout())
+            pool.add_metric(["idle"], status.checkedin())
+            pool.add_metric(["overflow"], max(0, status.overflow()))
+            pool.add_metric(["size"], status.size())
+        yield pool
+
+        admission = GaugeMetricFamily(
+            "llm_admission_slots", "LLM admission controller state", labels=["state"]
+        )
+        admission.add_metric(["active"], llm_admission.active)
+        admission.add_metric(["waiting"], llm_admission.waiting)
+        yield admission
+
+
+MULTIPROCESS = bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+if not MULTIPROCESS:
+    REGISTRY.register(_RuntimeCollector())
+
+
+def render_latest() -> bytes:
+    if MULTIPROCESS:
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(_RuntimeCollector())
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
+
+class MetricsMiddleware:
+    """Records request latency labelled by route template, not raw path."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        started = time.perf_counter()
+        status_code = 500
+        stats = {"queries": 0}
+        token = _request_stats.set(stats)
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_stats.reset(token)
+            route = getattr(scope.get("route"), "path", "unmatched")
+            HTTP_REQUEST_SECONDS.labels(scope["method"], route, str(status_code)).observe(
+                time.perf_counter() - started
+            )
+            DB_QUERIES_PER_REQUEST.labels(scope["method"], route).observe(stats["queries"])
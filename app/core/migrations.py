@@ -0,0 +1,105 @@
+"""Schema changes that ``create_all`` does not apply to existing tables.
+
+``create_all`` only creates missing tables, so indexes declared later in
+``models`` never reach a database created before them.  ``run_migrations``
+creates the missing tables, backfills the ones registered in
+``AFTER_CREATE``, then creates every declared index that is missing (after the
+data fix-up registered for it, if any).  Everything runs in one transaction
+guarded by an advisory lock so that several workers starting together do not
+race.
+"""
+
+from sqlalchemy import inspect, text
+import logging
+
+from .database import Base
+from .partitions import ensure_partitions
+
+logger = logging.getLogger(__name__)
+
+MIGRATION_LOCK_KEY = "your_friend:migrations"
+
+
+def _deactivate_duplicate_persona_names(conn):
+    """Keep the oldest active persona per (user, lower(name)) before the unique index."""
+    result = conn.execute(
+        text(
+            """
+            UPDATE custom_personas AS p SET is_active = false
+            WHERE p.is_active AND EXISTS (
+                SELECT 1 FROM custom_personas AS q
+                WHERE q.user_id = p.user_id AND lower(q.name) = lower(p.name)
+                  AND q.is_active AND q.id < p.id
+            )
+            """
+        )
+    )
+    if result.rowcount:
+        logger.warning("Deactivated %d duplicate custom personas", result.rowcount)
+
+
+def _backfill_conversations(conn):
+    """One inbox row per existing session, from its latest message.
+
+    Messages written before the inbox existed count as read.
+    """
+    result = conn.execute(
+        text(
+            """
+            INSERT INTO conversations (
+                user_id, session_id, persona_key, last_message_id, last_message_at,
+                last_message_preview, last_message_is_ai, unread_count
+            )
+            SELECT DISTINCT ON (owner_id, session_id)
+                owner_id, session_id, substr(session_id, strpos(session_id, '_') + 1),
+                id, timestamp, left(coalesce(content, ''), 200), coalesce(is_ai, false), 0
+            FROM (
+                SELECT m.id, m.timestamp, m.content, m.is_ai,
+                       CASE WHEN m.is_ai THEN m.receiver_id ELSE m.sender_id END AS owner_id,
+                       m.meta_data ->> 'session_id' AS session_id
+                FROM messages AS m
+                WHERE m.meta_data ->> 'session_id' IS NOT NULL AND m.timestamp IS NOT NULL
+            ) AS latest
+            ORDER BY owner_id, session_id, timestamp DESC, id DESC
+            ON CONFLICT DO NOTHING
+            """
+        )
+    )
+    logger.info("Backfilled %d conversations", result.rowcount)
+
+
+# Table name -> backfill run right after the table is first created.
+AFTER_CREATE = {
+    "messages": ensure_partitions,
+    "conversations": _backfill_conversations,
+}
+
+# Index name -> fix-up that must run before the index can be created.
+BEFORE_INDEX = {
+    "uq_custom_personas_user_active_name": _deactivate_duplicate_persona_names,
+}
+
+
+def run_migrations(engine) -> None:
+    with engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            conn.execute(
+                text("SELECT pg_advisory_xact_lock(hashtext(:key))"),
+                {"key": MIGRATION_LOCK_KEY},
+            )
+        existing_tables = set(inspect(conn).get_table_names())
+        Base.metadata.create_all(bind=conn)
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables and table.name in AFTER_CREATE:
+                AFTER_CREATE[table.name](conn)
+
+        inspector = inspect(conn)
+        for table in Base.metadata.sorted_tables:
+            existing = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name in existing:
+                    continue
+                if index.name in BEFORE_INDEX:
+                    BEFORE_INDEX[index.name](conn)
+                logger.info("Creating index %s", index.name)
+                index.create(conn)
@@ -66,3 +66,12 @@ def get_current_user(token: str = Depends(oauth2_scheme),
     
     return user
 
+
+def get_current_admin(current_user: models.User = Depends(get_current_user)):
+    admins = {email.strip().lower() for email in settings.admin_emails.split(',') if email.strip()}
+    if not current_user or current_user.email.lower() not in admins:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail='Admin access required')
+
+    return current_user
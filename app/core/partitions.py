@@ -0,0 +1,328 @@
+"""Monthly range partitions of ``messages`` and their retention.
+
+``messages`` is partitioned by ``RANGE (timestamp)`` into ``messages_pYYYY_MM``
+tables plus a ``messages_default`` catch-all.  ``maintain()`` keeps
+``MESSAGES_PARTITION_MONTHS_AHEAD`` future months created and, when
+``MESSAGES_RETENTION_MONTHS`` is set, detaches the months before the window,
+writes them to ``core.archive`` files and drops them.  It runs in a
+background thread in every worker; an advisory lock lets only one of them do
+the work at a time.  A partition left detached by an interrupted run is
+picked up again on the next one.  The same thread also deletes idle shared
+rate-limit buckets (``core.ratelimit.purge_idle_buckets``).
+
+Databases created before partitioning are converted once, with the app
+stopped::
+
+    uv run python -m core.partitions convert
+    uv run python -m core.partitions maintain   # one maintenance pass
+"""
+
+from datetime import date, datetime
+from typing import Iterator, List, Optional, Tuple
+import argparse
+import logging
+import threading
+import time
+
+from sqlalchemy import text
+
+from .archive import MonthArchiveWriter
+from .config import settings
+from .history_cache import ALL_SESSIONS, history_cache, notify_changed
+
+logger = logging.getLogger(__name__)
+
+PARENT = "messages"
+DEFAULT_PARTITION = "messages_default"
+PARTITION_PATTERN = r"^messages_p[0-9]{4}_[0-9]{2}$"
+MAINTENANCE_LOCK_KEY = "your_friend:message_partitions"
+
+
+def month_start(value) -> date:
+    return date(value.year, value.month, 1)
+
+
+def add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"messages_p{month:%Y_%m}"
+
+
+def partition_month(name: str) -> Optional[date]:
+    try:
+        return datetime.strptime(name, "messages_p%Y_%m").date()
+    except ValueError:
+        return None
+
+
+def is_partitioned(conn) -> bool:
+    return bool(
+        conn.execute(
+            text(
+                "SELECT relkind = 'p' FROM pg_class "
+                "WHERE oid = to_regclass(:name)"
+            ),
+            {"name": PARENT},
+        ).scalar()
+    )
+
+
+def attached_partitions(conn) -> List[str]:
+    rows = conn.execute(
+        text(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class AS child ON child.oid = pg_inherits.inhrelid "
+            "WHERE pg_inherits.inhparent = to_regclass(:name)"
+        ),
+        {"name": PARENT},
+    )
+    return [name for (name,) in rows]
+
+
+_oldest_month = {"checked_at": float("-inf"), "month": None}
+
+
+def oldest_month(conn) -> Optional[date]:
+    """First month with its own partition, None if ``messages`` is not partitioned.
+
+    Cached for a minute; maintenance only ever removes the oldest months.
+    """
+    if time.monotonic() - _oldest_month["checked_at"] > 60:
+        months = [partition_month(name) for name in attached_partitions(conn)]
+        _oldest_month["month"] = min((m for m in months if m), default=None)
+        _oldest_month["checked_at"] = time.monotonic()
+    return _oldest_month["month"]
+
+
+def recent_month_ranges(conn) -> Iterator[Tuple[Optional[datetime], Optional[datetime]]]:
+    """``(lower, upper)`` timestamp bounds covering all of ``messages``, newest first.
+
+    This month onwards, then spans doubling back to the oldest partition, then
+    everything before it (the default partition).  Readers that stop once they
+    have enough rows only plan and scan the months they needed.
+    """
+    oldest = oldest_month(conn)
+    if oldest is None:
+        yield None, None
+        return
+    floor = datetime(oldest.year, oldest.month, 1)
+    now = datetime.utcnow()
+    upper, lower, span = None, datetime(now.year, now.month, 1), 1
+    while True:
+        lower = max(lower, floor)
+        yield lower, upper
+        if lower <= floor:
+            break
+        back = add_months(lower.date(), -span)
+        upper, lower, span = lower, datetime(back.year, back.month, 1), span * 2
+    yield None, floor
+
+
+def detached_partitions(conn) -> List[str]:
+    """Month tables an interrupted archive run detached but did not drop."""
+    rows = conn.execute(
+        text(
+            "SELECT relname FROM pg_class "
+            "WHERE relkind = 'r' AND NOT relispartition AND relname ~ :pattern "
+            "AND relnamespace = current_schema()::regnamespace"
+        ),
+        {"pattern": PARTITION_PATTERN},
+    )
+    return [name for (name,) in rows]
+
+
+def create_partition(conn, month: date) -> None:
+    """Create and attach one month, moving any of its rows out of the default partition."""
+    name = partition_name(month)
+    if name in attached_partitions(conn):
+        return
+    lower, upper = month.isoformat(), add_months(month, 1).isoformat()
+    conn.execute(text(f'CREATE TABLE "{name}" (LIKE {PARENT} INCLUDING DEFAULTS)'))
+    if DEFAULT_PARTITION in attached_partitions(conn):
+        conn.execute(
+            text(
+                f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} "
+                f"WHERE timestamp >= :lower AND timestamp < :upper RETURNING *) "
+                f'INSERT INTO "{name}" SELECT * FROM moved'
+            ),
+            {"lower": lower, "upper": upper},
+        )
+    conn.execute(
+        text(
+            f'ALTER TABLE {PARENT} ATTACH PARTITION "{name}" '
+            f"FOR VALUES FROM ('{lower}') TO ('{upper}')"
+        )
+    )
+    logger.info("Created partition %s", name)
+
+
+def ensure_partitions(conn, first: Optional[date] = None) -> None:
+    """Partitions from ``first`` (default: this month) through the months ahead."""
+    current = month_start(datetime.utcnow())
+    month = first or current
+    last = add_months(current, settings.messages_partition_months_ahead)
+    conn.execute(
+        text(f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF {PARENT} DEFAULT")
+    )
+    while month <= last:
+        create_partition(conn, month)
+        month = add_months(month, 1)
+
+
+def archive_partition(engine, name: str) -> None:
+    """Detach a month, write it to per-user archive files, then drop it."""
+    month = partition_month(name)
+    with engine.begin() as conn:
+        if name in attached_partitions(conn):
+            conn.execute(text(f'ALTER TABLE {PARENT} DETACH PARTITION "{name}"'))
+
+    writer = MonthArchiveWriter(f"{month:%Y-%m}")
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=1000).execute(
+            text(
+                "SELECT id, sender_id, receiver_id, content, content_type, voice_file, "
+                "timestamp, is_read, is_ai, meta_data, "
+                "coalesce(CASE WHEN is_ai THEN receiver_id ELSE sender_id END, 0) AS owner_id "
+                f'FROM "{name}" ORDER BY owner_id, timestamp, id'
+            )
+        )
+        for row in result.mappings():
+            record = dict(row)
+            owner_id = record.pop("owner_id")
+            record["timestamp"] = record["timestamp"].isoformat()
+            writer.write(owner_id, record)
+    writer.close()
+
+    with engine.begin() as conn:
+        conn.execute(text(f'DROP TABLE "{name}"'))
+        notify_changed(conn, [ALL_SESSIONS])
+    history_cache.invalidate_all()
+    logger.info("Archived %s: %d messages in %d files", name, writer.rows, writer.files)
+
+
+def maintain(engine=None) -> bool:
+    """One maintenance pass; returns False if another worker holds the lock."""
+    if engine is None:
+        from .database import engine
+
+    with engine.connect() as lock_conn:
+        acquired = lock_conn.execute(
+            text("SELECT pg_try_advisory_lock(hashtext(:key))"), {"key": MAINTENANCE_LOCK_KEY}
+        ).scalar()
+        if not acquired:
+            return False
+        try:
+            with engine.begin() as conn:
+                if not is_partitioned(conn):
+                    logger.info("messages is not partitioned; run `python -m core.partitions convert`")
+                    return True
+                ensure_partitions(conn)
+
+            if settings.messages_retention_months > 0:
+                cutoff = add_months(
+                    month_start(datetime.utcnow()), -settings.messages_retention_months
+                )
+                with engine.connect() as conn:
+                    expired = [
+                        name
+                        for name in attached_partitions(conn) + detached_partitions(conn)
+                        if partition_month(name) and partition_month(name) < cutoff
+                    ]
+                for name in sorted(set(expired)):
+                    archive_partition(engine, name)
+        finally:
+            lock_conn.execute(
+                text("SELECT pg_advisory_unlock(hashtext(:key))"), {"key": MAINTENANCE_LOCK_KEY}
+            )
+    return True
+
+
+def convert(engine) -> None:
+    """Rebuild an unpartitioned ``messages`` as a partitioned table, in one transaction."""
+    from models import models
+
+    table = models.Message.__table__
+    with engine.begin() as conn:
+        conn.execute(
+            text("SELECT pg_advisory_xact_lock(hashtext(:key))"), {"key": MAINTENANCE_LOCK_KEY}
+        )
+        if is_partitioned(conn):
+            logger.info("messages is already partitioned")
+            return
+
+        conn.execute(text("ALTER TABLE messages RENAME TO messages_unpartitioned"))
+        conn.execute(text("ALTER INDEX messages_pkey RENAME TO messages_unpartitioned_pkey"))
+        conn.execute(text("ALTER SEQUENCE messages_id_seq RENAME TO messages_unpartitioned_id_seq"))
+        for index in table.indexes:
+            conn.execute(text(f'ALTER INDEX IF EXISTS "{index.name}" RENAME TO "{index.name}_old"'))
+        table.create(conn)
+
+        oldest = conn.execute(text("SELECT min(timestamp) FROM messages_unpartitioned")).scalar()
+        ensure_partitions(conn, first=month_start(oldest) if oldest else None)
+
+        columns = ", ".join(f'"{column.name}"' for column in table.columns)
+        values = ", ".join(
+            "coalesce(timestamp, now() AT TIME ZONE 'utc')" if column.name == "timestamp"
+            else f'"{column.name}"'
+            for column in table.columns
+        )
+        moved = conn.execute(
+            text(f"INSERT INTO messages ({columns}) SELECT {values} FROM messages_unpartitioned")
+        ).rowcount
+        conn.execute(
+            text(
+                "SELECT setval('messages_id_seq', "
+                "(SELECT coalesce(max(id), 0) + 1 FROM messages), false)"
+            )
+        )
+        conn.execute(text("DROP TABLE messages_unpartitioned"))
+    logger.info("Converted messages to monthly partitions (%d rows)", moved)
+
+
+class PartitionMaintainer(threading.Thread):
+    def __init__(self, interval: float):
+        super().__init__(name="partition-maintainer", daemon=True)
+        self.interval = interval
+        self._stopped = threading.Event()
+
+    def run(self):
+        from .ratelimit import purge_idle_buckets
+
+        while not self._stopped.is_set():
+            try:
+                maintain()
+            except Exception:
+                logger.exception("Partition maintenance failed")
+            # Shared rate-limit buckets are upserted per key and never removed
+            # by the requests themselves.
+            try:
+                purged = purge_idle_buckets()
+                if purged:
+                    logger.info("Purged %d idle rate-limit buckets", purged)
+            except Exception:
+                logger.exception("Rate-limit bucket cleanup failed")
+            self._stopped.wait(self.interval)
+
+    def stop(self):
+        self._stopped.set()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage monthly partitions of messages")
+    parser.add_argument("command", choices=["convert", "maintain"])
+    args = parser.parse_args()
+
+    from .database import engine
+    from .log import configure_logging
+
+    configure_logging()
+    if args.command == "convert":
+        convert(engine)
+    maintain(engine)
+
+
+if __name__ == "__main__":
+    main()
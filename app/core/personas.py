@@ -0,0 +1,43 @@
+"""Default personas shipped in ``app/personas``.
+
+The JSON files are read once per process and served from memory, both to
+``AIChatSession`` and to the public ``/personas/catalog`` endpoint.  The
+catalog's ETag is a hash of the files, so it only changes on deploy.
+"""
+
+from functools import lru_cache
+from typing import Dict
+import hashlib
+import json
+
+from .config import BASE_DIR
+
+PERSONAS_DIR = BASE_DIR / "personas"
+MAX_CUSTOM_PERSONAS = 10  # active custom personas per user
+
+
+@lru_cache(maxsize=1)
+def default_personas() -> Dict[str, dict]:
+    """All default personas keyed by lower-case name. Treat as read-only."""
+    personas = {}
+    for path in sorted(PERSONAS_DIR.glob("*.json")):
+        with open(path, "r", encoding="utf-8") as f:
+            personas[path.stem.lower()] = json.load(f)
+    return personas
+
+
+def get_default_persona(name: str) -> dict:
+    persona = default_personas().get(name.lower())
+    if persona is None:
+        raise FileNotFoundError(f"Persona JSON not found at: {PERSONAS_DIR / f'{name.lower()}.json'}")
+    return persona
+
+
+@lru_cache(maxsize=1)
+def catalog() -> tuple:
+    """Serialized catalog body and its ETag."""
+    body = json.dumps(
+        {"personas": [{"key": key, **data} for key, data in default_personas().items()]},
+        ensure_ascii=False,
+    ).encode("utf-8")
+    return body, f'"{hashlib.sha256(body).hexdigest()[:32]}"'
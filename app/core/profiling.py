@@ -0,0 +1,207 @@
+"""Opt-in request profiler for finding out where a slow chat turn went.
+
+With ``PROFILING_ENABLED=true`` every HTTP request gets a provisional
+profile: a background thread samples the Python stack of the worker thread
+serving it every ``PROFILING_INTERVAL_MS`` and the SQL statements it issues
+are recorded from engine events.  The profile is kept if the request was
+picked by ``PROFILING_SAMPLE_RATE`` or took longer than ``PROFILING_SLOW_MS``
+and is otherwise thrown away.  Kept profiles live in a small in-memory ring
+buffer served by ``/admin/profiles``; stacks are in the collapsed format read
+by flamegraph.pl and speedscope.
+
+A thread is attributed to a request when it runs SQL on that request's
+behalf, which covers the sync endpoints (all of the chat path) but not work
+done on the event loop itself.  Statement parameters are never stored.
+
+Disabled (the default), neither the middleware nor the engine hooks are
+installed.
+"""
+
+from collections import Counter, deque
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+
+from sqlalchemy import event
+
+from .config import settings
+
+MAX_STACK_DEPTH = 128
+MAX_STATEMENTS = 500
+EXCLUDED_PREFIXES = ("/admin/profiles", "/metrics")
+
+
+class RequestProfile:
+    def __init__(self, method: str, path: str, sampled: bool):
+        self.id = uuid.uuid4().hex[:12]
+        self.method = method
+        self.path = path
+        self.route: Optional[str] = None
+        self.status: Optional[int] = None
+        self.sampled = sampled
+        self.started_at = datetime.now(timezone.utc)
+        self.duration_ms = 0.0
+        self.stacks: Counter = Counter()
+        self.statements: List[dict] = []
+        self.threads = set()
+        self._started = time.perf_counter()
+
+    def finish(self, status: int, route: Optional[str]) -> None:
+        self.duration_ms = round(1000 * (time.perf_counter() - self._started), 2)
+        self.status = status
+        self.route = route
+
+    def summary(self) -> dict:
+        sql_ms = sum(s["duration_ms"] for s in self.statements)
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "route": self.route,
+            "status": self.status,
+            "started_at": self.started_at.isoformat(),
+            "duration_ms": self.duration_ms,
+            "reason": "sampled" if self.sampled else "slow",
+            "samples": sum(self.stacks.values()),
+            "sql_count": len(self.statements),
+            "sql_ms": round(sql_ms, 2),
+        }
+
+    def collapsed(self) -> str:
+        """Flamegraph input: one ``frame;frame;frame count`` line per stack."""
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+
+
+_current_profile: ContextVar[Optional[RequestProfile]] = ContextVar(
+    "current_profile", default=None
+)
+# Worker thread ident -> profile of the request it is currently serving.
+_threads: Dict[int, RequestProfile] = {}
+recent_profiles: deque = deque(maxlen=settings.profiling_max_profiles)
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    filename = "/".join(code.co_filename.replace(os.sep, "/").rsplit("/", 2)[-2:])
+    return f"{code.co_name} ({filename})"
+
+
+def _collapse(frame) -> str:
+    labels = []
+    while frame is not None and len(labels) < MAX_STACK_DEPTH:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class _Sampler(threading.Thread):
+    def __init__(self, interval: float):
+        super().__init__(name="request-profiler", daemon=True)
+        self.interval = interval
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            if not _threads:
+                continue
+            frames = sys._current_frames()
+            for ident, profile in list(_threads.items()):
+                frame = frames.get(ident)
+                if frame is not None:
+                    profile.stacks[_collapse(frame)] += 1
+
+
+_sampler: Optional[_Sampler] = None
+_sampler_lock = threading.Lock()
+
+
+def _ensure_sampler() -> None:
+    global _sampler
+    with _sampler_lock:
+        if _sampler is None:
+            _sampler = _Sampler(settings.profiling_interval_ms / 1000)
+            _sampler.start()
+
+
+def profile_engine(engine) -> None:
+    """Record statements per profiled request and tie worker threads to it."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        profile = _current_profile.get()
+        ident = threading.get_ident()
+        if profile is None:
+            _threads.pop(ident, None)
+            return
+        _threads[ident] = profile
+        profile.threads.add(ident)
+        conn.info.setdefault("profile_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        profile = _current_profile.get()
+        if profile is None or not conn.info.get("profile_started"):
+            return
+        elapsed = time.perf_counter() - conn.info["profile_started"].pop()
+        if len(profile.statements) < MAX_STATEMENTS:
+            profile.statements.append(
+                {
+                    "statement": " ".join(statement.split())[:2000],
+                    "duration_ms": round(1000 * elapsed, 3),
+                    "executemany": executemany,
+                }
+            )
+
+
+def list_profiles() -> List[dict]:
+    return [profile.summary() for profile in reversed(recent_profiles)]
+
+
+def get_profile(profile_id: str) -> Optional[RequestProfile]:
+    for profile in recent_profiles:
+        if profile.id == profile_id:
+            return profile
+    return None
+
+
+class ProfilingMiddleware:
+    """Profiles every request provisionally and keeps the sampled or slow ones."""
+
+    def __init__(self, app, sample_rate: float, slow_ms: float):
+        self.app = app
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        _ensure_sampler()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(EXCLUDED_PREFIXES):
+            return await self.app(scope, receive, send)
+
+        profile = RequestProfile(
+            scope["method"], scope["path"], sampled=random.random() < self.sample_rate
+        )
+        token = _current_profile.set(profile)
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_profile.reset(token)
+            for ident in profile.threads:
+                if _threads.get(ident) is profile:
+                    _threads.pop(ident, None)
+            profile.finish(status_code, getattr(scope.get("route"), "path", None))
+            if profile.sampled or profile.duration_ms >= self.slow_ms:
+                recent_profiles.append(profile)
@@ -0,0 +1,276 @@
+"""Chat-memory vectors stored as float16 or int8 in a SQLite file.
+
+A drop-in for the parts of a Chroma collection the app uses (``add``,
+``upsert``, ``get``, ``query``, ``delete``, ``count``), selected with
+``VECTOR_STORE_BACKEND=float16`` or ``int8``.  Per vector it keeps:
+
+* the vector as float16 (2 bytes/dim) or as int8 codes with one float32
+  scale (1 byte/dim), plus the float32 squared norm;
+* integer metadata: the message id, a small session id from the ``sessions``
+  table, the user id, role as 0/1 and the timestamp in epoch milliseconds.
+  ``persona`` is derived from the session id on read.
+
+Chat memory is only ever searched within one session, so a query scans that
+session's rows rather than keeping a global ANN index in memory.  int8 scores
+are computed on the integer codes first, with the query quantized too; the best
+``n_results * VECTOR_RERANK_FACTOR`` candidates are then re-scored with the
+unquantized query against their (dequantized) codes.  That removes the query's
+quantization error but not the stored vectors', since no float32 copy is kept.
+Distances are squared L2, the same as Chroma's default.
+
+``bench/vector_quantization.py`` measures size and recall against float32.
+"""
+
+from datetime import datetime, timezone
+from typing import Dict, Optional, Sequence
+import sqlite3
+import threading
+
+import numpy as np
+
+from .config import settings
+from .history import persona_key_for
+
+DTYPES = ("float16", "int8")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS sessions (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE);
+CREATE TABLE IF NOT EXISTS vectors (
+    id INTEGER PRIMARY KEY,
+    session INTEGER NOT NULL,
+    user_id INTEGER,
+    is_ai INTEGER NOT NULL,
+    ts INTEGER,
+    norm REAL NOT NULL,
+    scale REAL,
+    codes BLOB NOT NULL,
+    document TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_vectors_session ON vectors (session);
+CREATE INDEX IF NOT EXISTS ix_vectors_user ON vectors (user_id);
+"""
+
+
+def quantize(vectors: np.ndarray, dtype: str):
+    """(codes, per-vector scales or None) for float32 ``vectors``."""
+    if dtype == "float16":
+        return vectors.astype(np.float16), None
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def dequantize(codes: np.ndarray, scales: Optional[np.ndarray]) -> np.ndarray:
+    if scales is None:
+        return codes.astype(np.float32)
+    return codes.astype(np.float32) * scales[:, None]
+
+
+def _to_ms(timestamp: Optional[str]) -> Optional[int]:
+    if not timestamp:
+        return None
+    parsed = datetime.fromisoformat(timestamp)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp() * 1000)
+
+
+def _from_ms(ms: Optional[int]) -> Optional[str]:
+    if ms is None:
+        return None
+    return datetime.fromtimestamp(ms / 1000, timezone.utc).replace(tzinfo=None).isoformat()
+
+
+class QuantizedCollection:
+    def __init__(self, path: str, name: str, dtype: str, metadata: Optional[dict] = None):
+        if dtype not in DTYPES:
+            raise ValueError(f"Unsupported vector dtype: {dtype}")
+        self.path = path
+        self.name = name
+        self.dtype = dtype
+        self._numpy_dtype = np.float16 if dtype == "float16" else np.int8
+        self._lock = threading.Lock()  # one writer; readers get a connection per thread
+        self._local = threading.local()
+        self._conn = self._connect()
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._sessions: Dict[str, int] = dict(self._conn.execute("SELECT name, id FROM sessions"))
+        for key, value in (metadata or {}).items():
+            self._conn.execute(
+                "INSERT OR IGNORE INTO meta (key, value) VALUES (?, ?)", (key, str(value))
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _reader(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    @property
+    def metadata(self) -> dict:
+        return dict(self._reader().execute("SELECT key, value FROM meta"))
+
+    def _session_key(self, name: str) -> int:
+        key = self._sessions.get(name)
+        if key is None:
+            self._conn.execute("INSERT OR IGNORE INTO sessions (name) VALUES (?)", (name,))
+            key = self._conn.execute("SELECT id FROM sessions WHERE name = ?", (name,)).fetchone()[0]
+            self._sessions[name] = key
+        return key
+
+    def _write(self, verb: str, ids, documents, embeddings, metadatas) -> None:
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        codes, scales = quantize(vectors, self.dtype)
+        norms = np.einsum("ij,ij->i", vectors, vectors)
+        documents = documents if documents is not None else [None] * len(ids)
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                rows = [
+                    (
+                        int(message_id),
+                        self._session_key(meta["session_id"]),
+                        meta.get("user_id"),
+                        int(meta.get("role") == "ai"),
+                        _to_ms(meta.get("timestamp")),
+                        float(norms[i]),
+                        float(scales[i]) if scales is not None else None,
+                        codes[i].tobytes(),
+                        documents[i],
+                    )
+                    for i, (message_id, meta) in enumerate(zip(ids, metadatas))
+                ]
+                self._conn.executemany(
+                    f"{verb} INTO vectors (id, session, user_id, is_ai, ts, norm, scale, codes, document) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                self._sessions = dict(self._conn.execute("SELECT name, id FROM sessions"))
+                raise
+
+    def add(self, ids, embeddings, metadatas, documents=None) -> None:
+        self._write("INSERT OR IGNORE", ids, documents, embeddings, metadatas)
+
+    def upsert(self, ids, embeddings, metadatas, documents=None) -> None:
+        self._write("INSERT OR REPLACE", ids, documents, embeddings, metadatas)
+
+    def delete(self, ids: Optional[Sequence[str]] = None, where: Optional[dict] = None) -> None:
+        clause, params = self._filter(where)
+        if ids is not None:
+            chunk = [int(message_id) for message_id in ids]
+            clause += (" AND " if clause else " WHERE ") + f"id IN ({','.join('?' * len(chunk))})"
+            params += chunk
+        if not clause:
+            raise ValueError("delete needs ids or where")
+        with self._lock:
+            self._conn.execute(f"DELETE FROM vectors{clause}", params)
+
+    def count(self) -> int:
+        return self._reader().execute("SELECT count(*) FROM vectors").fetchone()[0]
+
+    def get(self, ids: Sequence[str], include=()) -> dict:
+        found = []
+        for i in range(0, len(ids), 900):  # SQLite's bound-parameter limit
+            chunk = [int(message_id) for message_id in ids[i : i + 900]]
+            found += self._reader().execute(
+                f"SELECT id FROM vectors WHERE id IN ({','.join('?' * len(chunk))})", chunk
+            ).fetchall()
+        return {"ids": [str(row[0]) for row in found]}
+
+    def _filter(self, where: Optional[dict]):
+        if not where:
+            return "", []
+        clauses, params = [], []
+        for key, value in where.items():
+            if key == "session_id":
+                session = self._sessions.get(value)
+                if session is None:  # possibly added by another process
+                    row = self._reader().execute(
+                        "SELECT id FROM sessions WHERE name = ?", (value,)
+                    ).fetchone()
+                    session = row[0] if row else -1
+                clauses.append("session = ?")
+                params.append(session)
+            elif key == "user_id":
+                clauses.append("user_id = ?")
+                params.append(value)
+            else:
+                raise ValueError(f"Unsupported filter: {key}")
+        return " WHERE " + " AND ".join(clauses), params
+
+    def _search(self, query: np.ndarray, where: Optional[dict], n_results: int):
+        clause, params = self._filter(where)
+        rows = self._reader().execute(
+            f"SELECT id, norm, scale, codes FROM vectors{clause}", params
+        ).fetchall()
+        if not rows:
+            return [], []
+        ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+        norms = np.fromiter((row[1] for row in rows), dtype=np.float32, count=len(rows))
+        codes = np.frombuffer(b"".join(row[3] for row in rows), dtype=self._numpy_dtype).reshape(
+            len(rows), -1
+        )
+        query_norm = float(query @ query)
+
+        if self.dtype == "float16":
+            distances = query_norm + norms - 2.0 * (codes.astype(np.float32) @ query)
+            order = np.argsort(distances)[:n_results]
+            return ids[order].tolist(), distances[order].tolist()
+
+        scales = np.fromiter((row[2] for row in rows), dtype=np.float32, count=len(rows))
+        # Integer pass: int8 query codes against int8 vector codes.
+        query_codes, query_scale = quantize(query[None, :], "int8")
+        dots = (codes.astype(np.int32) @ query_codes[0].astype(np.int32)) * scales * query_scale[0]
+        candidates = np.argsort(query_norm + norms - 2.0 * dots)[
+            : n_results * max(1, settings.vector_rerank_factor)
+        ]
+        # Asymmetric pass: the unquantized query against the candidates' codes.
+        dots = dequantize(codes[candidates], scales[candidates]) @ query
+        distances = query_norm + norms[candidates] - 2.0 * dots
+        order = np.argsort(distances)[:n_results]
+        return ids[candidates][order].tolist(), distances[order].tolist()
+
+    def query(self, query_embeddings, n_results: int = 10, where: Optional[dict] = None,
+              include=("documents", "metadatas", "distances")) -> dict:
+        result = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        for query in np.asarray(query_embeddings, dtype=np.float32):
+            ids, distances = self._search(query, where, n_results)
+            rows = {}
+            if ids:
+                rows = {
+                    row[0]: row
+                    for row in self._reader().execute(
+                        "SELECT v.id, s.name, v.user_id, v.is_ai, v.ts, v.document "
+                        "FROM vectors v JOIN sessions s ON s.id = v.session "
+                        f"WHERE v.id IN ({','.join('?' * len(ids))})",
+                        ids,
+                    )
+                }
+            documents, metadatas = [], []
+            for message_id in ids:
+                _, session_name, user_id, is_ai, ts, document = rows[message_id]
+                documents.append(document)
+                metadatas.append(
+                    {
+                        "role": "ai" if is_ai else "user",
+                        "session_id": session_name,
+                        "persona": persona_key_for(session_name),
+                        "timestamp": _from_ms(ts),
+                        "user_id": user_id,
+                    }
+                )
+            result["ids"].append([str(message_id) for message_id in ids])
+            result["documents"].append(documents)
+            result["metadatas"].append(metadatas)
+            result["distances"].append(distances)
+        return result
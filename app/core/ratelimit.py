@@ -0,0 +1,316 @@
+"""Per-user rate limiting and admission control for the LLM.
+
+``RateLimitMiddleware`` applies token buckets per (route, user) before a
+request reaches the threadpool.  Bucket state lives in a pluggable store:
+``InMemoryBucketStore`` for a single worker (and tests), ``PostgresBucketStore``
+when several workers must share limits.
+
+``llm_admission`` bounds how many LLM calls run at once and how many may
+queue for a slot; anything beyond that is rejected immediately.  Chat routes
+take their place with the ``admit_llm_turn`` dependency, which runs on the
+event loop, so a shed turn never holds a threadpool thread.
+"""
+
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+import json
+import math
+import threading
+import time
+
+from fastapi import HTTPException
+from jose import JWTError, jwt
+from sqlalchemy import text
+from starlette.concurrency import run_in_threadpool
+
+from .config import settings
+from .metrics import LLM_ADMISSION_REJECTED, RATE_LIMITED
+
+
+@dataclass(frozen=True)
+class RateLimitRule:
+    method: str
+    path: str
+    capacity: int
+    period_seconds: float
+
+    @property
+    def refill_per_second(self) -> float:
+        return self.capacity / self.period_seconds
+
+    def matches(self, method: str, path: str) -> bool:
+        if method != self.method:
+            return False
+        if self.path.endswith("*"):
+            return path.startswith(self.path[:-1])
+        return path.rstrip("/") == self.path.rstrip("/")
+
+
+def parse_rules(spec: str) -> List[RateLimitRule]:
+    """Parse ``"POST /ai/chat=30/60, GET /personas/*=120/60"`` (requests/seconds)."""
+    rules = []
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        route, limit = item.rsplit("=", 1)
+        method, path = route.split()
+        capacity, period = limit.split("/")
+        rules.append(RateLimitRule(method.upper(), path, int(capacity), float(period)))
+    return rules
+
+
+class InMemoryBucketStore:
+    """Token buckets for a single process."""
+
+    blocking = False
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def take(self, key: str, rule: RateLimitRule) -> Tuple[bool, float]:
+        """Consume one token; returns (allowed, retry_after_seconds)."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (rule.capacity, now))
+            tokens = min(rule.capacity, tokens + (now - updated) * rule.refill_per_second)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            if len(self._buckets) >= self.max_keys and key not in self._buckets:
+                self._evict_full(now, rule)
+            self._buckets[key] = (tokens, now)
+        if allowed:
+            return True, 0.0
+        return False, (1 - tokens) / rule.refill_per_second
+
+    def _evict_full(self, now: float, rule: RateLimitRule) -> None:
+        # A bucket that has refilled completely carries no state worth keeping.
+        idle = now - rule.period_seconds
+        for key in [k for k, (_, updated) in self._buckets.items() if updated < idle]:
+            del self._buckets[key]
+
+
+class PostgresBucketStore:
+    """Token buckets shared by every worker through one UPSERT per request."""
+
+    blocking = True
+
+    REFILLED = (
+        "LEAST(:capacity, b.tokens"
+        " + EXTRACT(EPOCH FROM now() - b.updated_at)::float8 * :rate)"
+    )
+    TAKE_SQL = text(
+        f"""
+        INSERT INTO rate_limit_buckets AS b (key, tokens, allowed, updated_at)
+        VALUES (:key, :capacity - 1, true, now())
+        ON CONFLICT (key) DO UPDATE SET
+            tokens = CASE WHEN {REFILLED} >= 1 THEN {REFILLED} - 1 ELSE {REFILLED} END,
+            allowed = {REFILLED} >= 1,
+            updated_at = now()
+        RETURNING b.allowed, b.tokens
+        """
+    )
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def take(self, key: str, rule: RateLimitRule) -> Tuple[bool, float]:
+        with self.engine.begin() as conn:
+            allowed, tokens = conn.execute(
+                self.TAKE_SQL,
+                {"key": key, "capacity": rule.capacity, "rate": rule.refill_per_second},
+            ).one()
+        if allowed:
+            return True, 0.0
+        return False, (1 - tokens) / rule.refill_per_second
+
+    def purge_idle(self, rules: List[RateLimitRule]) -> int:
+        """Delete buckets idle long enough to have refilled under every rule."""
+        if not rules:
+            return 0
+        idle_seconds = max(rule.period_seconds for rule in rules)
+        with self.engine.begin() as conn:
+            return conn.execute(
+                text(
+                    "DELETE FROM rate_limit_buckets "
+                    "WHERE updated_at < now() - make_interval(secs => :idle)"
+                ),
+                {"idle": idle_seconds},
+            ).rowcount
+
+
+def _identity(scope) -> str:
+    """The authenticated user id if the bearer token is valid, else the client IP."""
+    for name, value in scope.get("headers", []):
+        if name == b"authorization" and value[:7].lower() == b"bearer ":
+            try:
+                payload = jwt.decode(
+                    value[7:].decode(), settings.secret_key, algorithms=[settings.algorithm]
+                )
+                if payload.get("user_id"):
+                    return f"user:{payload['user_id']}"
+            except JWTError:
+                pass
+            break
+    client = scope.get("client")
+    return f"ip:{client[0] if client else 'unknown'}"
+
+
+class RateLimitMiddleware:
+    """Pure ASGI middleware so rejected requests never reach the threadpool."""
+
+    def __init__(self, app, rules: List[RateLimitRule], store):
+        self.app = app
+        self.rules = rules
+        self.store = store
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.rules:
+            return await self.app(scope, receive, send)
+
+        rule = next(
+            (r for r in self.rules if r.matches(scope["method"], scope["path"])), None
+        )
+        if rule is None:
+            return await self.app(scope, receive, send)
+
+        key = f"{rule.method} {rule.path}|{_identity(scope)}"
+        if self.store.blocking:
+            allowed, retry_after = await run_in_threadpool(self.store.take, key, rule)
+        else:
+            allowed, retry_after = self.store.take(key, rule)
+        if allowed:
+            return await self.app(scope, receive, send)
+
+        RATE_LIMITED.labels(f"{rule.method} {rule.path}").inc()
+        body = json.dumps({"detail": "Too many requests, slow down"}).encode()
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 429,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__("LLM capacity exhausted")
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Bounded concurrency with a bounded wait queue in front of a resource.
+
+    ``admit`` counts requests from the moment they are accepted, so at most
+    ``max_concurrent + max_queue`` of them are ever on their way to ``slot``.
+    """
+
+    def __init__(self, max_concurrent: int, max_queue: int, queue_timeout: float):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._active = 0
+        self._waiting = 0
+        self._admitted = 0
+        self._cond = threading.Condition()
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    @property
+    def waiting(self) -> int:
+        return self._waiting
+
+    @property
+    def admitted(self) -> int:
+        return self._admitted
+
+    def admit(self) -> bool:
+        """Accept one more request, or count it as rejected when all places are taken."""
+        with self._cond:
+            if self._admitted >= self.max_concurrent + self.max_queue:
+                LLM_ADMISSION_REJECTED.inc()
+                return False
+            self._admitted += 1
+            return True
+
+    def release(self) -> None:
+        with self._cond:
+            self._admitted -= 1
+
+    @contextmanager
+    def slot(self):
+        with self._cond:
+            if self._active >= self.max_concurrent:
+                if self._waiting >= self.max_queue:
+                    LLM_ADMISSION_REJECTED.inc()
+                    raise AdmissionRejected(self.queue_timeout)
+                self._waiting += 1
+                try:
+                    admitted = self._cond.wait_for(
+                        lambda: self._active < self.max_concurrent, self.queue_timeout
+                    )
+                finally:
+                    self._waiting -= 1
+                if not admitted:
+                    LLM_ADMISSION_REJECTED.inc()
+                    raise AdmissionRejected(self.queue_timeout)
+            self._active += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._active -= 1
+                self._cond.notify()
+
+
+def build_bucket_store(backend: Optional[str] = None):
+    backend = backend or settings.rate_limit_backend
+    if backend == "postgres":
+        from .database import engine
+
+        return PostgresBucketStore(engine)
+    return InMemoryBucketStore()
+
+
+llm_admission = AdmissionController(
+    max_concurrent=settings.llm_max_concurrency,
+    max_queue=settings.llm_max_queue,
+    queue_timeout=settings.llm_queue_timeout_seconds,
+)
+
+
+async def admit_llm_turn():
+    """Dependency of the routes that call the LLM.
+
+    Async, so it runs on the event loop before a sync endpoint is handed to the
+    threadpool: a turn beyond the queue gets its 503 without taking a thread.
+    """
+    if not llm_admission.admit():
+        raise HTTPException(
+            status_code=503,
+            detail="The AI is busy right now, please try again shortly",
+            headers={"Retry-After": str(max(1, round(llm_admission.queue_timeout)))},
+        )
+    try:
+        yield
+    finally:
+        llm_admission.release()
+
+
+def purge_idle_buckets() -> int:
+    """Periodic cleanup of the shared buckets (see ``PartitionMaintainer``)."""
+    if not settings.rate_limit_enabled or settings.rate_limit_backend != "postgres":
+        return 0
+    return build_bucket_store().purge_idle(parse_rules(settings.rate_limit_rules))
@@ -0,0 +1,259 @@
+"""Rebuild the chat-memory vector store from the messages table.
+
+Full rebuild (after losing ``vector_store/`` or changing ``EMBEDDING_MODEL``)::
+
+    uv run python -m core.reindex --workers 4
+
+Messages are read from Postgres in id order, ``--batch-size`` at a time, and
+encoded in a process pool (``--workers 0`` encodes in this process).  Vectors
+go into a new collection; when every message is in it, the collection is made
+live with ``set_active_collection`` and messages written meanwhile are caught
+up.  Progress is checkpointed in ``VECTOR_STORE_DIR/reindex.json`` after each
+batch, so running the command again after an interruption continues where it
+stopped (``--restart`` throws the checkpoint away).
+
+Incremental mode embeds only the messages missing from the live collection::
+
+    uv run python -m core.reindex --incremental
+"""
+
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from datetime import datetime
+from typing import Iterator, List, Optional, Tuple
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+import numpy as np
+from sqlalchemy import select
+
+from models import models
+from .config import settings
+from .database import SessionLocal
+from .embeddings import get_embedder
+from .vector_store import (
+    VECTOR_STORE_DIR,
+    active_collection_name,
+    delete_collection,
+    max_batch_size,
+    message_metadata,
+    open_collection,
+    set_active_collection,
+)
+
+CHECKPOINT_PATH = os.path.join(VECTOR_STORE_DIR, "reindex.json")
+
+Batch = Tuple[List[str], List[str], List[dict]]  # ids, documents, metadatas
+
+
+def _init_worker(threads: int) -> None:
+    # Each worker gets its share of the cores instead of all of them.
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    get_embedder()
+
+
+def _encode(documents: List[str]) -> np.ndarray:
+    return np.asarray(get_embedder().encode(documents), dtype=np.float32)
+
+
+class _InProcess(Executor):
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        future.set_result(fn(*args, **kwargs))
+        return future
+
+
+def _batches(after_id: int, batch_size: int) -> Iterator[Tuple[int, Batch]]:
+    """(last id, batch) pairs of messages with ``id > after_id``, keyset-paginated."""
+    db = SessionLocal()
+    try:
+        while True:
+            rows = db.execute(
+                select(
+                    models.Message.id,
+                    models.Message.sender_id,
+                    models.Message.receiver_id,
+                    models.Message.is_ai,
+                    models.Message.content,
+                    models.Message.timestamp,
+                    models.Message.meta_data["session_id"].as_string(),
+                )
+                .where(models.Message.id > after_id)
+                .order_by(models.Message.id)
+                .limit(batch_size)
+            ).all()
+            db.rollback()  # don't hold a snapshot open while the batch is encoded
+            if not rows:
+                return
+            after_id = rows[-1].id
+            batch = ([], [], [])
+            for message_id, sender_id, receiver_id, is_ai, content, timestamp, session_id in rows:
+                if not session_id or not content:
+                    continue
+                batch[0].append(str(message_id))
+                batch[1].append(content)
+                batch[2].append(
+                    message_metadata(session_id, is_ai, receiver_id if is_ai else sender_id, timestamp)
+                )
+            yield after_id, batch
+    finally:
+        db.close()
+
+
+def _missing(collection, batch: Batch) -> Batch:
+    present = set(collection.get(ids=batch[0], include=[])["ids"]) if batch[0] else set()
+    keep = [i for i, message_id in enumerate(batch[0]) if message_id not in present]
+    return tuple([column[i] for i in keep] for column in batch)
+
+
+def _load_checkpoint() -> Optional[dict]:
+    try:
+        with open(CHECKPOINT_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _save_checkpoint(checkpoint: dict) -> None:
+    tmp_path = f"{CHECKPOINT_PATH}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, CHECKPOINT_PATH)
+
+
+def index_messages(
+    collection,
+    executor: Executor,
+    after_id: int = 0,
+    batch_size: int = 1000,
+    in_flight: int = 2,
+    incremental: bool = False,
+    checkpoint: Optional[dict] = None,
+) -> int:
+    """Embed messages with ``id > after_id`` into ``collection``; returns how many.
+
+    Batches are encoded concurrently but stored and checkpointed in id order,
+    so ``checkpoint["last_id"]`` never skips past a batch that isn't stored.
+    """
+    pending = deque()
+    started = time.monotonic()
+    stored = 0
+    max_batch = max_batch_size(collection)
+
+    def store_oldest():
+        nonlocal stored
+        last_id, (ids, documents, metadatas), future = pending.popleft()
+        if ids:
+            embeddings = future.result()
+            for i in range(0, len(ids), max_batch):
+                collection.upsert(
+                    ids=ids[i : i + max_batch],
+                    documents=documents[i : i + max_batch],
+                    embeddings=embeddings[i : i + max_batch],
+                    metadatas=metadatas[i : i + max_batch],
+                )
+        stored += len(ids)
+        if checkpoint is not None:
+            checkpoint["last_id"] = last_id
+            checkpoint["indexed"] = checkpoint.get("indexed", 0) + len(ids)
+            _save_checkpoint(checkpoint)
+        elapsed = time.monotonic() - started
+        print(
+            f"up to id {last_id}: {stored} embedded, {stored / max(elapsed, 1e-9):.0f} msg/s",
+            file=sys.stderr,
+        )
+
+    for last_id, batch in _batches(after_id, batch_size):
+        if incremental:
+            batch = _missing(collection, batch)
+        future = executor.submit(_encode, batch[1]) if batch[0] else None
+        pending.append((last_id, batch, future))
+        if len(pending) > in_flight:
+            store_oldest()
+    while pending:
+        store_oldest()
+    return stored
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild chat memory vectors from Postgres")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="encoding processes (0 encodes in this process)")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--incremental", action="store_true",
+                        help="only embed messages missing from the live collection")
+    parser.add_argument("--restart", action="store_true", help="ignore an unfinished rebuild")
+    parser.add_argument("--drop-old", action="store_true",
+                        help="delete the previous collection after the switch")
+    args = parser.parse_args()
+
+    if args.workers > 0:
+        executor = ProcessPoolExecutor(
+            max_workers=args.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(max(1, (os.cpu_count() or 1) // args.workers),),
+        )
+    else:
+        executor = _InProcess()
+    in_flight = max(2, args.workers * 2)
+    started = time.monotonic()
+
+    with executor:
+        live = active_collection_name()
+        if args.incremental:
+            stored = index_messages(
+                open_collection(live),
+                executor, batch_size=args.batch_size, in_flight=in_flight, incremental=True,
+            )
+            print(f"{stored} missing messages embedded into {live}", file=sys.stderr)
+            return
+
+        checkpoint = None if args.restart else _load_checkpoint()
+        model = f"{settings.embedding_backend}:{settings.embedding_model}"
+        if checkpoint and checkpoint.get("model") != model:
+            print(f"checkpoint was built with {checkpoint.get('model')}, starting over", file=sys.stderr)
+            checkpoint = None
+        if checkpoint:
+            print(f"resuming {checkpoint['collection']} after id {checkpoint['last_id']}", file=sys.stderr)
+        else:
+            name = f"chat_memory_{datetime.utcnow():%Y%m%d%H%M%S}"
+            checkpoint = {"collection": name, "model": model, "last_id": 0, "indexed": 0}
+            _save_checkpoint(checkpoint)
+
+        target = open_collection(checkpoint["collection"], metadata={"embedding_model": model})
+        index_messages(
+            target, executor, checkpoint["last_id"], args.batch_size, in_flight,
+            checkpoint=checkpoint,
+        )
+
+        set_active_collection(target.name)
+        # Turns that started before the switch may still have written to the
+        # old collection; pick up everything committed since the scan ended.
+        index_messages(
+            target, executor, checkpoint["last_id"], args.batch_size, in_flight,
+            incremental=True,
+        )
+        os.remove(CHECKPOINT_PATH)
+        print(
+            f"{target.count()} vectors in {target.name} (now live), "
+            f"{time.monotonic() - started:.1f}s",
+            file=sys.stderr,
+        )
+
+        if live != target.name:
+            if args.drop_old:
+                try:
+                    delete_collection(live)
+                except Exception:  # never created, e.g. after losing the directory
+                    pass
+            else:
+                print(f"previous collection {live} kept; --drop-old removes it", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
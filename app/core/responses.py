@@ -0,0 +1,23 @@
+"""Fast JSON responses for the read-heavy endpoints.
+
+FastAPI turns a returned model into plain Python objects, validates them
+against ``response_model`` once more and renders them with ``json.dumps``.
+For a long history or persona list most of a request's CPU time goes there
+(see ``bench/serialization.py``).  Routers that use ``FastJSONResponse`` as
+their default response class render with orjson instead, and endpoints that
+already build their response model return ``FastJSONResponse(model)``
+directly, which serializes it once in pydantic-core and skips the second
+validation.  ``response_model`` stays on those routes for the OpenAPI schema.
+"""
+
+from typing import Any
+
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel
+
+
+class FastJSONResponse(ORJSONResponse):
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, BaseModel):
+            return content.__pydantic_serializer__.to_json(content, by_alias=True)
+        return super().render(content)
@@ -0,0 +1,260 @@
+"""Long-term facts about a user, distilled from their messages in the background.
+
+Vector search only recalls raw messages of the current session, so personas
+kept re-asking what the user had already told them (or told another
+persona).  After a chat turn, ``schedule()`` queues the session on a
+background thread; once ``USER_FACTS_EVERY`` new user messages have
+arrived, one LLM call turns them into short ``key: value`` facts ("name",
+"sister_name", "favorite_food") stored in ``user_facts``.  Extraction never
+competes with chat turns for the LLM: it is skipped while every admission
+slot is busy and retried after a later turn.
+
+``facts_for_prompt()`` returns the facts a persona may use: those learned in
+its own conversation, or all of them when the user has opted in to sharing
+(``PUT /ai/facts/sharing``).  They go into the system prompt as a few lines.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+import json
+import logging
+import re
+import threading
+
+from sqlalchemy import and_, delete, exists, or_, select, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from models import models
+from .config import settings
+from .database import SessionLocal
+from .history import persona_key_for
+from .llm import LLMError, get_llm_provider
+from .ratelimit import AdmissionRejected, llm_admission
+
+logger = logging.getLogger(__name__)
+
+FACT_KEY = re.compile(r"^[a-z][a-z0-9_]{0,63}$")
+MAX_MESSAGES_PER_EXTRACTION = 50
+CURRENT_MESSAGE_MARKER = "\n\nCurrent message: "  # see AIChatSession.send_message
+# Message timestamps follow their ids, give or take a slow commit.
+CURSOR_SLACK = timedelta(minutes=5)
+
+EXTRACTION_PROMPT = """You keep a short list of durable facts about a user: their name, \
+the people and pets in their life, where they live and work, preferences, plans and \
+important events. You get the facts already known and the user's new chat messages.
+
+Reply with only a JSON object that maps snake_case keys to short values (at most 15 \
+words) for facts that are new or have changed, and to null for known facts the new \
+messages show are no longer true. Reuse the known keys where they fit. Ignore moods, \
+small talk, questions and anything about the assistant. Reply {} if there is nothing \
+to record."""
+
+
+def facts_for_prompt(db: Session, user_id: int, persona_key: str) -> List[Tuple[str, str]]:
+    """Newest first, at most ``USER_FACTS_IN_PROMPT``, one value per key."""
+    if settings.user_facts_in_prompt <= 0:
+        return []
+    shared = exists().where(
+        and_(models.UserMemory.user_id == user_id, models.UserMemory.share_facts == True)
+    )
+    rows = db.execute(
+        select(models.UserFact.key, models.UserFact.value)
+        .where(
+            models.UserFact.user_id == user_id,
+            or_(models.UserFact.persona_key == persona_key, shared),
+        )
+        .order_by(models.UserFact.updated_at.desc())
+        .limit(settings.user_facts_in_prompt * 2)
+    ).all()
+    facts = {}
+    for key, value in rows:
+        facts.setdefault(key, value)
+    return list(facts.items())[: settings.user_facts_in_prompt]
+
+
+def format_facts(facts: List[Tuple[str, str]]) -> str:
+    return "\n".join(f"- {key.replace('_', ' ')}: {value}" for key, value in facts)
+
+
+def parse_facts(reply: str) -> Dict[str, Optional[str]]:
+    """The model's JSON object, keeping only well-formed keys and short values."""
+    start, end = reply.find("{"), reply.rfind("}")
+    if start < 0 or end < start:
+        return {}
+    try:
+        data = json.loads(reply[start : end + 1])
+    except ValueError:
+        return {}
+    if not isinstance(data, dict):
+        return {}
+    facts = {}
+    for key, value in data.items():
+        key = str(key).strip().lower()
+        if not FACT_KEY.match(key):
+            continue
+        if value is None:
+            facts[key] = None
+        elif isinstance(value, (str, int, float)) and str(value).strip():
+            facts[key] = str(value).strip()[:200]
+    return facts
+
+
+def _user_text(content: str) -> str:
+    """What the user typed; stored turns carry the recalled context in front of it."""
+    return (content or "").rsplit(CURRENT_MESSAGE_MARKER, 1)[-1][:500]
+
+
+def _new_user_messages(
+    db: Session,
+    user_id: int,
+    ai_user_id: int,
+    session_id: str,
+    cursor: Optional[models.FactExtractionCursor],
+):
+    query = select(models.Message.id, models.Message.content).where(
+        models.Message.sender_id == user_id,
+        models.Message.receiver_id == ai_user_id,
+        models.Message.meta_data["session_id"].as_string() == session_id,
+    )
+    if cursor is not None:
+        query = query.where(models.Message.id > cursor.last_message_id)
+        read_up_to = db.execute(
+            select(models.Message.timestamp).where(
+                models.Message.id == cursor.last_message_id,
+                models.Message.sender_id == user_id,
+            )
+        ).scalar()
+        if read_up_to is not None:
+            # Only the months since the last message read, not every partition.
+            query = query.where(models.Message.timestamp >= read_up_to - CURSOR_SLACK)
+    return db.execute(
+        query.order_by(models.Message.id).limit(MAX_MESSAGES_PER_EXTRACTION)
+    ).all()
+
+
+def extract_session(user_id: int, ai_user_id: int, session_id: str) -> int:
+    """Extract facts from the session's unread user messages; returns facts changed."""
+    persona_key = persona_key_for(session_id)
+    with SessionLocal() as db:
+        # One extractor per session across workers; the others just skip.
+        if not db.execute(
+            text("SELECT pg_try_advisory_xact_lock(hashtextextended(:key, 0))"),
+            {"key": f"user_facts:{session_id}"},
+        ).scalar():
+            return 0
+        cursor = db.get(models.FactExtractionCursor, (user_id, session_id))
+        messages = _new_user_messages(db, user_id, ai_user_id, session_id, cursor)
+        if len(messages) < settings.user_facts_every:
+            return 0
+        if llm_admission.active >= llm_admission.max_concurrent:
+            return 0  # chat turns first; a later turn retries
+
+        known = dict(
+            db.execute(
+                select(models.UserFact.key, models.UserFact.value).where(
+                    models.UserFact.user_id == user_id,
+                    models.UserFact.persona_key == persona_key,
+                )
+            ).all()
+        )
+        prompt = [
+            {"role": "system", "content": EXTRACTION_PROMPT},
+            {
+                "role": "user",
+                "content": f"Known facts: {json.dumps(known, ensure_ascii=False)}\n\n"
+                "New messages:\n" + "\n".join(f"- {_user_text(content)}" for _, content in messages),
+            },
+        ]
+        with llm_admission.slot():
+            reply = get_llm_provider().complete(prompt, temperature=0).text
+
+        changes = parse_facts(reply)
+        last_id = messages[-1][0]
+        now = datetime.utcnow()
+        for key, value in changes.items():
+            if value is None:
+                db.execute(
+                    delete(models.UserFact).where(
+                        models.UserFact.user_id == user_id,
+                        models.UserFact.persona_key == persona_key,
+                        models.UserFact.key == key,
+                    )
+                )
+                continue
+            db.execute(
+                insert(models.UserFact)
+                .values(
+                    user_id=user_id,
+                    persona_key=persona_key,
+                    key=key,
+                    value=value,
+                    source_message_id=last_id,
+                    updated_at=now,
+                )
+                .on_conflict_do_update(
+                    index_elements=["user_id", "persona_key", "key"],
+                    set_={"value": value, "source_message_id": last_id, "updated_at": now},
+                )
+            )
+        if changes:
+            _trim(db, user_id)
+
+        db.execute(
+            insert(models.FactExtractionCursor)
+            .values(user_id=user_id, session_id=session_id, last_message_id=last_id, updated_at=now)
+            .on_conflict_do_update(
+                index_elements=["user_id", "session_id"],
+                set_={"last_message_id": last_id, "updated_at": now},
+            )
+        )
+        db.commit()
+    logger.info(
+        "User facts extracted",
+        extra={"sampled": True, "session_id": session_id, "facts_changed": len(changes)},
+    )
+    return len(changes)
+
+
+def _trim(db: Session, user_id: int) -> None:
+    """Keep the ``USER_FACTS_MAX`` most recently updated facts of the user."""
+    keep = (
+        select(models.UserFact.id)
+        .where(models.UserFact.user_id == user_id)
+        .order_by(models.UserFact.updated_at.desc(), models.UserFact.id.desc())
+        .limit(settings.user_facts_max)
+    )
+    db.execute(
+        delete(models.UserFact).where(
+            models.UserFact.user_id == user_id, models.UserFact.id.not_in(keep)
+        )
+    )
+
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="user-facts")
+_queued = set()
+_queued_lock = threading.Lock()
+
+
+def schedule(user_id: int, ai_user_id: int, session_id: str) -> None:
+    """Queue a session for extraction after a chat turn (at most once at a time)."""
+    if settings.user_facts_every <= 0:
+        return
+    with _queued_lock:
+        if session_id in _queued:
+            return
+        _queued.add(session_id)
+    _executor.submit(_run, user_id, ai_user_id, session_id)
+
+
+def _run(user_id: int, ai_user_id: int, session_id: str) -> None:
+    try:
+        extract_session(user_id, ai_user_id, session_id)
+    except (LLMError, AdmissionRejected):
+        logger.warning("User fact extraction skipped: LLM unavailable", extra={"session_id": session_id})
+    except Exception:
+        logger.exception("User fact extraction failed", extra={"session_id": session_id})
+    finally:
+        with _queued_lock:
+            _queued.discard(session_id)
@@ -0,0 +1,119 @@
+"""Client for the vector-memory service (``core/vector_service.py``).
+
+With ``VECTOR_SERVICE_URL`` set, ``core.vector_store`` hands out
+``RemoteCollection`` objects instead of opening the store in-process, so any
+number of API workers and containers share one writer.  The URL is either
+``unix:///path/to/vector.sock`` or ``http://host:port``; requests go through
+one pooled ``httpx.Client`` per process.  Embeddings travel as base64 float32.
+"""
+
+from typing import Optional, Sequence
+import base64
+import os
+import threading
+
+import httpx
+import numpy as np
+
+from .config import settings
+
+
+class VectorServiceError(RuntimeError):
+    pass
+
+
+def encode_embeddings(embeddings) -> dict:
+    array = np.ascontiguousarray(np.asarray(embeddings, dtype="<f4"))
+    return {"shape": list(array.shape), "data": base64.b64encode(array.tobytes()).decode()}
+
+
+def decode_embeddings(payload: dict) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(payload["data"]), dtype="<f4").reshape(payload["shape"])
+
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def get_http_client() -> httpx.Client:
+    global _client, _client_pid
+    if _client is None or _client_pid != os.getpid():  # pooled sockets don't survive fork
+        with _client_lock:
+            if _client is None or _client_pid != os.getpid():
+                url = settings.vector_service_url
+                if url.startswith("unix://"):
+                    transport = httpx.HTTPTransport(uds=url[len("unix://"):], retries=1)
+                    base_url = "http://vector-service"
+                else:
+                    transport = httpx.HTTPTransport(retries=1)
+                    base_url = url.rstrip("/")
+                _client = httpx.Client(
+                    base_url=base_url,
+                    transport=transport,
+                    timeout=settings.vector_service_timeout_seconds,
+                    limits=httpx.Limits(
+                        max_connections=settings.vector_service_max_connections,
+                        max_keepalive_connections=settings.vector_service_max_connections,
+                    ),
+                )
+                _client_pid = os.getpid()
+    return _client
+
+
+def call(method: str, path: str, payload: Optional[dict] = None):
+    try:
+        response = get_http_client().request(method, path, json=payload)
+    except httpx.HTTPError as e:
+        raise VectorServiceError(f"Vector service unavailable: {e}") from e
+    if response.status_code >= 400:
+        raise VectorServiceError(f"Vector service returned {response.status_code}: {response.text}")
+    return response.json()
+
+
+class RemoteCollection:
+    """A collection held by the vector service; ``name=None`` is the live one."""
+
+    def __init__(self, name: Optional[str] = None):
+        self.name = name
+        self._path = f"/collections/{name}" if name else "/active"
+
+    def _write(self, verb: str, ids, embeddings, metadatas, documents) -> None:
+        call(
+            "POST",
+            f"{self._path}/{verb}",
+            {
+                "ids": list(ids),
+                "embeddings": encode_embeddings(embeddings),
+                "metadatas": list(metadatas),
+                "documents": list(documents) if documents is not None else None,
+            },
+        )
+
+    def add(self, ids, embeddings, metadatas, documents=None) -> None:
+        self._write("add", ids, embeddings, metadatas, documents)
+
+    def upsert(self, ids, embeddings, metadatas, documents=None) -> None:
+        self._write("upsert", ids, embeddings, metadatas, documents)
+
+    def query(self, query_embeddings, n_results: int = 10, where: Optional[dict] = None,
+              include=("documents", "metadatas", "distances")) -> dict:
+        return call(
+            "POST",
+            f"{self._path}/query",
+            {
+                "query_embeddings": encode_embeddings(query_embeddings),
+                "n_results": n_results,
+                "where": where,
+                "include": list(include),
+            },
+        )
+
+    def get(self, ids: Sequence[str], include=()) -> dict:
+        return call("POST", f"{self._path}/get", {"ids": list(ids)})
+
+    def delete(self, ids: Optional[Sequence[str]] = None, where: Optional[dict] = None) -> None:
+        call("POST", f"{self._path}/delete", {"ids": list(ids) if ids is not None else None, "where": where})
+
+    def count(self) -> int:
+        return call("GET", f"{self._path}/count")["count"]
@@ -0,0 +1,167 @@
+"""Vector-memory service: the one process that opens the vector store.
+
+Run a single worker of it and point the API at it with ``VECTOR_SERVICE_URL``::
+
+    uv run uvicorn core.vector_service:app --uds /run/vector/vector.sock
+    VECTOR_SERVICE_URL=unix:///run/vector/vector.sock uv run uvicorn main:app --workers 4
+
+Chroma's ``PersistentClient`` (and its HNSW files) must not be shared by
+several processes; behind this service every API worker and container reads
+and writes through one client.  ``/active/...`` addresses the live collection
+and follows ``set_active_collection``; ``/collections/{name}/...`` addresses a
+named one, which is what ``python -m core.reindex`` builds into.
+"""
+
+from typing import Any, Dict, List, Optional
+import threading
+
+from fastapi import FastAPI, HTTPException
+from pydantic import BaseModel
+
+from .config import settings
+
+# This process is the service: always open the store in-process.
+settings.vector_service_url = ""
+
+from . import vector_store  # noqa: E402
+from .vector_client import decode_embeddings  # noqa: E402
+
+app = FastAPI(title="Your Friend vector memory")
+
+# Chroma and SQLite both want one writer; reads run concurrently.
+_write_lock = threading.Lock()
+
+
+class EncodedEmbeddings(BaseModel):
+    shape: List[int]
+    data: str
+
+
+class WriteRequest(BaseModel):
+    ids: List[str]
+    embeddings: EncodedEmbeddings
+    metadatas: List[Dict[str, Any]]
+    documents: Optional[List[Optional[str]]] = None
+
+
+class QueryRequest(BaseModel):
+    query_embeddings: EncodedEmbeddings
+    n_results: int = 10
+    where: Optional[Dict[str, Any]] = None
+    include: List[str] = ["documents", "metadatas", "distances"]
+
+
+class GetRequest(BaseModel):
+    ids: List[str]
+
+
+class DeleteRequest(BaseModel):
+    ids: Optional[List[str]] = None
+    where: Optional[Dict[str, Any]] = None
+
+
+class CollectionRequest(BaseModel):
+    name: Optional[str] = None
+    metadata: Optional[Dict[str, Any]] = None
+
+
+def _collection(name: Optional[str]):
+    return vector_store.open_collection(name) if name else vector_store.get_collection()
+
+
+def _write(verb: str, body: WriteRequest, name: Optional[str]) -> dict:
+    collection = _collection(name)
+    embeddings = decode_embeddings(body.embeddings.model_dump())
+    documents = body.documents
+    step = vector_store.max_batch_size(collection)
+    with _write_lock:
+        for i in range(0, len(body.ids), step):
+            getattr(collection, verb)(
+                ids=body.ids[i : i + step],
+                embeddings=embeddings[i : i + step],
+                metadatas=body.metadatas[i : i + step],
+                documents=documents[i : i + step] if documents is not None else None,
+            )
+    return {"count": len(body.ids)}
+
+
+@app.get("/health")
+def health():
+    return {"status": "ok", "collection": vector_store.active_collection_name()}
+
+
+@app.get("/active")
+def get_active():
+    return {"name": vector_store.active_collection_name()}
+
+
+@app.put("/active")
+def put_active(body: CollectionRequest):
+    if not body.name:
+        raise HTTPException(status_code=400, detail="name is required")
+    vector_store.set_active_collection(body.name)
+    return {"name": body.name}
+
+
+@app.put("/collections/{name}")
+def create_collection(name: str, body: CollectionRequest):
+    with _write_lock:
+        vector_store.open_collection(name, metadata=body.metadata)
+    return {"name": name}
+
+
+@app.delete("/collections/{name}")
+def drop_collection(name: str):
+    with _write_lock:
+        vector_store.delete_collection(name)
+    return {"name": name}
+
+
+@app.post("/active/add")
+@app.post("/collections/{name}/add")
+def add(body: WriteRequest, name: Optional[str] = None):
+    return _write("add", body, name)
+
+
+@app.post("/active/upsert")
+@app.post("/collections/{name}/upsert")
+def upsert(body: WriteRequest, name: Optional[str] = None):
+    return _write("upsert", body, name)
+
+
+@app.post("/active/query")
+@app.post("/collections/{name}/query")
+def query(body: QueryRequest, name: Optional[str] = None):
+    result = _collection(name).query(
+        query_embeddings=decode_embeddings(body.query_embeddings.model_dump()),
+        n_results=body.n_results,
+        where=body.where,
+        include=body.include,
+    )
+    return {
+        key: [list(row) for row in result[key]]
+        for key in ["ids", *body.include]
+        if result.get(key) is not None
+    }
+
+
+@app.post("/active/get")
+@app.post("/collections/{name}/get")
+def get(body: GetRequest, name: Optional[str] = None):
+    return {"ids": list(_collection(name).get(ids=body.ids, include=[])["ids"])}
+
+
+@app.post("/active/delete")
+@app.post("/collections/{name}/delete")
+def delete(body: DeleteRequest, name: Optional[str] = None):
+    if body.ids is None and not body.where:
+        raise HTTPException(status_code=400, detail="ids or where is required")
+    with _write_lock:
+        _collection(name).delete(ids=body.ids, where=body.where)
+    return {"status": "deleted"}
+
+
+@app.get("/active/count")
+@app.get("/collections/{name}/count")
+def count(name: Optional[str] = None):
+    return {"count": _collection(name).count()}
@@ -0,0 +1,166 @@
+"""The collection that holds chat memory.
+
+A Chroma collection by default; with ``VECTOR_STORE_BACKEND=float16`` or
+``int8`` new collections are ``QuantizedCollection`` files instead.  An
+existing collection keeps the format it was built with, so switching backend
+takes a rebuild and nothing else.
+
+With ``VECTOR_SERVICE_URL`` set, every function here goes through the
+vector-memory service (``core/vector_service.py``) instead of opening the
+store, so several API processes never write to the same directory.
+
+Which collection is live is recorded in ``VECTOR_STORE_DIR/active_collection``
+(``chat_memory`` when the file does not exist).  ``python -m core.reindex``
+builds a new collection next to the live one and then replaces that file in a
+single ``os.replace``; every process notices the new file on its next
+``get_collection()`` call, so a rebuild never needs a restart.
+"""
+
+from typing import Optional
+import os
+import threading
+
+import chromadb
+
+from .config import settings
+from .history import persona_key_for
+from .quantized_store import DTYPES, QuantizedCollection
+from .vector_client import RemoteCollection, call
+
+VECTOR_STORE_DIR = os.path.abspath(settings.vector_store_dir)
+os.makedirs(VECTOR_STORE_DIR, exist_ok=True)
+
+DEFAULT_COLLECTION = "chat_memory"
+POINTER_PATH = os.path.join(VECTOR_STORE_DIR, "active_collection")
+
+_client = None
+_quantized = {}
+_remote_active = RemoteCollection()
+_active = None  # (pointer mtime, collection)
+_active_lock = threading.Lock()
+_client_lock = threading.Lock()
+
+
+def get_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = chromadb.PersistentClient(path=VECTOR_STORE_DIR)
+    return _client
+
+
+def _quantized_path(name: str, dtype: str) -> str:
+    return os.path.join(VECTOR_STORE_DIR, f"{name}.{dtype}.sqlite3")
+
+
+def _chroma_has(name: str) -> bool:
+    if not os.path.exists(os.path.join(VECTOR_STORE_DIR, "chroma.sqlite3")):
+        return False
+    try:
+        get_client().get_collection(name)
+    except Exception:
+        return False
+    return True
+
+
+def open_collection(name: str, metadata: Optional[dict] = None):
+    """Open ``name`` in whichever format it has, or create it per the backend."""
+    if settings.vector_service_url:
+        call("PUT", f"/collections/{name}", {"metadata": metadata})
+        return RemoteCollection(name)
+    existing = [dtype for dtype in DTYPES if os.path.exists(_quantized_path(name, dtype))]
+    if not existing and settings.vector_store_backend in DTYPES and not _chroma_has(name):
+        existing = [settings.vector_store_backend]
+    if not existing:
+        return get_client().get_or_create_collection(name=name, metadata=metadata)
+    with _client_lock:
+        if name not in _quantized:
+            dtype = existing[0]
+            _quantized[name] = QuantizedCollection(
+                _quantized_path(name, dtype), name, dtype, metadata
+            )
+        return _quantized[name]
+
+
+def delete_collection(name: str) -> None:
+    if settings.vector_service_url:
+        call("DELETE", f"/collections/{name}")
+        return
+    for dtype in DTYPES:
+        path = _quantized_path(name, dtype)
+        if os.path.exists(path):
+            with _client_lock:
+                _quantized.pop(name, None)
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+            return
+    get_client().delete_collection(name)
+
+
+def max_batch_size(collection) -> int:
+    if isinstance(collection, QuantizedCollection):
+        return 10000
+    if isinstance(collection, RemoteCollection):
+        return 1000  # keeps request bodies around a few MB
+    return get_client().get_max_batch_size()
+
+
+def _pointer_mtime() -> Optional[int]:
+    try:
+        return os.stat(POINTER_PATH).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def active_collection_name() -> str:
+    if settings.vector_service_url:
+        return call("GET", "/active")["name"]
+    try:
+        with open(POINTER_PATH, "r", encoding="utf-8") as f:
+            return f.read().strip() or DEFAULT_COLLECTION
+    except FileNotFoundError:
+        return DEFAULT_COLLECTION
+
+
+def get_collection():
+    """The live collection, re-resolved whenever the pointer file changes."""
+    global _active
+    if settings.vector_service_url:
+        return _remote_active
+    mtime = _pointer_mtime()
+    active = _active
+    if active is None or active[0] != mtime:
+        with _active_lock:
+            if _active is None or _active[0] != mtime:
+                _active = (
+                    mtime,
+                    open_collection(active_collection_name()),
+                )
+            active = _active
+    return active[1]
+
+
+def set_active_collection(name: str) -> None:
+    """Point every process at ``name``; the rename makes the switch atomic."""
+    if settings.vector_service_url:
+        call("PUT", "/active", {"name": name})
+        return
+    tmp_path = f"{POINTER_PATH}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(name)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, POINTER_PATH)
+
+
+def message_metadata(session_id: str, is_ai: bool, user_id: int, timestamp) -> dict:
+    """Metadata stored with a message's vector (its id is the message id)."""
+    return {
+        "role": "ai" if is_ai else "user",
+        "session_id": session_id,
+        "persona": persona_key_for(session_id),
+        "timestamp": timestamp.isoformat(),
+        "user_id": user_id,
+    }
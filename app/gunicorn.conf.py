@@ -0,0 +1,114 @@
+"""Production launcher: ``uv run gunicorn main:app`` from ``app/``.
+
+The app is imported once in the master (``preload_app``) and the embedding
+model and persona catalog are loaded there before any worker is forked, so
+the workers share those pages copy-on-write instead of each holding its own
+copy of torch and the model.  ``gc.freeze()`` keeps the workers' garbage
+collector from writing to (and so copying) the objects they inherited.
+
+    WEB_CONCURRENCY=4 uv run gunicorn main:app
+
+``WEB_CONCURRENCY`` is the number of workers (default 2 with
+``VECTOR_SERVICE_URL`` set, else 1) and ``TORCH_THREADS_PER_WORKER`` their
+torch intra-op threads (default: CPU cores / workers, at least 1), so N
+workers never run N x cores threads.
+
+State that is per process by default has to be shared once there is more
+than one worker.  Chroma must not be opened by several processes, so
+``VECTOR_SERVICE_URL`` (see ``core/vector_service.py``) is required.  Session
+locks and rate limits default to their Postgres backends, and metrics are
+collected in ``PROMETHEUS_MULTIPROC_DIR`` (a fresh temporary directory unless
+set).  A multi-worker server refuses to start if any of these was explicitly
+set back to a per-process backend.
+"""
+
+import gc
+import glob
+import os
+import sys
+import tempfile
+
+bind = os.environ.get("BIND", "0.0.0.0:8000")
+workers = int(
+    os.environ.get("WEB_CONCURRENCY") or (2 if os.environ.get("VECTOR_SERVICE_URL") else 1)
+)
+worker_class = "uvicorn_worker.UvicornWorker"
+preload_app = True
+timeout = 60
+graceful_timeout = 30
+keepalive = 5
+
+torch_threads = int(os.environ.get("TORCH_THREADS_PER_WORKER") or 0) or max(
+    1, (os.cpu_count() or 1) // workers
+)
+# torch sizes its OpenMP/MKL pools from these when it is first imported,
+# which happens in the master during preload.
+os.environ.setdefault("OMP_NUM_THREADS", str(torch_threads))
+os.environ.setdefault("MKL_NUM_THREADS", str(torch_threads))
+
+# Settings and prometheus_client read these when the app is preloaded.
+if workers > 1:
+    os.environ.setdefault("SESSION_LOCK_BACKEND", "postgres")
+    os.environ.setdefault("RATE_LIMIT_BACKEND", "postgres")
+    if not os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="yf-prometheus-")
+    # Values left over from a previous run would be added to this one's.
+    for path in glob.glob(os.path.join(os.environ["PROMETHEUS_MULTIPROC_DIR"], "*.db")):
+        os.remove(path)
+
+
+def _multi_worker_problems() -> list:
+    from core.config import settings
+
+    problems = []
+    if settings.session_lock_backend != "postgres":
+        problems.append("SESSION_LOCK_BACKEND=postgres")
+    if settings.rate_limit_enabled and settings.rate_limit_backend != "postgres":
+        problems.append("RATE_LIMIT_BACKEND=postgres")
+    if settings.history_cache_sessions > 0 and settings.history_cache_invalidation != "postgres":
+        problems.append("HISTORY_CACHE_INVALIDATION=postgres")
+    if settings.vector_store_backend == "chroma" and not settings.vector_service_url:
+        problems.append("VECTOR_SERVICE_URL")
+    if not os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        problems.append("PROMETHEUS_MULTIPROC_DIR")
+    return problems
+
+
+def when_ready(server):
+    # Runs in the master after preload and before the first fork.  No warm-up
+    # encode here: an OpenMP pool started in the master can hang after fork.
+    if server.cfg.workers > 1:
+        problems = _multi_worker_problems()
+        if problems:
+            server.log.error(
+                "%d workers need shared state; set %s or run one worker",
+                server.cfg.workers,
+                ", ".join(problems),
+            )
+            sys.exit(1)
+    from core.embeddings import get_embedder
+    from core.personas import catalog
+
+    get_embedder()
+    catalog()
+    gc.freeze()
+    server.log.info("Preloaded embedder and personas; %d torch threads per worker", torch_threads)
+
+
+def post_fork(server, worker):
+    from core.database import engine, lock_engine
+    from core.log import configure_logging
+
+    # The master's pooled connections stay with the master.
+    engine.dispose(close=False)
+    lock_engine.dispose(close=False)
+    configure_logging()  # the log writer thread was not forked
+    if "torch" in sys.modules:
+        sys.modules["torch"].set_num_threads(torch_threads)
+
+
+def child_exit(server, worker):
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
@@ -1,10 +1,74 @@
+from contextlib import asynccontextmanager
+from anyio import to_thread
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from routers import auth, ai, user, personas
-from core.database import init_db
+from routers import auth, ai, user, personas, metrics, admin, imports, groups
+from core.database import engine, init_db
+from core.embeddings import get_embedder
+from core.history_cache import HistoryInvalidationListener, history_cache
+from core.llm import close_llm_provider
+from core.partitions import PartitionMaintainer
+from core.ratelimit import RateLimitMiddleware, build_bucket_store, parse_rules
+from core.log import RequestIdMiddleware, configure_logging
+from core.metrics import MetricsMiddleware, instrument_engine
+from core.compression import CompressionMiddleware
+from core.profiling import ProfilingMiddleware, profile_engine
+from core.config import settings
 
+configure_logging()
 init_db()
-app = FastAPI()
+instrument_engine(engine)
+if settings.profiling_enabled:
+    profile_engine(engine)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Every turn admitted by core.ratelimit.admit_llm_turn waits for the LLM on a
+    # threadpool thread; the other sync routes keep THREADPOOL_HEADROOM of their own.
+    to_thread.current_default_thread_limiter().total_tokens = (
+        settings.llm_max_concurrency + settings.llm_max_queue + settings.threadpool_headroom
+    )
+    get_embedder()  # load the model before the first chat turn, not during it
+    maintainer = None
+    if settings.partition_maintenance_interval_seconds > 0:
+        maintainer = PartitionMaintainer(settings.partition_maintenance_interval_seconds)
+        maintainer.start()
+    listener = None
+    if history_cache.enabled and settings.history_cache_invalidation == "postgres":
+        listener = HistoryInvalidationListener(engine)
+        listener.start()
+    yield
+    if maintainer:
+        maintainer.stop()
+    if listener:
+        listener.stop()
+    close_llm_provider()
+
+
+app = FastAPI(lifespan=lifespan)
+
+if settings.rate_limit_enabled:
+    app.add_middleware(
+        RateLimitMiddleware,
+        rules=parse_rules(settings.rate_limit_rules),
+        store=build_bucket_store(),
+    )
+
+if settings.profiling_enabled:
+    app.add_middleware(
+        ProfilingMiddleware,
+        sample_rate=settings.profiling_sample_rate,
+        slow_ms=settings.profiling_slow_ms,
+    )
+
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=settings.compress_min_bytes,
+    level=settings.compress_level,
+)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(RequestIdMiddleware)
 
 origins = ["http://127.0.0.1:8000", "http://localhost:5173", "http://localhost:5174"]
 
@@ -20,6 +84,10 @@ app.include_router(auth.router)
 app.include_router(ai.router)
 app.include_router(user.router)
 app.include_router(personas.router)
+app.include_router(metrics.router)
+app.include_router(admin.router)
+app.include_router(imports.router)
+app.include_router(groups.router)
 
 
 @app.get("/")
@@ -8,6 +8,12 @@ from sqlalchemy import (
     ForeignKey,
     JSON,
     Text,
+    Float,
+    Index,
+    LargeBinary,
+    PrimaryKeyConstraint,
+    func,
+    text,
 )
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -65,13 +71,14 @@ class Relationship(Base):
 class Message(Base):
     __tablename__ = "messages"
 
-    id = Column(Integer, primary_key=True)
+    # (id, timestamp) so the table can be range-partitioned by month; ids stay unique.
+    id = Column(Integer, primary_key=True, autoincrement=True)
     sender_id = Column(Integer, ForeignKey("users.id"))
     receiver_id = Column(Integer, ForeignKey("users.id"))
     content = Column(Text)
     content_type = Column(String, default="text")
     voice_file = Column(String, nullable=True)
-    timestamp = Column(DateTime, default=datetime.utcnow)
+    timestamp = Column(DateTime, default=datetime.utcnow, primary_key=True)
     is_read = Column(Boolean, default=False)
     is_ai = Column(Boolean, default=False)
     meta_data = Column(JSON, nullable=True)
@@ -83,6 +90,41 @@ class Message(Base):
         "User", foreign_keys=[receiver_id], back_populates="messages_received"
     )
 
+    __table_args__ = (
+        # A user's messages in time order (history, export).
+        Index("ix_messages_sender_timestamp", sender_id, timestamp),
+        Index("ix_messages_receiver_timestamp", receiver_id, timestamp),
+        # Unread AI replies per user, for the bulk mark-read endpoint.
+        Index(
+            "ix_messages_unread_ai",
+            receiver_id,
+            postgresql_where=text("is_ai AND NOT is_read"),
+        ),
+        # Partitions are created and archived by core/partitions.py.
+        {"postgresql_partition_by": "RANGE (timestamp)"},
+    )
+
+
+class Conversation(Base):
+    """Inbox row per chat session, updated in the same transaction as each message."""
+
+    __tablename__ = "conversations"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    session_id = Column(String, nullable=False)
+    persona_key = Column(String, nullable=False)  # persona name or "custom_<id>"
+    # No foreign key: the message may be archived out of the messages table.
+    last_message_id = Column(Integer, nullable=False)
+    last_message_at = Column(DateTime, nullable=False)
+    last_message_preview = Column(String(200), nullable=False, default="")
+    last_message_is_ai = Column(Boolean, nullable=False, default=False)
+    unread_count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        PrimaryKeyConstraint("user_id", "session_id"),
+        Index("ix_conversations_user_recent", user_id, last_message_at, session_id),
+    )
+
 
 class CustomPersona(Base):
     __tablename__ = "custom_personas"
@@ -99,3 +141,129 @@ class CustomPersona(Base):
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     user = relationship("User", back_populates="custom_personas")
+
+    __table_args__ = (
+        # One active persona per name (case-insensitive) per user.
+        Index(
+            "uq_custom_personas_user_active_name",
+            user_id,
+            func.lower(name),
+            unique=True,
+            postgresql_where=text("is_active"),
+        ),
+        Index("ix_custom_personas_user_active_created", user_id, is_active, created_at),
+    )
+
+
+class GroupChat(Base):
+    """A conversation of one user with several personas at once (core/group_chat.py)."""
+
+    __tablename__ = "group_chats"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    name = Column(String, nullable=False)
+    # [{"persona": "Alice", "custom_persona_id": null}, ...] in reply order
+    members = Column(JSON, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (Index("ix_group_chats_user_created", user_id, created_at),)
+
+
+class PersonaExampleEmbedding(Base):
+    """Embedded example inputs of a custom persona, for per-turn few-shot selection."""
+
+    __tablename__ = "persona_example_embeddings"
+
+    custom_persona_id = Column(
+        Integer, ForeignKey("custom_personas.id", ondelete="CASCADE"), primary_key=True
+    )
+    examples_hash = Column(String(64), nullable=False)  # of the examples they were made from
+    model = Column(String, nullable=False)
+    vectors = Column(LargeBinary, nullable=False)  # float32, one row per example
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class UserFact(Base):
+    """A durable fact about a user, distilled from their messages (core/user_facts.py)."""
+
+    __tablename__ = "user_facts"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    persona_key = Column(String, nullable=False)  # conversation the fact was learned in
+    key = Column(String(64), nullable=False)
+    value = Column(String(200), nullable=False)
+    source_message_id = Column(Integer, nullable=True)  # last message it was extracted from
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        Index("uq_user_facts_user_persona_key", user_id, persona_key, key, unique=True),
+        Index("ix_user_facts_user_updated", user_id, updated_at),
+    )
+
+
+class UserMemory(Base):
+    """Per-user fact memory settings."""
+
+    __tablename__ = "user_memory"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    share_facts = Column(Boolean, nullable=False, default=False)  # with every persona
+
+
+class FactExtractionCursor(Base):
+    """Last message of a session that fact extraction has read."""
+
+    __tablename__ = "fact_extraction_cursors"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    session_id = Column(String, nullable=False)
+    last_message_id = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (PrimaryKeyConstraint("user_id", "session_id"),)
+
+
+class IdempotencyKey(Base):
+    """Outcome of a client request sent with an ``Idempotency-Key`` header."""
+
+    __tablename__ = "idempotency_keys"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    key = Column(String(255), nullable=False)
+    request_hash = Column(String(64), nullable=False)
+    status = Column(String(16), nullable=False, default="in_progress")
+    response = Column(JSON, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (PrimaryKeyConstraint("user_id", "key"),)
+
+
+class RateLimitBucket(Base):
+    """Token bucket state shared by all workers (RATE_LIMIT_BACKEND=postgres)."""
+
+    __tablename__ = "rate_limit_buckets"
+
+    key = Column(String, primary_key=True)
+    tokens = Column(Float, nullable=False)
+    allowed = Column(Boolean, nullable=False)
+    updated_at = Column(DateTime(timezone=True), nullable=False)
+
+
+class ImportJob(Base):
+    """Progress and resume checkpoint of a bulk NDJSON import."""
+
+    __tablename__ = "import_jobs"
+
+    id = Column(String(32), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    source = Column(String, nullable=False)  # path of the NDJSON file being imported
+    status = Column(String(16), nullable=False, default="pending")
+    lines_done = Column(Integer, nullable=False, default=0)  # resume point
+    messages_imported = Column(Integer, nullable=False, default=0)
+    personas_imported = Column(Integer, nullable=False, default=0)
+    lines_skipped = Column(Integer, nullable=False, default=0)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
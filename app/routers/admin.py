@@ -0,0 +1,39 @@
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from core import oauth2, profiling
+from core.config import settings
+
+router = APIRouter(prefix="/admin", tags=["Admin"])
+
+
+@router.get("/profiles")
+def list_profiles(current_admin=Depends(oauth2.get_current_admin)):
+    """Recent sampled or slow request profiles, newest first."""
+    return {"enabled": settings.profiling_enabled, "profiles": profiling.list_profiles()}
+
+
+def _get_profile_or_404(profile_id: str):
+    profile = profiling.get_profile(profile_id)
+    if not profile:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Profile {profile_id} not found",
+        )
+    return profile
+
+
+@router.get("/profiles/{profile_id}")
+def get_profile(profile_id: str, current_admin=Depends(oauth2.get_current_admin)):
+    """Summary, SQL statements and collapsed stacks of one profile."""
+    profile = _get_profile_or_404(profile_id)
+    return {
+        **profile.summary(),
+        "statements": profile.statements,
+        "stacks": dict(profile.stacks.most_common()),
+    }
+
+
+@router.get("/profiles/{profile_id}/collapsed")
+def get_profile_collapsed(profile_id: str, current_admin=Depends(oauth2.get_current_admin)):
+    """Collapsed stacks as plain text, ready for flamegraph.pl or speedscope."""
+    profile = _get_profile_or_404(profile_id)
+    return Response(profile.collapsed(), media_type="text/plain")
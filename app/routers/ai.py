@@ -1,26 +1,86 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from datetime import datetime
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import and_
+from sqlalchemy import and_, tuple_, update
+from sqlalchemy.dialects.postgresql import insert
 from core.ai_chat import AIChatSession
+from core.concurrency import SessionBusyError, SingleFlight, session_lock
+from core.export import MEDIA_TYPES, export_messages
+from core.history import session_id_for
+from core.idempotency import (
+    IdempotencyKeyBusy,
+    IdempotencyKeyMismatch,
+    idempotency_store,
+    request_fingerprint,
+)
+from core.llm import LLMError
+from core.ratelimit import AdmissionRejected, admit_llm_turn
+from core.responses import FastJSONResponse
 from core.database import get_db
 from core import oauth2
 from models import models
 from schemas import query_schemas
 
-router = APIRouter(prefix="/ai", tags=["AI Chat"])
+router = APIRouter(prefix="/ai", tags=["AI Chat"], default_response_class=FastJSONResponse)
 
+# Double-submits of the same message to the same session share one LLM call.
+inflight_chats = SingleFlight()
 
-@router.post("/chat", response_model=query_schemas.RespondQuery)
+
+@router.post(
+    "/chat", response_model=query_schemas.RespondQuery, dependencies=[Depends(admit_llm_turn)]
+)
 def chat_with_ai(
     req: query_schemas.ChatQuery,
     custom_persona_id: int = Query(
         None, description="ID of custom persona to use instead of default persona"
     ),
+    idempotency_key: str = Header(None, alias="Idempotency-Key", max_length=255),
     current_user=Depends(oauth2.get_current_user),
     db: Session = Depends(get_db),
 ):
-    """Send a message to the AI and return the response."""
-    print("OK")
+    """Send a message to the AI and return the response.
+
+    Clients may send an ``Idempotency-Key`` header; retries with the same key
+    return the original response instead of generating a new one.
+    """
+    if not idempotency_key:
+        return _chat_turn(req, custom_persona_id, current_user, db)
+
+    fingerprint = request_fingerprint(
+        {"message": req.message, "persona": req.persona, "custom_persona_id": custom_persona_id}
+    )
+    try:
+        stored = idempotency_store.begin(db, current_user.id, idempotency_key, fingerprint)
+    except IdempotencyKeyMismatch:
+        raise HTTPException(
+            status_code=422,
+            detail="Idempotency-Key was already used for a different request",
+        )
+    except IdempotencyKeyBusy:
+        raise HTTPException(
+            status_code=409,
+            detail="A request with this Idempotency-Key is still in progress",
+            headers={"Retry-After": "1"},
+        )
+    if stored is not None:
+        return query_schemas.RespondQuery(**stored)
+
+    try:
+        result = _chat_turn(req, custom_persona_id, current_user, db)
+    except BaseException:
+        idempotency_store.abandon(db, current_user.id, idempotency_key)
+        raise
+    idempotency_store.complete(
+        db, current_user.id, idempotency_key, result.model_dump(mode="json")
+    )
+    return result
+
+
+def _chat_turn(
+    req: query_schemas.ChatQuery, custom_persona_id: int, current_user, db: Session
+) -> query_schemas.RespondQuery:
     user = db.query(models.User).filter(models.User.id == current_user.id).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
@@ -45,20 +105,40 @@ def chat_with_ai(
                 status_code=404, detail="Custom persona not found or not accessible"
             )
 
-        session_id = f"{current_user.id}_custom_{custom_persona_id}"
+        session_id = session_id_for(current_user.id, custom_persona_id=custom_persona_id)
         persona_name = custom_persona.name
     else:
-        session_id = f"{current_user.id}_{req.persona}"
+        session_id = session_id_for(current_user.id, req.persona)
         persona_name = req.persona
 
-    chat = AIChatSession(
-        db=db,
-        session_id=session_id,
-        user_id=current_user.id,
-        persona_name=persona_name,
-        custom_persona_id=custom_persona_id,
-    )
-    response = chat.send_message(req.message)
+    def run_turn():
+        with session_lock(session_id):
+            chat = AIChatSession(
+                db=db,
+                session_id=session_id,
+                user_id=current_user.id,
+                persona_name=persona_name,
+                custom_persona_id=custom_persona_id,
+            )
+            return chat.send_message(req.message)
+
+    try:
+        response = inflight_chats.do((session_id, req.message), run_turn)
+    except SessionBusyError:
+        raise HTTPException(
+            status_code=409,
+            detail="A previous message in this conversation is still being answered",
+            headers={"Retry-After": "1"},
+        )
+    except AdmissionRejected as e:
+        raise _overloaded(e.retry_after)
+    except LLMError as e:
+        retry_after = max(1, round(e.retry_after or 5))
+        raise HTTPException(
+            status_code=503,
+            detail="The AI is temporarily unavailable, please try again shortly",
+            headers={"Retry-After": str(retry_after)},
+        )
 
     return query_schemas.RespondQuery(
         persona=persona_name,
@@ -69,12 +149,23 @@ def chat_with_ai(
     )
     
 
+def _overloaded(retry_after: float) -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail="The AI is busy right now, please try again shortly",
+        headers={"Retry-After": str(max(1, round(retry_after)))},
+    )
+
+
 @router.get("/history", response_model=query_schemas.HistoryQuery)
 def get_chat_history(
     persona: str = Query(None, description="Default persona name"),
     custom_persona_id: int = Query(None, description="ID of custom persona"),
     current_user=Depends(oauth2.get_current_user),
     session_id: str = Query(None),
+    include_archived: bool = Query(
+        False, description="Also read months moved out of the database"
+    ),
     db: Session = Depends(get_db),
 ):
     """
@@ -106,7 +197,7 @@ def get_chat_history(
             )
 
         if not session_id:
-            session_id = f"{current_user.id}_custom_{custom_persona_id}"
+            session_id = session_id_for(current_user.id, custom_persona_id=custom_persona_id)
         persona_name = custom_persona.name
     else:
         if not persona:
@@ -116,7 +207,7 @@ def get_chat_history(
             )
 
         if not session_id:
-            session_id = f"{current_user.id}_{persona}"
+            session_id = session_id_for(current_user.id, persona)
         persona_name = persona
 
     chat = AIChatSession(
@@ -126,7 +217,162 @@ def get_chat_history(
         persona_name=persona_name,
         custom_persona_id=custom_persona_id,
     )
-    history = chat.get_history()
-    return query_schemas.HistoryQuery(
-        persona=persona_name, session_id=session_id, history=history
-    )
\ No newline at end of file
+    history = chat.get_history(include_archived=include_archived)
+    return FastJSONResponse(
+        query_schemas.HistoryQuery(persona=persona_name, session_id=session_id, history=history)
+    )
+
+@router.get("/conversations", response_model=query_schemas.ConversationPage)
+def list_conversations(
+    limit: int = Query(20, ge=1, le=100),
+    cursor: str = Query(None, description="next_cursor from the previous page"),
+    current_user=Depends(oauth2.get_current_user),
+    db: Session = Depends(get_db),
+):
+    """Inbox: the user's conversations, most recent first, with unread counts."""
+    query = db.query(models.Conversation).filter(
+        models.Conversation.user_id == current_user.id
+    )
+    if cursor:
+        try:
+            before_at, before_session = cursor.split("|", 1)
+            before_at = datetime.fromisoformat(before_at)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query = query.filter(
+            tuple_(models.Conversation.last_message_at, models.Conversation.session_id)
+            < tuple_(before_at, before_session)
+        )
+
+    rows = (
+        query.order_by(
+            models.Conversation.last_message_at.desc(),
+            models.Conversation.session_id.desc(),
+        )
+        .limit(limit + 1)
+        .all()
+    )
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = f"{rows[-1].last_message_at.isoformat()}|{rows[-1].session_id}"
+    return FastJSONResponse(
+        query_schemas.ConversationPage(conversations=rows, next_cursor=next_cursor)
+    )
+
+
+@router.post("/conversations/read", response_model=query_schemas.MarkReadResponse)
+def mark_conversations_read(
+    req: query_schemas.MarkReadRequest,
+    current_user=Depends(oauth2.get_current_user),
+    db: Session = Depends(get_db),
+):
+    """Mark the AI messages of the given conversations (or all of them) as read."""
+    message_filters = [
+        models.Message.receiver_id == current_user.id,
+        models.Message.is_ai == True,
+        models.Message.is_read == False,
+    ]
+    conversation_filters = [
+        models.Conversation.user_id == current_user.id,
+        models.Conversation.unread_count > 0,
+    ]
+    if req.session_ids is not None:
+        message_filters.append(
+            models.Message.meta_data["session_id"].as_string().in_(req.session_ids)
+        )
+        conversation_filters.append(models.Conversation.session_id.in_(req.session_ids))
+
+    messages = db.execute(
+        update(models.Message)
+        .where(and_(*message_filters))
+        .values(is_read=True)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    conversations = db.execute(
+        update(models.Conversation)
+        .where(and_(*conversation_filters))
+        .values(unread_count=0)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.commit()
+
+    return query_schemas.MarkReadResponse(conversations=conversations, messages=messages)
+
+
+@router.get("/export")
+def export_history(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    gzip: bool = Query(False, description="gzip-compress the download"),
+    session_id: str = Query(None, description="Only export this session"),
+    current_user=Depends(oauth2.get_current_user),
+):
+    """Stream every message of the authenticated user as NDJSON or CSV."""
+    if session_id and not session_id.startswith(f"{current_user.id}_"):
+        raise HTTPException(status_code=404, detail="Session not found")
+
+    filename = f"chat-export-{current_user.id}.{format}" + (".gz" if gzip else "")
+    return StreamingResponse(
+        export_messages(current_user.id, format, gzip, session_id),
+        media_type="application/gzip" if gzip else MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@router.get("/facts", response_model=query_schemas.FactList)
+def list_facts(
+    current_user=Depends(oauth2.get_current_user),
+    db: Session = Depends(get_db),
+):
+    """What the personas have learned about the user, newest first."""
+    facts = (
+        db.query(models.UserFact)
+        .filter(models.UserFact.user_id == current_user.id)
+        .order_by(models.UserFact.updated_at.desc())
+        .all()
+    )
+    memory = db.get(models.UserMemory, current_user.id)
+    return FastJSONResponse(
+        query_schemas.FactList(
+            share_across_personas=bool(memory and memory.share_facts), facts=facts
+        )
+    )
+
+
+@router.delete("/facts/{fact_id}", response_model=query_schemas.FactDeleteResponse)
+def delete_fact(
+    fact_id: int,
+    current_user=Depends(oauth2.get_current_user),
+    db: Session = Depends(get_db),
+):
+    """Forget one fact."""
+    deleted = (
+        db.query(models.UserFact)
+        .filter(
+            and_(models.UserFact.id == fact_id, models.UserFact.user_id == current_user.id)
+        )
+        .delete(synchronize_session=False)
+    )
+    if not deleted:
+        raise HTTPException(status_code=404, detail="Fact not found")
+    db.commit()
+    return query_schemas.FactDeleteResponse(
+        message="Fact forgotten", deleted_fact_id=fact_id
+    )
+
+
+@router.put("/facts/sharing", response_model=query_schemas.FactSharing)
+def set_fact_sharing(
+    req: query_schemas.FactSharing,
+    current_user=Depends(oauth2.get_current_user),
+    db: Session = Depends(get_db),
+):
+    """Opt in (or out) of every persona seeing the facts learned by the others."""
+    db.execute(
+        insert(models.UserMemory)
+        .values(user_id=current_user.id, share_facts=req.enabled)
+        .on_conflict_do_update(index_elements=["user_id"], set_={"share_facts": req.enabled})
+    )
+    db.commit()
+    return req
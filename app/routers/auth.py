@@ -7,11 +7,14 @@ from schemas import user_schemas
 from core import oauth2
 from schemas import token_schemas
 from core.utils import verify, hash
+import logging
 
 router = APIRouter(
     tags=['Authentication']
 )
 
+logger = logging.getLogger(__name__)
+
 @router.post('/log-in', response_model=token_schemas.Token)
 def user_login(user_credentials: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
 
@@ -31,7 +34,7 @@ def user_login(user_credentials: OAuth2PasswordRequestForm = Depends(), db: Sess
                 detail="Invalid Credentials"
             )
     except Exception as e:
-        print(f"Password verification failed: {e}")
+        logger.warning("Password verification failed: %s", type(e).__name__)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Authentication error"
@@ -0,0 +1,167 @@
+from itertools import chain
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+from sqlalchemy import and_
+from core import oauth2
+from core.concurrency import SessionBusyError
+from core.database import get_db
+from core.group_chat import GroupNotFoundError, group_session_id, group_turn
+from core.personas import get_default_persona
+from core.ratelimit import admit_llm_turn
+from models import models
+from schemas import group_schemas
+
+router = APIRouter(prefix="/groups", tags=["Group Chat"])
+
+
+def _get_group(group_id: int, user_id: int, db: Session) -> models.GroupChat:
+    group = (
+        db.query(models.GroupChat)
+        .filter(and_(models.GroupChat.id == group_id, models.GroupChat.user_id == user_id))
+        .first()
+    )
+    if not group:
+        raise HTTPException(status_code=404, detail="Group chat not found")
+    return group
+
+
+def _resolve_member(member: group_schemas.GroupMember, user_id: int, db: Session) -> dict:
+    if member.custom_persona_id:
+        custom_persona = (
+            db.query(models.CustomPersona)
+            .filter(
+                and_(
+                    models.CustomPersona.id == member.custom_persona_id,
+                    models.CustomPersona.user_id == user_id,
+                    models.CustomPersona.is_active == True,
+                )
+            )
+            .first()
+        )
+        if not custom_persona:
+            raise HTTPException(
+                status_code=404, detail="Custom persona not found or not accessible"
+            )
+        return {"persona": custom_persona.name, "custom_persona_id": custom_persona.id}
+
+    try:
+        get_default_persona(member.persona)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Persona '{member.persona}' not found")
+    return {"persona": member.persona, "custom_persona_id": None}
+
+
+@router.post("/", response_model=group_schemas.GroupResponse, status_code=status.HTTP_201_CREATED)
+def create_group(
+    group: group_schemas.GroupCreate,
+    current_user=Depends(oauth2.get_current_user),
+    db: Session = Depends(get_db),
+):
+    """Start a group chat; every member persona answers each message."""
+    members = [_resolve_member(member, current_user.id, db) for member in group.members]
+    names = [member["persona"].lower() for member in members]
+    if len(set(names)) != len(names):
+        raise HTTPException(status_code=400, detail="Group members must have different names")
+
+    db_group = models.GroupChat(user_id=current_user.id, name=group.name.strip(), members=members)
+    db.add(db_group)
+    db.commit()
+    db.refresh(db_group)
+    return db_group
+
+
+@router.get("/", response_model=list[group_schemas.GroupResponse])
+def list_groups(
+    current_user=Depends(oauth2.get_current_user),
+    db: Session = Depends(get_db),
+):
+    return (
+        db.query(models.GroupChat)
+        .filter(models.GroupChat.user_id == current_user.id)
+        .order_by(models.GroupChat.created_at.desc())
+        .all()
+    )
+
+
+@router.delete("/{group_id}", response_model=group_schemas.GroupDeleteResponse)
+def delete_group(
+    group_id: int,
+    current_user=Depends(oauth2.get_current_user),
+    db: Session = Depends(get_db),
+):
+    """Delete a group chat. Its messages stay in the history and exports."""
+    group = _get_group(group_id, current_user.id, db)
+    db.delete(group)
+    db.commit()
+    return group_schemas.GroupDeleteResponse(
+        message=f"Group chat '{group.name}' has been deleted", deleted_group_id=group_id
+    )
+
+
+@router.post("/{group_id}/chat", dependencies=[Depends(admit_llm_turn)])
+def chat_with_group(
+    group_id: int,
+    req: group_schemas.GroupChatRequest,
+    current_user=Depends(oauth2.get_current_user),
+    db: Session = Depends(get_db),
+):
+    """
+    Send a message to every persona of the group at once. The response is
+    NDJSON, one event per line as it happens: ``user_message``, then a
+    ``reply`` (or ``error``) per persona in the order they finish, then ``done``.
+    """
+    group = _get_group(group_id, current_user.id, db)
+
+    # Take the session lock and load the personas before answering, so a busy
+    # session or a deleted persona is still an HTTP error and not a broken stream.
+    events = group_turn(current_user.id, group.id, req.message)
+    try:
+        first = next(events)
+    except SessionBusyError:
+        raise HTTPException(
+            status_code=409,
+            detail="A previous message in this group is still being answered",
+            headers={"Retry-After": "1"},
+        )
+    except GroupNotFoundError:
+        raise HTTPException(status_code=404, detail="Group chat not found")
+    except (ValueError, FileNotFoundError):
+        raise HTTPException(
+            status_code=409, detail="A persona of this group is no longer available"
+        )
+    return StreamingResponse(chain([first], events), media_type="application/x-ndjson")
+
+
+@router.get("/{group_id}/history", response_model=group_schemas.GroupHistory)
+def get_group_history(
+    group_id: int,
+    limit: int = Query(50, ge=1, le=200),
+    current_user=Depends(oauth2.get_current_user),
+    db: Session = Depends(get_db),
+):
+    """The group's latest messages, oldest first, each with the persona that sent it."""
+    group = _get_group(group_id, current_user.id, db)
+    session_id = group_session_id(current_user.id, group.id)
+    rows = (
+        db.query(models.Message)
+        .filter(
+            (models.Message.sender_id == current_user.id)
+            | (models.Message.receiver_id == current_user.id),
+            models.Message.meta_data["session_id"].as_string() == session_id,
+            models.Message.timestamp >= group.created_at,
+        )
+        .order_by(models.Message.id.desc())
+        .limit(limit)
+        .all()
+    )
+    history = [
+        group_schemas.GroupMessage(
+            id=row.id,
+            persona=(row.meta_data or {}).get("persona") if row.is_ai else None,
+            content=row.content,
+            timestamp=row.timestamp,
+        )
+        for row in reversed(rows)
+    ]
+    return group_schemas.GroupHistory(group_id=group.id, session_id=session_id, history=history)
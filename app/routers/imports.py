@@ -0,0 +1,85 @@
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+from sqlalchemy import and_
+import os
+import uuid
+from core import importer, oauth2
+from core.config import settings
+from core.database import get_db
+from models import models
+from schemas.import_schemas import ImportJobResponse
+
+router = APIRouter(prefix="/imports", tags=["Import"])
+
+
+def _get_job(job_id: str, user_id: int, db: Session) -> models.ImportJob:
+    job = (
+        db.query(models.ImportJob)
+        .filter(and_(models.ImportJob.id == job_id, models.ImportJob.user_id == user_id))
+        .first()
+    )
+    if not job:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    return job
+
+
+@router.post("", response_model=ImportJobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def start_import(
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user=Depends(oauth2.get_current_user),
+):
+    """
+    Upload an NDJSON file of personas and messages (see ``core/importer.py``
+    for the line format) as the raw request body. The import runs in the
+    background; poll ``GET /imports/{job_id}`` for progress.
+    """
+    importer.IMPORT_DIR.mkdir(parents=True, exist_ok=True)
+    path = importer.IMPORT_DIR / f"{uuid.uuid4().hex}.ndjson"
+    size = 0
+    try:
+        with open(path, "wb") as f:
+            async for chunk in request.stream():
+                size += len(chunk)
+                if size > settings.import_max_bytes:
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        detail=f"Import files are limited to {settings.import_max_bytes} bytes",
+                    )
+                await run_in_threadpool(f.write, chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    if size == 0:
+        os.remove(path)
+        raise HTTPException(status_code=400, detail="Empty import file")
+
+    job = await run_in_threadpool(importer.create_job, db, current_user.id, path)
+    importer.submit(job.id)
+    return job
+
+
+@router.get("/{job_id}", response_model=ImportJobResponse)
+def get_import(
+    job_id: str,
+    db: Session = Depends(get_db),
+    current_user=Depends(oauth2.get_current_user),
+):
+    return _get_job(job_id, current_user.id, db)
+
+
+@router.post("/{job_id}/resume", response_model=ImportJobResponse, status_code=status.HTTP_202_ACCEPTED)
+def resume_import(
+    job_id: str,
+    db: Session = Depends(get_db),
+    current_user=Depends(oauth2.get_current_user),
+):
+    """Continue a failed or interrupted import from its last checkpoint."""
+    job = _get_job(job_id, current_user.id, db)
+    if job.status == "done":
+        raise HTTPException(status_code=400, detail="Import already finished")
+    if importer.is_running(job_id):
+        raise HTTPException(status_code=409, detail="Import is already running")
+    importer.submit(job.id)
+    return job
@@ -0,0 +1,18 @@
+import asyncio
+
+from fastapi import APIRouter, Response
+from core.metrics import CONTENT_TYPE_LATEST, MULTIPROCESS, render_latest
+
+router = APIRouter(tags=["Monitoring"])
+
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus scrape endpoint (kept async so it never waits on the threadpool)."""
+    if MULTIPROCESS:
+        # Merging every worker's files is disk I/O: keep it off the event loop,
+        # on asyncio's executor rather than the one serving sync routes.
+        body = await asyncio.to_thread(render_latest)
+    else:
+        body = render_latest()
+    return Response(body, media_type=CONTENT_TYPE_LATEST)
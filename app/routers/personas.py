@@ -1,13 +1,54 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from sqlalchemy.orm import Session
-from sqlalchemy import and_
+from sqlalchemy import and_, func, insert, literal, select, update
+from sqlalchemy.exc import IntegrityError
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
 from typing import List
 from core.database import get_db
 from core import oauth2
+from core.few_shot import store_custom_embeddings
+from core.personas import MAX_CUSTOM_PERSONAS, catalog
+from core.responses import FastJSONResponse
 from models import models
 from schemas import persona_schemas
 
-router = APIRouter(prefix="/personas", tags=["Custom Personas"])
+router = APIRouter(
+    prefix="/personas", tags=["Custom Personas"], default_response_class=FastJSONResponse
+)
+
+ACTIVE_NAME_INDEX = "uq_custom_personas_user_active_name"
+
+
+def _not_modified(request: Request, etag: str, last_modified) -> bool:
+    """Evaluate If-None-Match, falling back to If-Modified-Since."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return "*" in tags or etag.removeprefix("W/") in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        return last_modified.replace(tzinfo=timezone.utc, microsecond=0) <= since
+    return False
+
+
+def _name_conflict(error: IntegrityError, name) -> HTTPException:
+    """Map a violation of the active-name unique index to the usual 400."""
+    constraint = getattr(getattr(error.orig, "diag", None), "constraint_name", None)
+    if constraint != ACTIVE_NAME_INDEX:
+        raise error
+    return HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail=(
+            f"You already have an active persona named '{name}'"
+            if name
+            else "You already have an active persona with this name"
+        ),
+    )
 
 
 @router.post(
@@ -22,86 +63,134 @@ def create_custom_persona(
 ):
     """Create a new custom AI persona for the authenticated user."""
 
-    # Check if user already has a persona with this name
-    existing_persona = (
-        db.query(models.CustomPersona)
-        .filter(
+    # Convert example messages to dict format for JSON storage
+    example_messages_dict = []
+    if persona.example_messages:
+        example_messages_dict = [
+            {"input": msg.input, "output": msg.output}
+            for msg in persona.example_messages
+        ]
+
+    # One INSERT ... SELECT: the row is only produced while the user is under
+    # the persona limit, and the partial unique index rejects duplicate names.
+    # Under READ COMMITTED two concurrent creates would both count the same
+    # rows, so the user's row is locked first to serialize them.
+    db.execute(select(models.User.id).where(models.User.id == current_user.id).with_for_update())
+    now = datetime.utcnow()
+    values = {
+        "user_id": current_user.id,
+        "name": persona.name,
+        "system_prompt": persona.system_prompt,
+        "example_messages": example_messages_dict,
+        "avatar_url": persona.avatar_url,
+        "description": persona.description,
+        "is_active": True,
+        "created_at": now,
+        "updated_at": now,
+    }
+    active_count = (
+        select(func.count())
+        .select_from(models.CustomPersona)
+        .where(
             and_(
                 models.CustomPersona.user_id == current_user.id,
-                models.CustomPersona.name.ilike(persona.name),
                 models.CustomPersona.is_active == True,
             )
         )
-        .first()
+        .scalar_subquery()
     )
-
-    if existing_persona:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"You already have an active persona named '{persona.name}'",
+    table = models.CustomPersona.__table__
+    stmt = (
+        insert(models.CustomPersona)
+        .from_select(
+            list(values),
+            select(*[literal(value, table.c[key].type) for key, value in values.items()]).where(
+                active_count < MAX_CUSTOM_PERSONAS
+            ),
         )
-
-    # Check persona limit per user (optional - can be configured)
-    persona_count = (
-        db.query(models.CustomPersona)
-        .filter(
-            and_(
-                models.CustomPersona.user_id == current_user.id,
-                models.CustomPersona.is_active == True,
-            )
-        )
-        .count()
+        .returning(models.CustomPersona)
     )
 
-    if persona_count >= 10:  # Limit to 10 custom personas per user
+    try:
+        db_persona = db.scalars(stmt).first()
+    except IntegrityError as e:
+        db.rollback()
+        raise _name_conflict(e, persona.name)
+
+    if not db_persona:
+        db.rollback()
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Maximum number of custom personas reached (10). Please delete some to create new ones.",
+            detail=f"Maximum number of custom personas reached ({MAX_CUSTOM_PERSONAS}). Please delete some to create new ones.",
         )
 
-    # Convert example messages to dict format for JSON storage
-    example_messages_dict = []
-    if persona.example_messages:
-        example_messages_dict = [
-            {"input": msg.input, "output": msg.output}
-            for msg in persona.example_messages
-        ]
-
-    # Create new custom persona
-    db_persona = models.CustomPersona(
-        user_id=current_user.id,
-        name=persona.name,
-        system_prompt=persona.system_prompt,
-        example_messages=example_messages_dict,
-        avatar_url=persona.avatar_url,
-        description=persona.description,
-    )
-
-    db.add(db_persona)
+    store_custom_embeddings(db, db_persona.id, example_messages_dict)
+    response = persona_schemas.PersonaResponse.model_validate(db_persona)
     db.commit()
-    db.refresh(db_persona)
 
-    return db_persona
+    return response
 
 
 @router.get("/", response_model=persona_schemas.PersonaListResponse)
 def list_custom_personas(
+    request: Request,
     current_user=Depends(oauth2.get_current_user),
     db: Session = Depends(get_db),
     include_inactive: bool = False,
 ):
     """Get all custom personas for the authenticated user."""
 
-    query = db.query(models.CustomPersona).filter(
-        models.CustomPersona.user_id == current_user.id
+    filters = [models.CustomPersona.user_id == current_user.id]
+    if not include_inactive:
+        filters.append(models.CustomPersona.is_active == True)
+
+    # Cheap validator first. Creates, edits and soft deletes all bump updated_at,
+    # so the newest one is taken over every persona of the user: a persona
+    # deleted from the active list must still move Last-Modified forward.
+    count, last_updated = db.execute(
+        select(
+            func.count().filter(and_(*filters)),
+            func.max(models.CustomPersona.updated_at),
+        ).where(models.CustomPersona.user_id == current_user.id)
+    ).one()
+    stamp = int(last_updated.replace(tzinfo=timezone.utc).timestamp() * 1e6) if last_updated else 0
+    headers = {
+        "ETag": f'W/"{current_user.id}-{int(include_inactive)}-{count}-{stamp}"',
+        "Cache-Control": "private, no-cache",
+        "Vary": "Authorization",
+    }
+    if last_updated:
+        headers["Last-Modified"] = format_datetime(last_updated.replace(tzinfo=timezone.utc), usegmt=True)
+    if _not_modified(request, headers["ETag"], last_updated):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    # Only the columns PersonaListItem needs, not prompts and examples
+    personas = (
+        db.query(
+            models.CustomPersona.id,
+            models.CustomPersona.name,
+            models.CustomPersona.avatar_url,
+            models.CustomPersona.description,
+            models.CustomPersona.is_active,
+            models.CustomPersona.created_at,
+        )
+        .filter(and_(*filters))
+        .order_by(models.CustomPersona.created_at.desc())
+        .all()
     )
 
-    if not include_inactive:
-        query = query.filter(models.CustomPersona.is_active == True)
+    body = persona_schemas.PersonaListResponse(personas=personas, total=len(personas))
+    return FastJSONResponse(body, headers=headers)
 
-    personas = query.order_by(models.CustomPersona.created_at.desc()).all()
 
-    return persona_schemas.PersonaListResponse(personas=personas, total=len(personas))
+@router.get("/catalog")
+def get_persona_catalog(request: Request):
+    """Default personas shipped with the app; identical for every user."""
+    body, etag = catalog()
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=86400"}
+    if _not_modified(request, etag, None):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
 
 
 @router.get("/{persona_id}", response_model=persona_schemas.PersonaResponse)
@@ -128,7 +217,7 @@ def get_custom_persona(
             status_code=status.HTTP_404_NOT_FOUND, detail="Custom persona not found"
         )
 
-    return persona
+    return FastJSONResponse(persona_schemas.PersonaResponse.model_validate(persona))
 
 
 @router.put("/{persona_id}", response_model=persona_schemas.PersonaResponse)
@@ -140,44 +229,6 @@ def update_custom_persona(
 ):
     """Update a specific custom persona (only for the authenticated user)."""
 
-    # Find the persona and ensure it belongs to the current user
-    db_persona = (
-        db.query(models.CustomPersona)
-        .filter(
-            and_(
-                models.CustomPersona.id == persona_id,
-                models.CustomPersona.user_id == current_user.id,
-            )
-        )
-        .first()
-    )
-
-    if not db_persona:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, detail="Custom persona not found"
-        )
-
-    # Check for name conflicts if name is being updated
-    if persona_update.name and persona_update.name != db_persona.name:
-        existing_persona = (
-            db.query(models.CustomPersona)
-            .filter(
-                and_(
-                    models.CustomPersona.user_id == current_user.id,
-                    models.CustomPersona.name.ilike(persona_update.name),
-                    models.CustomPersona.is_active == True,
-                    models.CustomPersona.id != persona_id,
-                )
-            )
-            .first()
-        )
-
-        if existing_persona:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"You already have an active persona named '{persona_update.name}'",
-            )
-
     # Update fields
     update_data = persona_update.dict(exclude_unset=True)
 
@@ -192,13 +243,37 @@ def update_custom_persona(
         ]
         update_data["example_messages"] = example_messages_dict
 
-    for field, value in update_data.items():
-        setattr(db_persona, field, value)
+    # Ownership check, write and name conflict (via the unique index) in one UPDATE
+    stmt = (
+        update(models.CustomPersona)
+        .where(
+            and_(
+                models.CustomPersona.id == persona_id,
+                models.CustomPersona.user_id == current_user.id,
+            )
+        )
+        .values(**update_data, updated_at=datetime.utcnow())
+        .returning(models.CustomPersona)
+        .execution_options(synchronize_session=False)
+    )
+
+    try:
+        db_persona = db.scalars(stmt).first()
+    except IntegrityError as e:
+        db.rollback()
+        raise _name_conflict(e, persona_update.name)
 
+    if not db_persona:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Custom persona not found"
+        )
+
+    if "example_messages" in update_data:
+        store_custom_embeddings(db, persona_id, update_data["example_messages"] or [])
+    response = persona_schemas.PersonaResponse.model_validate(db_persona)
     db.commit()
-    db.refresh(db_persona)
 
-    return db_persona
+    return response
 
 
 @router.delete("/{persona_id}", response_model=persona_schemas.PersonaDeleteResponse)
@@ -244,49 +319,46 @@ def activate_custom_persona(
 ):
     """Reactivate a previously deleted custom persona."""
 
-    db_persona = (
-        db.query(models.CustomPersona)
-        .filter(
+    stmt = (
+        update(models.CustomPersona)
+        .where(
             and_(
                 models.CustomPersona.id == persona_id,
                 models.CustomPersona.user_id == current_user.id,
+                models.CustomPersona.is_active == False,
             )
         )
-        .first()
+        .values(is_active=True, updated_at=datetime.utcnow())
+        .returning(models.CustomPersona)
+        .execution_options(synchronize_session=False)
     )
 
-    if not db_persona:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, detail="Custom persona not found"
-        )
+    try:
+        db_persona = db.scalars(stmt).first()
+    except IntegrityError as e:
+        db.rollback()
+        existing = db.get(models.CustomPersona, persona_id)
+        raise _name_conflict(e, existing.name if existing else None)
 
-    if db_persona.is_active:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST, detail="Persona is already active"
-        )
-
-    # Check for name conflicts
-    existing_persona = (
-        db.query(models.CustomPersona)
-        .filter(
-            and_(
-                models.CustomPersona.user_id == current_user.id,
-                models.CustomPersona.name.ilike(db_persona.name),
-                models.CustomPersona.is_active == True,
-                models.CustomPersona.id != persona_id,
+    if not db_persona:
+        # Nothing updated: find out whether the persona is missing or already active
+        exists = db.scalar(
+            select(models.CustomPersona.is_active).where(
+                and_(
+                    models.CustomPersona.id == persona_id,
+                    models.CustomPersona.user_id == current_user.id,
+                )
             )
         )
-        .first()
-    )
-
-    if existing_persona:
+        if exists is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="Custom persona not found"
+            )
         raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"You already have an active persona named '{db_persona.name}'",
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Persona is already active"
         )
 
-    db_persona.is_active = True
+    response = persona_schemas.PersonaResponse.model_validate(db_persona)
     db.commit()
-    db.refresh(db_persona)
 
-    return db_persona
+    return response
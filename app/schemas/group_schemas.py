@@ -0,0 +1,61 @@
+from pydantic import BaseModel, Field, model_validator
+from datetime import datetime
+from typing import List, Optional
+
+MIN_GROUP_MEMBERS = 2
+MAX_GROUP_MEMBERS = 6
+
+
+class GroupMember(BaseModel):
+    persona: Optional[str] = None  # default persona name, e.g. "Alice"
+    custom_persona_id: Optional[int] = None
+
+    @model_validator(mode="after")
+    def check_persona(self):
+        if bool(self.persona) == bool(self.custom_persona_id):
+            raise ValueError("Exactly one of persona or custom_persona_id is required")
+        return self
+
+
+class GroupCreate(BaseModel):
+    name: str = Field(..., min_length=1, max_length=100)
+    members: List[GroupMember] = Field(
+        ..., min_length=MIN_GROUP_MEMBERS, max_length=MAX_GROUP_MEMBERS
+    )
+
+
+class GroupMemberResponse(BaseModel):
+    persona: str
+    custom_persona_id: Optional[int] = None
+
+
+class GroupResponse(BaseModel):
+    id: int
+    name: str
+    members: List[GroupMemberResponse]
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class GroupChatRequest(BaseModel):
+    message: str = Field(..., min_length=1)
+
+
+class GroupMessage(BaseModel):
+    id: int
+    persona: Optional[str] = None  # None for the user's own messages
+    content: str
+    timestamp: datetime
+
+
+class GroupHistory(BaseModel):
+    group_id: int
+    session_id: str
+    history: List[GroupMessage]
+
+
+class GroupDeleteResponse(BaseModel):
+    message: str
+    deleted_group_id: int
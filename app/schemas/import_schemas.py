@@ -0,0 +1,34 @@
+from pydantic import BaseModel, Field, model_validator
+from datetime import datetime
+from typing import Literal, Optional
+
+
+class ImportedMessage(BaseModel):
+    """One ``{"type": "message", ...}`` line of an import file."""
+
+    persona: Optional[str] = None  # default persona name, e.g. "Alice"
+    custom_persona: Optional[str] = None  # name of a custom persona
+    role: Literal["user", "ai"]
+    content: str = Field(..., min_length=1)
+    timestamp: Optional[datetime] = None
+
+    @model_validator(mode="after")
+    def check_persona(self):
+        if bool(self.persona) == bool(self.custom_persona):
+            raise ValueError("Exactly one of persona or custom_persona is required")
+        return self
+
+
+class ImportJobResponse(BaseModel):
+    id: str
+    status: str
+    lines_done: int
+    messages_imported: int
+    personas_imported: int
+    lines_skipped: int
+    last_error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+
+    class Config:
+        from_attributes = True
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from  datetime import datetime
 from typing import Optional, List
 
@@ -13,7 +13,65 @@ class RespondQuery(BaseModel):
     ai_response: str
     timestamp: datetime
 
+class HistoryMessage(BaseModel):
+    id: str
+    sender: str = Field(alias="from")  # the username, or "AI"
+    content: str
+    timestamp: datetime
+    archived: bool = False  # read back from the archive, see core/archive.py
+
 class HistoryQuery(BaseModel):
     persona: str
     session_id: str
-    history: List[dict]
\ No newline at end of file
+    history: List[HistoryMessage]
+
+class ConversationItem(BaseModel):
+    session_id: str
+    persona_key: str
+    last_message_id: int
+    last_message_at: datetime
+    last_message_preview: str
+    last_message_is_ai: bool
+    unread_count: int
+
+    class Config:
+        from_attributes = True
+
+
+class ConversationPage(BaseModel):
+    conversations: List[ConversationItem]
+    next_cursor: Optional[str] = None
+
+
+class MarkReadRequest(BaseModel):
+    session_ids: Optional[List[str]] = None  # None marks every conversation read
+
+
+class MarkReadResponse(BaseModel):
+    conversations: int
+    messages: int
+
+
+class FactItem(BaseModel):
+    id: int
+    persona_key: str
+    key: str
+    value: str
+    updated_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class FactList(BaseModel):
+    share_across_personas: bool
+    facts: List[FactItem]
+
+
+class FactSharing(BaseModel):
+    enabled: bool
+
+
+class FactDeleteResponse(BaseModel):
+    message: str
+    deleted_fact_id: int
@@ -0,0 +1,14 @@
+import os
+
+# core.config requires these; the tests never talk to a real database or LLM.
+for key, value in {
+    "POSTGRES_DB": "yf_test",
+    "POSTGRES_USER": "postgres",
+    "POSTGRES_PASSWORD": "test",
+    "SECRET_KEY": "test",
+    "ALGORITHM": "HS256",
+    "ACCESS_TOKEN_EXPIRE_MINUTES": "15",
+    "REFRESH_TOKEN_EXPIRE_DAYS": "1",
+    "GROQ_API_KEY": "test",
+}.items():
+    os.environ.setdefault(key, value)
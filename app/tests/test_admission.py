@@ -0,0 +1,109 @@
+"""LLM admission control, on its own and in front of a sync route.
+
+    uv run python -m unittest discover -s tests -t .
+"""
+
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+import unittest
+
+from anyio import to_thread
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+
+from core import ratelimit
+from core.ratelimit import AdmissionController, AdmissionRejected, admit_llm_turn
+
+
+def hold_slot(controller: AdmissionController, release: threading.Event, entered=None):
+    with controller.slot():
+        if entered is not None:
+            entered.set()
+        release.wait(5)
+
+
+class AdmissionControllerTest(unittest.TestCase):
+    def test_admits_up_to_concurrency_plus_queue(self):
+        controller = AdmissionController(max_concurrent=2, max_queue=3, queue_timeout=1)
+        self.assertEqual([controller.admit() for _ in range(6)], [True] * 5 + [False])
+        controller.release()
+        self.assertTrue(controller.admit())
+        self.assertEqual(controller.admitted, 5)
+
+    def test_rejects_beyond_the_queue_without_waiting(self):
+        controller = AdmissionController(max_concurrent=1, max_queue=1, queue_timeout=5)
+        release, entered = threading.Event(), threading.Event()
+        with ThreadPoolExecutor(2) as pool:
+            pool.submit(hold_slot, controller, release, entered)
+            entered.wait(1)
+            pool.submit(hold_slot, controller, release)  # queued
+            while controller.waiting < 1:
+                time.sleep(0.01)
+            started = time.monotonic()
+            with self.assertRaises(AdmissionRejected):
+                with controller.slot():
+                    pass
+            self.assertLess(time.monotonic() - started, 0.5)
+            release.set()
+        self.assertEqual((controller.active, controller.waiting), (0, 0))
+
+    def test_queued_request_times_out(self):
+        controller = AdmissionController(max_concurrent=1, max_queue=1, queue_timeout=0.1)
+        release, entered = threading.Event(), threading.Event()
+        with ThreadPoolExecutor(1) as pool:
+            pool.submit(hold_slot, controller, release, entered)
+            entered.wait(1)
+            with self.assertRaises(AdmissionRejected):
+                with controller.slot():
+                    pass
+            release.set()
+
+
+class AdmitLLMTurnTest(unittest.TestCase):
+    def setUp(self):
+        self.original = ratelimit.llm_admission
+        ratelimit.llm_admission = AdmissionController(
+            max_concurrent=1, max_queue=1, queue_timeout=1
+        )
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+
+        @asynccontextmanager
+        async def lifespan(app):
+            # No thread to spare once the admitted turns are running.
+            to_thread.current_default_thread_limiter().total_tokens = 2
+            yield
+
+        app = FastAPI(lifespan=lifespan)
+
+        @app.post("/chat", dependencies=[Depends(admit_llm_turn)])
+        def chat():  # sync, like the real chat routes
+            self.release.wait(5)
+            return {"ok": True}
+
+        self.client = TestClient(app)
+        self.client.__enter__()
+        self.addCleanup(self.client.__exit__, None, None, None)
+
+    def tearDown(self):
+        ratelimit.llm_admission = self.original
+
+    def test_turn_beyond_the_queue_is_shed_without_a_thread(self):
+        with ThreadPoolExecutor(2) as pool:
+            running = [pool.submit(self.client.post, "/chat") for _ in range(2)]
+            while ratelimit.llm_admission.admitted < 2:
+                time.sleep(0.01)
+            started = time.monotonic()
+            response = self.client.post("/chat")
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response.headers["retry-after"], "1")
+            self.assertLess(time.monotonic() - started, 1)
+            self.release.set()
+            self.assertEqual([f.result().status_code for f in running], [200, 200])
+        self.assertEqual(ratelimit.llm_admission.admitted, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
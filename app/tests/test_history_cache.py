@@ -0,0 +1,44 @@
+import unittest
+from datetime import datetime
+
+from core.history_cache import CachedMessage, HistoryCache
+
+
+def message(id: int) -> CachedMessage:
+    return CachedMessage(id, False, f"message {id}", datetime(2025, 1, 1))
+
+
+class HistoryCacheTest(unittest.TestCase):
+    def test_write_during_a_load_is_not_lost(self):
+        cache = HistoryCache(max_sessions=10, window=50, ttl=300)
+        token = cache.token("s")
+        cache.append("s", message(2))  # committed while the load was reading
+        cache.put("s", [message(1)], token)
+        cache.append("s", message(3))
+        self.assertIsNone(cache.get("s"))
+
+    def test_load_without_writes_is_cached_and_extended(self):
+        cache = HistoryCache(max_sessions=10, window=50, ttl=300)
+        token = cache.token("s")
+        cache.put("s", [message(1), message(2)], token)
+        cache.append("s", message(3))
+        self.assertEqual([m.id for m in cache.get("s")], [1, 2, 3])
+
+    def test_forgotten_write_versions_still_reject_the_load(self):
+        cache = HistoryCache(max_sessions=2, window=50, ttl=300)
+        token = cache.token("a")
+        for session_id in ("a", "b", "c"):  # "a"'s version is evicted
+            cache.append(session_id, message(1))
+        cache.put("a", [message(0)], token)
+        self.assertIsNone(cache.get("a"))
+
+    def test_invalidation_during_a_load_is_not_lost(self):
+        cache = HistoryCache(max_sessions=10, window=50, ttl=300)
+        token = cache.token("s")
+        cache.invalidate("s")
+        cache.put("s", [message(1)], token)
+        self.assertIsNone(cache.get("s"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,238 @@
+"""LLMProvider against httpx.MockTransport and bench/stub_llm.py.
+
+    uv run python -m unittest discover -s tests -t .
+"""
+
+import threading
+import time
+import unittest
+
+import httpx
+
+from bench.stub_llm import StubConfig, start_stub_server
+from core.llm import CircuitBreaker, CircuitOpenError, LLMError, LLMProvider, LLMTimeoutError
+
+
+def completion(model: str, text: str = "hi") -> httpx.Response:
+    return httpx.Response(
+        200,
+        json={
+            "model": model,
+            "choices": [{"message": {"role": "assistant", "content": text}}],
+            "usage": {"prompt_tokens": 3, "completion_tokens": 1},
+        },
+    )
+
+
+class Transport:
+    """MockTransport whose behaviour is chosen per model and call number."""
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        import json
+
+        model = json.loads(request.content)["model"]
+        with self._lock:
+            self.calls.append(model)
+            number = self.calls.count(model)
+        return self.handler(request, model, number)
+
+    def count(self, model: str) -> int:
+        return self.calls.count(model)
+
+
+def provider(handler, **kwargs) -> LLMProvider:
+    transport = Transport(handler)
+    options = {
+        "base_url": "http://llm.test/v1",
+        "api_key": "test",
+        "models": ["primary", "fallback"],
+        "timeout": 2.0,
+        "max_retries": 2,
+        "backoff_base": 0.001,
+        "backoff_max": 0.001,
+        "breaker_failure_threshold": 2,
+        "breaker_reset_seconds": 0.05,
+        **kwargs,
+    }
+    llm = LLMProvider(transport=httpx.MockTransport(transport), **options)
+    llm.transport = transport
+    return llm
+
+
+MESSAGES = [{"role": "user", "content": "hello"}]
+
+
+class CircuitBreakerTest(unittest.TestCase):
+    def test_opens_after_consecutive_failures(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_seconds=60)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "closed")
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "open")
+        self.assertFalse(breaker.allow())
+        self.assertGreater(breaker.retry_after(), 0)
+
+    def test_half_open_lets_one_probe_through(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0.01)
+        breaker.record_failure()
+        time.sleep(0.02)
+        self.assertEqual(breaker.state, "half_open")
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, "closed")
+
+    def test_failed_probe_reopens(self):
+        breaker = CircuitBreaker(failure_threshold=5, reset_seconds=0.01)
+        for _ in range(5):
+            breaker.record_failure()
+        time.sleep(0.02)
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "open")
+
+    def test_released_probe_can_be_taken_again(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0.01)
+        breaker.record_failure()
+        time.sleep(0.02)
+        self.assertTrue(breaker.allow())
+        breaker.release_probe()
+        self.assertTrue(breaker.allow())
+
+    def test_only_the_probing_thread_releases(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0.01)
+        breaker.record_failure()
+        time.sleep(0.02)
+        self.assertTrue(breaker.allow())
+        other = threading.Thread(target=breaker.release_probe)
+        other.start()
+        other.join()
+        self.assertFalse(breaker.allow())
+
+
+class RetryTest(unittest.TestCase):
+    def test_retries_transient_errors(self):
+        def handler(request, model, number):
+            return httpx.Response(503) if number == 1 else completion(model)
+
+        llm = provider(handler)
+        result = llm.complete(MESSAGES)
+        self.assertEqual(result.model, "primary")
+        self.assertEqual(llm.transport.count("primary"), 2)
+
+    def test_client_errors_are_not_retried(self):
+        llm = provider(lambda request, model, number: httpx.Response(400, text="bad request"))
+        with self.assertRaises(LLMError):
+            llm.complete(MESSAGES, models=["primary"])
+        self.assertEqual(llm.transport.count("primary"), 1)
+        self.assertEqual(llm._breaker("primary").state, "closed")
+
+    def test_honours_retry_after(self):
+        def handler(request, model, number):
+            if number == 1:
+                return httpx.Response(429, headers={"Retry-After": "0.1"})
+            return completion(model)
+
+        llm = provider(handler)
+        started = time.monotonic()
+        llm.complete(MESSAGES)
+        self.assertGreaterEqual(time.monotonic() - started, 0.1)
+
+
+class FallbackTest(unittest.TestCase):
+    def test_falls_back_when_the_primary_keeps_failing(self):
+        def handler(request, model, number):
+            return httpx.Response(503) if model == "primary" else completion(model)
+
+        llm = provider(handler)
+        self.assertEqual(llm.complete(MESSAGES).model, "fallback")
+        self.assertEqual(llm._breaker("primary").state, "open")
+        # With the circuit open the primary is skipped without a request.
+        before = llm.transport.count("primary")
+        self.assertEqual(llm.complete(MESSAGES).model, "fallback")
+        self.assertEqual(llm.transport.count("primary"), before)
+
+    def test_raises_when_every_model_fails(self):
+        llm = provider(lambda request, model, number: httpx.Response(503))
+        with self.assertRaises(LLMError) as raised:
+            llm.complete(MESSAGES)
+        self.assertEqual(raised.exception.retry_after, None)
+        with self.assertRaises(CircuitOpenError):
+            llm.complete(MESSAGES)
+
+    def test_probe_left_unused_by_the_deadline_is_released(self):
+        phase = {"primary": "fail", "fallback": "fail"}
+
+        def handler(request, model, number):
+            if phase[model] == "slow":
+                time.sleep(0.3)
+                raise httpx.ReadTimeout("slow", request=request)
+            if phase[model] == "fail":
+                return httpx.Response(503)
+            return completion(model)
+
+        llm = provider(handler, max_retries=0, breaker_failure_threshold=1)
+        with self.assertRaises(LLMError):
+            llm.complete(MESSAGES)  # opens both circuits
+        time.sleep(0.06)  # both half-open
+        phase.update(primary="slow", fallback="ok")
+        # The primary's probe uses up the deadline before the fallback is tried.
+        with self.assertRaises(LLMTimeoutError):
+            llm.complete(MESSAGES, timeout=0.2)
+        self.assertEqual(llm._breaker("fallback").state, "half_open")
+        # The healthy fallback can still be probed (and closes) on the next call.
+        self.assertEqual(llm.complete(MESSAGES).model, "fallback")
+        self.assertEqual(llm._breaker("fallback").state, "closed")
+
+
+class HedgeTest(unittest.TestCase):
+    def test_slow_request_is_hedged(self):
+        def handler(request, model, number):
+            if number == 1:
+                time.sleep(1.0)
+            return completion(model, f"call {number}")
+
+        llm = provider(handler, hedge_after=0.05)
+        started = time.monotonic()
+        result = llm.complete(MESSAGES, models=["primary"])
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertEqual(result.text, "call 2")
+        llm.close()
+
+    def test_fast_request_is_not_hedged(self):
+        llm = provider(lambda request, model, number: completion(model), hedge_after=0.5)
+        llm.complete(MESSAGES, models=["primary"])
+        self.assertEqual(llm.transport.count("primary"), 1)
+        llm.close()
+
+
+class StubServerTest(unittest.TestCase):
+    def test_fallback_against_the_stub(self):
+        server, base_url = start_stub_server(
+            config=StubConfig(latency_ms=5, jitter_ms=0, failing_models=("primary",))
+        )
+        try:
+            llm = LLMProvider(
+                base_url=base_url,
+                api_key="test",
+                models=["primary", "fallback"],
+                timeout=5.0,
+                max_retries=1,
+                backoff_base=0.001,
+                backoff_max=0.001,
+            )
+            result = llm.complete(MESSAGES)
+            self.assertEqual(result.model, "fallback")
+            self.assertTrue(result.text.startswith("you said: hello"))
+            llm.close()
+        finally:
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    unittest.main()